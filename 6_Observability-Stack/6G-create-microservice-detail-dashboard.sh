@@ -633,6 +633,59 @@ data:
             "showHeader": true,
             "sortBy": []
           }
+        },
+        {
+          "id": 14,
+          "title": "🐢 Event Loop - Lag (p99/max) and Blocking Calls",
+          "type": "timeseries",
+          "gridPos": {"h": 8, "w": 24, "x": 0, "y": 48},
+          "targets": [
+            {
+              "expr": "histogram_quantile(0.99, sum(rate(event_loop_lag_samples_seconds_bucket{namespace=\"\$namespace\", pod=~\"\$service.*\"}[5m])) by (le, pod))",
+              "refId": "A",
+              "legendFormat": "p99 lag - {{pod}}"
+            },
+            {
+              "expr": "max_over_time(event_loop_lag_seconds{namespace=\"\$namespace\", pod=~\"\$service.*\"}[5m])",
+              "refId": "B",
+              "legendFormat": "max lag - {{pod}}"
+            },
+            {
+              "expr": "sum(increase(event_loop_blocked_total{namespace=\"\$namespace\", pod=~\"\$service.*\"}[5m])) by (route)",
+              "refId": "C",
+              "legendFormat": "blocked - {{route}}"
+            }
+          ],
+          "datasource": {"type": "prometheus", "uid": "$PROMETHEUS_UID"},
+          "fieldConfig": {
+            "defaults": {
+              "unit": "s",
+              "custom": {
+                "drawStyle": "line",
+                "lineInterpolation": "linear",
+                "fillOpacity": 5,
+                "showPoints": "never"
+              },
+              "color": {"mode": "palette-classic"}
+            },
+            "overrides": [
+              {
+                "matcher": {"id": "byRegexp", "options": "blocked - .*"},
+                "properties": [
+                  {"id": "unit", "value": "short"},
+                  {"id": "custom.axisPlacement", "value": "right"},
+                  {"id": "custom.drawStyle", "value": "bars"}
+                ]
+              }
+            ]
+          },
+          "options": {
+            "legend": {
+              "displayMode": "table",
+              "placement": "bottom",
+              "calcs": ["lastNotNull", "max"]
+            }
+          }
         }
       ]
     }
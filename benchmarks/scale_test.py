@@ -0,0 +1,178 @@
+"""Read path latency of the running services as seeded data grows
+
+Grows users and todos in --steps equal steps with seed_data.py's COPY
+loaders. After each step it times these routes against the running
+services, over HTTP:
+
+- GET /todos, the default full listing and a ?limit=50 page, for heavy and
+  for typical users;
+- GET /admin/todos, until the table passes --admin-max-todos;
+- POST /login, which is bcrypt-bound, so it shows the users lookup only
+  once the table is large;
+- GET /verify.
+
+Run the services against the databases being seeded. Raise their rate
+limit for a single client (RATE_LIMIT_PER_SECOND=100000
+RATE_LIMIT_BURST=100000). Access tokens are signed locally with SECRET_KEY
+(HS256), so every sample can act as a different user without paying
+for a login. The default listing is cached per user for TODO_CACHE_TTL;
+set it to 0 to time the database on every request.
+
+    USER_DATABASE_URL=postgresql://.../userdb \\
+    TODO_DATABASE_URL=postgresql://.../tododb \\
+        python benchmarks/scale_test.py --users 1000000 --todos 10000000 --steps 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import httpx
+from jose import jwt
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import seed_data  # noqa: E402
+
+
+def access_token(user_id: int, secret_key: str) -> str:
+    return jwt.encode(
+        {"sub": f"{seed_data.USERNAME_PREFIX}{user_id}", "user_id": user_id},
+        secret_key,
+        algorithm="HS256",
+    )
+
+
+def time_requests(client: httpx.Client, requests) -> tuple:
+    """(p50 ms, p95 ms, errors) over (method, url, kwargs) requests"""
+    timings, errors = [], 0
+    for method, url, kwargs in requests:
+        started = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code == 429:
+            sys.exit(f"{url} was rate limited; raise the services' RATE_LIMIT_*")
+        if response.status_code >= 400:
+            errors += 1
+    timings.sort()
+    return (
+        statistics.median(timings),
+        timings[max(int(len(timings) * 0.95) - 1, 0)],
+        errors,
+    )
+
+
+def scenarios(args, users: int, todos: int, rng: random.Random) -> dict:
+    """Route name -> requests to time at the current data size"""
+    first = args.first_user_id
+    heavy = range(first, first + min(args.heavy_users, users))
+    typical = range(first + len(heavy), first + users) or heavy
+
+    def bearer(user_id):
+        return {"Authorization": f"Bearer {access_token(user_id, args.secret_key)}"}
+
+    def credentials(user_id):
+        username = f"{seed_data.USERNAME_PREFIX}{user_id}"
+        return {"username": username, "password": args.password}
+
+    def todos_as(user_ids, path, samples):
+        return [
+            ("GET", f"{args.todo_url}{path}", {"headers": bearer(rng.choice(user_ids))})
+            for _ in range(samples)
+        ]
+
+    cases = {
+        "todos heavy": todos_as(heavy, "/todos", args.heavy_samples),
+        "todos typical": todos_as(typical, "/todos", args.samples),
+        "page heavy": todos_as(heavy, "/todos?limit=50", args.samples),
+        "page typical": todos_as(typical, "/todos?limit=50", args.samples),
+    }
+    if todos <= args.admin_max_todos:
+        cases["admin todos"] = todos_as(heavy, "/admin/todos", args.admin_samples)
+    cases["login"] = [
+        ("POST", f"{args.user_url}/login", {"json": credentials(rng.choice(typical))})
+        for _ in range(args.login_samples)
+    ]
+    cases["verify"] = [
+        ("GET", f"{args.user_url}/verify", {"headers": bearer(rng.choice(typical))})
+        for _ in range(args.samples)
+    ]
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    seed_data.add_distribution_arguments(parser)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--todos", type=int, default=10_000_000)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--user-url", default="http://localhost:8001")
+    parser.add_argument("--todo-url", default="http://localhost:8002")
+    parser.add_argument(
+        "--secret-key",
+        default=os.getenv("SECRET_KEY", "your-secret-key-change-in-production"),
+    )
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--heavy-samples", type=int, default=10)
+    parser.add_argument("--login-samples", type=int, default=20)
+    parser.add_argument("--admin-samples", type=int, default=3)
+    parser.add_argument("--admin-max-todos", type=int, default=1_000_000)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+    if not args.user_dsn or not args.todo_dsn:
+        parser.error("set --user-dsn/USER_DATABASE_URL and --todo-dsn/...")
+
+    rng = random.Random(args.seed)
+    user_conn = seed_data.connect(args.user_dsn)
+    todo_conn = seed_data.connect(args.todo_dsn)
+    client = httpx.Client(timeout=args.timeout)
+    hashed_password = seed_data.password_hash(args.password)
+    span = seed_data.CREATED_SPAN / args.steps
+    start = datetime.utcnow() - seed_data.CREATED_SPAN
+
+    print(
+        f"{'users':>10} {'todos':>11} {'route':>14} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'errors':>7}"
+    )
+    users = todos = 0
+    try:
+        seed_data.drop_seeded(user_conn, todo_conn, args.first_user_id)
+        for step in range(1, args.steps + 1):
+            new_users = args.users * step // args.steps - users
+            new_todos = args.todos * step // args.steps - todos
+            seed_data.seed_users(
+                user_conn, args.first_user_id + users, new_users, hashed_password
+            )
+            users += new_users
+            # The distribution spans everyone seeded so far, so heavy users
+            # keep growing and reach about --heavy-todos at the last step
+            weights = seed_data.user_weights(
+                users, args.heavy_users, args.heavy_todos / args.todos, args.skew
+            )
+            seed_data.seed_todos(
+                todo_conn, args.first_user_id, weights, new_todos, rng, start, span
+            )
+            todos += new_todos
+            start += span
+
+            for route, requests in scenarios(args, users, todos, rng).items():
+                p50, p95, errors = time_requests(client, requests)
+                print(
+                    f"{users:>10} {todos:>11} {route:>14} "
+                    f"{p50:>9.2f} {p95:>9.2f} {errors:>7}"
+                )
+    finally:
+        client.close()
+        if not args.keep:
+            seed_data.drop_seeded(user_conn, todo_conn, args.first_user_id)
+        user_conn.close()
+        todo_conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Bulk-load tenant-sized user and todo volumes with COPY
+
+Seeds users into user-service's database and todos into todo-service's.
+Todos per user are skewed. The first --heavy-users users hold about
+--heavy-todos todos each (100k by default). Everyone else follows a
+Zipf-like distribution with exponent --skew, so a long tail of users owns
+a handful of todos. Rows are generated while COPY reads them, so millions
+of rows load at COPY speed and client memory stays flat. Todos are
+interleaved across users in created_at order, as real inserts would be.
+
+The schema must already exist, so start each service once first. Seeded
+users are named seed<id>, all with password --password, and their ids start
+at --first-user-id. --drop deletes them, their todos and their stats.
+While todos load, the stats trigger is off and todos is locked. The stats of
+seeded users are recounted in the same transaction, so point this at a
+scratch or staging database, not a live one.
+
+    USER_DATABASE_URL=postgresql://.../userdb \\
+    TODO_DATABASE_URL=postgresql://.../tododb \\
+        python benchmarks/seed_data.py --users 1000000 --todos 10000000
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+import psycopg2
+from passlib.context import CryptContext
+
+USERNAME_PREFIX = "seed"
+TITLES = ["Buy milk", "Call mom", "Pay rent", "Standup notes", "Review PR"]
+# COPY reads this much generated text per round trip
+COPY_READ_SIZE = 1 << 20
+# created_at of seeded todos spreads over this window, ending now
+CREATED_SPAN = timedelta(days=365)
+
+
+class CopySource:
+    """File-like COPY input that renders lines from an iterator on demand"""
+
+    def __init__(self, lines: Iterator[str], lines_per_fill: int = 5000):
+        self.lines = iter(lines)
+        self.lines_per_fill = lines_per_fill
+        self.buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            chunk = "".join(itertools.islice(self.lines, self.lines_per_fill))
+            if not chunk:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def add_distribution_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--user-dsn", default=os.getenv("USER_DATABASE_URL"))
+    parser.add_argument("--todo-dsn", default=os.getenv("TODO_DATABASE_URL"))
+    parser.add_argument("--first-user-id", type=int, default=1_000_001)
+    parser.add_argument("--heavy-users", type=int, default=5)
+    parser.add_argument("--heavy-todos", type=int, default=100_000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--password", default="seed-password")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def password_hash(password: str) -> str:
+    """One bcrypt hash, the same scheme as user-service, shared by all users"""
+    return CryptContext(schemes=["bcrypt"], deprecated="auto").hash(password)
+
+
+def user_weights(
+    users: int, heavy_users: int, heavy_share: float, skew: float
+) -> List[float]:
+    """Cumulative weights over user ranks 0..users-1
+
+    Ranks below heavy_users each get heavy_share of all todos. The rest
+    share what is left, with rank r weighted 1 / r**skew.
+    """
+    heavy_users = min(heavy_users, users)
+    heavy_share = min(heavy_share, 1 / heavy_users) if heavy_users else 0.0
+    tail = [1 / rank**skew for rank in range(1, users - heavy_users + 1)]
+    tail_total = sum(tail) or 1.0
+    tail_share = 1 - heavy_share * heavy_users
+    weights = [heavy_share] * heavy_users + [
+        weight / tail_total * tail_share for weight in tail
+    ]
+    return list(itertools.accumulate(weights))
+
+
+def user_lines(first_id: int, count: int, hashed_password: str) -> Iterator[str]:
+    for user_id in range(first_id, first_id + count):
+        username = f"{USERNAME_PREFIX}{user_id}"
+        yield f"{username}\t{username}@example.com\t{hashed_password}\t{user_id}\n"
+
+
+def todo_lines(
+    first_user_id: int,
+    cum_weights: List[float],
+    count: int,
+    rng: random.Random,
+    start: datetime,
+    span: timedelta,
+) -> Iterator[str]:
+    """count todos with owners drawn from cum_weights, created evenly over
+    start..start+span, oldest first"""
+    total = cum_weights[-1]
+    last = len(cum_weights) - 1
+    step = span / max(count, 1)
+    for n in range(count):
+        rank = min(bisect.bisect(cum_weights, rng.random() * total), last)
+        title = f"{TITLES[n % len(TITLES)]} #{n}"
+        description = "\\N" if n % 4 else f"Seeded todo {n}"
+        completed = "t" if n % 3 == 0 else "f"
+        created_at = start + n * step
+        yield (
+            f"{title}\t{description}\t{completed}\t{first_user_id + rank}\t"
+            f"{created_at}\n"
+        )
+
+
+def seed_users(conn, first_id: int, count: int, hashed_password: str):
+    with conn.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY users (username, email, hashed_password, id) FROM STDIN",
+            CopySource(user_lines(first_id, count, hashed_password)),
+            size=COPY_READ_SIZE,
+        )
+        # Keep registrations clear of the explicit ids
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), "
+            "(SELECT max(id) FROM users))"
+        )
+    conn.commit()
+
+
+def seed_todos(
+    conn,
+    first_user_id: int,
+    cum_weights: List[float],
+    count: int,
+    rng: random.Random,
+    start: datetime,
+    span: timedelta = CREATED_SPAN,
+):
+    """COPY count todos, then recount todo_stats for the seeded users
+
+    The per-row stats trigger would turn every copied row into an upsert.
+    It is disabled for the load, and the counts are rebuilt with one
+    aggregate instead.
+    """
+    last_user_id = first_user_id + len(cum_weights) - 1
+    with conn.cursor() as cursor:
+        cursor.execute("ALTER TABLE todos DISABLE TRIGGER todo_stats_insert_delete")
+        cursor.copy_expert(
+            "COPY todos (title, description, completed, user_id, created_at) "
+            "FROM STDIN",
+            CopySource(todo_lines(first_user_id, cum_weights, count, rng, start, span)),
+            size=COPY_READ_SIZE,
+        )
+        cursor.execute("ALTER TABLE todos ENABLE TRIGGER todo_stats_insert_delete")
+        cursor.execute(
+            """
+            INSERT INTO todo_stats (user_id, total, completed)
+            SELECT user_id, count(*), count(*) FILTER (WHERE completed)
+            FROM todos
+            WHERE user_id BETWEEN %s AND %s AND deleted_at IS NULL
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET total = EXCLUDED.total, completed = EXCLUDED.completed
+        """,
+            (first_user_id, last_user_id),
+        )
+        cursor.execute("ANALYZE todos")
+    conn.commit()
+
+
+def drop_seeded(user_conn, todo_conn, first_user_id: int):
+    if todo_conn is not None:
+        with todo_conn.cursor() as cursor:
+            cursor.execute("ALTER TABLE todos DISABLE TRIGGER todo_stats_insert_delete")
+            cursor.execute("DELETE FROM todos WHERE user_id >= %s", (first_user_id,))
+            cursor.execute("ALTER TABLE todos ENABLE TRIGGER todo_stats_insert_delete")
+            cursor.execute(
+                "DELETE FROM todo_stats WHERE user_id >= %s", (first_user_id,)
+            )
+        todo_conn.commit()
+    if user_conn is not None:
+        with user_conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM users WHERE id >= %s AND username LIKE %s",
+                (first_user_id, USERNAME_PREFIX + "%"),
+            )
+        user_conn.commit()
+
+
+def connect(dsn):
+    return psycopg2.connect(dsn) if dsn else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_distribution_arguments(parser)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--todos", type=int, default=10_000_000)
+    parser.add_argument("--drop", action="store_true", help="only delete seeded rows")
+    args = parser.parse_args()
+    if not args.user_dsn and not args.todo_dsn:
+        parser.error("set --user-dsn/USER_DATABASE_URL and/or --todo-dsn/...")
+
+    user_conn, todo_conn = connect(args.user_dsn), connect(args.todo_dsn)
+    try:
+        drop_seeded(user_conn, todo_conn, args.first_user_id)
+        if args.drop:
+            return
+        if user_conn is not None:
+            started = time.perf_counter()
+            seed_users(
+                user_conn, args.first_user_id, args.users, password_hash(args.password)
+            )
+            elapsed = time.perf_counter() - started
+            print(f"{args.users} users in {elapsed:.1f}s")
+        if todo_conn is not None:
+            started = time.perf_counter()
+            weights = user_weights(
+                args.users, args.heavy_users, args.heavy_todos / args.todos, args.skew
+            )
+            seed_todos(
+                todo_conn,
+                args.first_user_id,
+                weights,
+                args.todos,
+                random.Random(args.seed),
+                datetime.utcnow() - CREATED_SPAN,
+            )
+            elapsed = time.perf_counter() - started
+            print(f"{args.todos} todos in {elapsed:.1f}s")
+    finally:
+        for conn in (user_conn, todo_conn):
+            if conn is not None:
+                conn.close()
+
+
+if __name__ == "__main__":
+    main()
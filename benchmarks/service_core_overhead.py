@@ -0,0 +1,138 @@
+"""Per-request cost of the shared request plumbing (service_core)
+
+Sends requests through a service's full ASGI stack in-process. The stack is
+admission control, deadlines, CORS, auth and a database checkout. Only the
+connection pool is faked: it hands out a connection whose cursor returns one
+canned row. The run therefore measures the plumbing around each query, not
+Postgres. Both services go through the same service_core code, so run it for
+each one. Compare the numbers before and after any change to service_core.
+
+Needs no database:
+
+    python benchmarks/service_core_overhead.py --service todo --requests 5000
+    python benchmarks/service_core_overhead.py --service user --requests 5000
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+# The rate limiter would otherwise reject most of the run
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "1000000")
+os.environ.setdefault("RATE_LIMIT_BURST", "1000000")
+
+import httpx  # noqa: E402
+from jose import jwt  # noqa: E402
+
+ROW = {
+    "id": 1,
+    "title": "Buy milk",
+    "description": None,
+    "completed": False,
+    "user_id": 1,
+    "created_at": "2024-01-01 12:00:00",
+    "username": "alice",
+    "email": "alice@example.com",
+}
+# Route per service that authenticates and runs one query
+ROUTES = {"todo": "/todos/1", "user": "/verify"}
+
+
+class FakeCursor:
+    def execute(self, query, vars=None):
+        pass
+
+    def fetchone(self):
+        return ROW
+
+    def fetchall(self):
+        return [ROW]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, cursor_factory=None):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    in_use = 0
+
+    def getconn(self):
+        return FakeConnection()
+
+    def putconn(self, conn):
+        pass
+
+
+def load_service(name: str):
+    """Import <name>-service/app.py as a fresh module"""
+    root = os.path.join(os.path.dirname(__file__), "..")
+    sys.path.insert(0, root)
+    sys.path.insert(0, os.path.join(root, f"{name}-service"))
+    return importlib.import_module("app")
+
+
+async def time_route(client, path: str, headers: dict, requests: int) -> float:
+    """Mean microseconds per sequential request"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = await client.get(path, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path}: {response.status_code} {response.text}")
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--service", choices=sorted(ROUTES), default="todo")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    service = load_service(args.service)
+    token = jwt.encode({"user_id": 1}, service.SECRET_KEY, algorithm=service.ALGORITHM)
+    cases = [
+        ("/health", {}),
+        (ROUTES[args.service], {"Authorization": f"Bearer {token}"}),
+    ]
+
+    transport = httpx.ASGITransport(app=service.app)
+    with patch.object(service.DATABASE, "get_pool", return_value=FakePool()):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            print(
+                f"{args.service}-service, {args.requests} requests, best of "
+                f"{args.repeat}"
+            )
+            print(f"{'route':<16} {'us/request':>12}")
+            for path, headers in cases:
+                await time_route(client, path, headers, min(args.requests, 500))
+                best = min(
+                    [
+                        await time_route(client, path, headers, args.requests)
+                        for _ in range(args.repeat)
+                    ]
+                )
+                print(f"{path:<16} {best:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""Per-user todo query latency as the table grows, plain vs hash-partitioned
+
+Loads the same synthetic rows into a plain and a partitioned copy of the
+todos schema (in a scratch schema, never the service's own tables), and
+after every load step times the per-user queries the todo-service runs.
+With partition pruning the partitioned latencies should stay flat while
+the row count grows past 10M.
+
+    DATABASE_URL=postgresql://... python benchmarks/todo_partitioning.py \\
+        --rows 10000000 --step 2000000 --users 100000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import psycopg2
+
+SCHEMA = "bench_partitioning"
+
+COLUMNS = """
+    id INTEGER NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    completed BOOLEAN DEFAULT FALSE,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    deleted_at TIMESTAMP
+"""
+
+# The GET /todos default listing and the GET /todos/{id} lookup
+QUERIES = {
+    "list": (
+        "SELECT id, title, description, completed, user_id, created_at "
+        "FROM {table} WHERE user_id = %s AND deleted_at IS NULL "
+        "ORDER BY created_at DESC LIMIT 50"
+    ),
+    "get": (
+        "SELECT id, title, description, completed, user_id, created_at "
+        "FROM {table} WHERE id = %s AND user_id = %s AND deleted_at IS NULL"
+    ),
+}
+
+
+def create_tables(cursor, partitions: int):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.todos_plain ({COLUMNS}, PRIMARY KEY (id))")
+    cursor.execute(
+        f"CREATE TABLE {SCHEMA}.todos_partitioned ({COLUMNS}, "
+        "PRIMARY KEY (user_id, id)) PARTITION BY HASH (user_id)"
+    )
+    for remainder in range(partitions):
+        cursor.execute(
+            f"CREATE TABLE {SCHEMA}.todos_p{remainder} "
+            f"PARTITION OF {SCHEMA}.todos_partitioned "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        )
+    for table in ("todos_plain", "todos_partitioned"):
+        cursor.execute(
+            f"CREATE INDEX ON {SCHEMA}.{table} (user_id, created_at DESC) "
+            "WHERE deleted_at IS NULL"
+        )
+
+
+def load(cursor, start: int, count: int, users: int):
+    """Insert ids start+1..start+count, spread uniformly over the users"""
+    for table in ("todos_plain", "todos_partitioned"):
+        cursor.execute(
+            f"""
+            INSERT INTO {SCHEMA}.{table} (id, title, completed, user_id, created_at)
+            SELECT g, 'todo ' || g, mod(g, 3) = 0, 1 + mod(g::bigint * 7919, %s),
+                   TIMESTAMP '2024-01-01' + g * INTERVAL '1 second'
+            FROM generate_series(%s, %s) AS g
+        """,
+            (users, start + 1, start + count),
+        )
+        cursor.execute(f"ANALYZE {SCHEMA}.{table}")
+
+
+def time_queries(cursor, table: str, rows: int, users: int, samples: int) -> dict:
+    results = {}
+    for name, template in QUERIES.items():
+        query = template.format(table=f"{SCHEMA}.{table}")
+        timings = []
+        for _ in range(samples):
+            todo_id = random.randint(1, rows)
+            user_id = 1 + (todo_id * 7919) % users
+            params = (user_id,) if name == "list" else (todo_id, user_id)
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = (
+            statistics.median(timings),
+            timings[int(len(timings) * 0.95) - 1],
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--step", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("set --dsn or DATABASE_URL")
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    create_tables(cursor, args.partitions)
+
+    print(f"{'rows':>12} {'table':>12} {'query':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    loaded = 0
+    try:
+        while loaded < args.rows:
+            count = min(args.step, args.rows - loaded)
+            load(cursor, loaded, count, args.users)
+            loaded += count
+            for table in ("todos_plain", "todos_partitioned"):
+                results = time_queries(cursor, table, loaded, args.users, args.samples)
+                for name, (p50, p95) in results.items():
+                    label = table.split("_")[1]
+                    print(f"{loaded:>12} {label:>12} {name:>6} {p50:>8.3f} {p95:>8.3f}")
+    finally:
+        if not args.keep:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Memory per cached todo row and listing serialization cost, by representation
+
+Compares the RealDictCursor row, a plain dict, the pydantic Todo model and
+the CompactTodo the list cache stores. Memory is measured with tracemalloc.
+It counts everything a row keeps alive, such as strings and datetimes,
+after the fetched rows are dropped. Serialization times turning a 100-row
+listing into JSON bytes.
+
+Needs no database:
+
+    python benchmarks/todo_row_memory.py --rows 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "todo-service"))
+
+import app as todo_app  # noqa: E402
+from psycopg2.extras import RealDictRow  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+TITLES = ["Buy milk", "Call mom", "Pay rent", "Standup notes", "Review PR"]
+
+
+def fetched_rows(count: int) -> List[dict]:
+    """Rows as psycopg2 would return them; strings are fresh objects per row,
+    like values decoded off the wire, with titles repeating across users"""
+    started = datetime(2024, 1, 1)
+    rows = []
+    for n in range(count):
+        title = random.choice(TITLES) if n % 3 else f"Todo number {n}"
+        rows.append(
+            {
+                "id": n,
+                "title": "".join(title),
+                "description": None if n % 4 else f"Details for todo {n}",
+                "completed": n % 5 == 0,
+                "user_id": n % 1000,
+                "created_at": started + timedelta(seconds=n),
+            }
+        )
+    return rows
+
+
+def as_real_dict_row(row: dict) -> RealDictRow:
+    real = RealDictRow()
+    real.update(row)
+    return real
+
+
+def as_model(row: dict) -> todo_app.Todo:
+    # What the handlers build today: created_at becomes a str
+    return todo_app.Todo(**{**row, "created_at": str(row["created_at"])})
+
+
+REPRESENTATIONS = {
+    "RealDictRow": as_real_dict_row,
+    "dict": dict,
+    "pydantic Todo": as_model,
+    "CompactTodo": todo_app.CompactTodo.from_row,
+}
+
+
+def bytes_per_row(convert, count: int) -> float:
+    """Memory retained per row once the fetched rows are converted and dropped"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    rows = fetched_rows(count)
+    converted = [convert(row) for row in rows]
+    del rows
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert len(converted) == count
+    return allocated / count
+
+
+def serialize_models(models) -> bytes:
+    adapter = TypeAdapter(List[todo_app.Todo])
+    return json.dumps(
+        adapter.dump_python(models, mode="json"),
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--listing", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    random.seed(42)
+    print(f"{'representation':>16} {'bytes/row':>10}")
+    for name, convert in REPRESENTATIONS.items():
+        print(f"{name:>16} {bytes_per_row(convert, args.rows):>10.0f}")
+
+    listing = fetched_rows(args.listing)
+    models = [as_model(row) for row in listing]
+    compact = [todo_app.CompactTodo.from_row(row) for row in listing]
+    assert json.loads(serialize_models(models)) == json.loads(
+        todo_app.todos_json(compact)
+    )
+    cases = {
+        "rows -> models -> JSON": lambda: serialize_models(
+            [as_model(row) for row in listing]
+        ),
+        "models -> JSON": lambda: serialize_models(models),
+        "CompactTodo -> JSON": lambda: todo_app.todos_json(compact),
+    }
+    print()
+    print(f"{'serialize ' + str(args.listing) + ' rows':>24} {'us/listing':>11}")
+    for name, fn in cases.items():
+        seconds = min(timeit.repeat(fn, number=args.repeat, repeat=3))
+        print(f"{name:>24} {seconds / args.repeat * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Todo creation throughput and latency with and without write batching
+
+Drives the todo-service's own insert path (insert_todo) against a real
+database. First it runs one commit per request, as the service does by
+default. Then it runs group commit (WriteBatcher) over a range of max
+delays. The table shows the trade: batching adds up to max_delay of
+latency per write, and in exchange saves a commit (an fsync) for every
+write that joins a batch.
+
+Point it at a scratch database. init_db() creates the schema, and rows
+written by the run are deleted at the end.
+
+    DATABASE_URL=postgresql://.../scratch python benchmarks/todo_write_batching.py \\
+        --requests 5000 --concurrency 1 16 64 256 --delays 0.001 0.005 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("DB_POOL_MAX_CONN", "20")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "todo-service"))
+
+import app as todo_app  # noqa: E402
+
+TITLE_PREFIX = "bench-write-batching "
+
+
+async def run(requests: int, concurrency: int, batcher) -> tuple:
+    """Return (writes per second, p50 ms, p99 ms)"""
+    todo_app.WRITE_BATCHING_ENABLED = batcher is not None
+    if batcher is not None:
+        todo_app.TODO_WRITE_BATCHER = batcher
+    latencies = []
+    numbers = iter(range(requests))
+
+    async def worker():
+        for n in numbers:
+            todo = todo_app.TodoCreate(title=f"{TITLE_PREFIX}{n}")
+            started = time.perf_counter()
+            await todo_app.insert_todo(todo, user_id=1 + n % 1000)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (
+        requests / elapsed,
+        statistics.median(latencies),
+        latencies[int(len(latencies) * 0.99) - 1],
+    )
+
+
+def cleanup():
+    with todo_app.DATABASE.checkout() as (conn, cursor):
+        cursor.execute("DELETE FROM todos WHERE title LIKE %s", (TITLE_PREFIX + "%",))
+        cursor.execute(
+            "DELETE FROM todo_outbox WHERE payload->'todo'->>'title' LIKE %s",
+            (TITLE_PREFIX + "%",),
+        )
+        conn.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--delays", type=float, nargs="+", default=[0.001, 0.005, 0.02])
+    parser.add_argument("--max-size", type=int, default=50)
+    args = parser.parse_args()
+    if not os.getenv("DATABASE_URL"):
+        parser.error("set DATABASE_URL to a scratch database")
+
+    todo_app.init_db()
+    modes = [("per-request", None)] + [
+        (f"batch {delay * 1000:g}ms", delay) for delay in args.delays
+    ]
+    print(f"{'mode':>14} {'conc':>5} {'writes/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    try:
+        for label, delay in modes:
+            for concurrency in args.concurrency:
+                batcher = (
+                    None
+                    if delay is None
+                    else todo_app.WriteBatcher(
+                        todo_app.insert_todo_batch, args.max_size, delay
+                    )
+                )
+                throughput, p50, p99 = await run(args.requests, concurrency, batcher)
+                print(
+                    f"{label:>14} {concurrency:>5} {throughput:>10.0f} "
+                    f"{p50:>8.2f} {p99:>8.2f}"
+                )
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
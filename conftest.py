@@ -0,0 +1,2 @@
+# Loading this file puts the repo root on sys.path, so the services' tests
+# import service_core the same way the images do (copied next to app.py).
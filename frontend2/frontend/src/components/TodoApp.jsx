@@ -26,6 +26,75 @@ const TodoApp = ({ user, token, onLogout }) => {
     }
   }, [token]);
 
+  // Live updates from other tabs and devices (Server-Sent Events). EventSource
+  // cannot send headers, so the stream is opened with a short-lived ticket
+  // rather than the access token, which would end up in proxy logs.
+  useEffect(() => {
+    if (!token) return undefined;
+
+    let source = null;
+    let retry = null;
+    let closed = false;
+    let reconnecting = false;
+
+    const applyChange = (event) => {
+      const change = JSON.parse(event.data);
+      if (change.event !== 'deleted' && !change.todo) {
+        fetchTodos();
+        return;
+      }
+      setTodos((current) => {
+        const others = current.filter((todo) => todo.id !== change.id);
+        if (change.event === 'deleted') return others;
+        if (change.event === 'created') return [change.todo, ...others];
+        return current.map((todo) => (todo.id === change.id ? change.todo : todo));
+      });
+    };
+
+    const connect = async () => {
+      try {
+        const response = await fetch(`${TODO_SERVICE_URL}/todos/stream/ticket`, {
+          method: 'POST',
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        if (!response.ok) throw new Error(`ticket request failed: ${response.status}`);
+        const { ticket } = await response.json();
+        if (closed) return;
+        source = new EventSource(
+          `${TODO_SERVICE_URL}/todos/stream?ticket=${encodeURIComponent(ticket)}`
+        );
+      } catch (error) {
+        console.error('Failed to open the todo stream:', error);
+        if (!closed) retry = setTimeout(connect, 5000);
+        return;
+      }
+      source.addEventListener('created', applyChange);
+      source.addEventListener('updated', applyChange);
+      source.addEventListener('deleted', applyChange);
+      source.addEventListener('resync', fetchTodos);
+      source.onopen = () => {
+        // Changes made while the stream was down were never delivered
+        if (reconnecting) fetchTodos();
+        reconnecting = false;
+      };
+      source.onerror = () => {
+        // The browser retries with the same URL, which fails once the ticket
+        // has expired; start over with a fresh ticket instead
+        reconnecting = true;
+        if (source.readyState === EventSource.CLOSED && !closed) {
+          retry = setTimeout(connect, 2000);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      if (source) source.close();
+    };
+  }, [token]);
+
   const createTodo = async () => {
     if (!newTodo.title.trim()) return;
     try {
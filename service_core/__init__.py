@@ -0,0 +1,115 @@
+"""Request plumbing shared by the todo and user services
+
+Database access (pool, replicas, health, circuit breaker), per-request
+deadlines, admission control, request coalescing, idempotency keys, audit
+logging, token helpers, tracing, metrics and profiling. Each service
+configures these from its own environment and keeps its handlers and domain
+logic to itself.
+"""
+
+from .admission import (
+    PRIORITY_CRITICAL,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    AdmissionControl,
+    AdmissionMiddleware,
+    ConcurrencyLimiter,
+    InMemoryRateLimitBackend,
+    LoadShedder,
+    SharedRateLimitBackend,
+    client_address,
+    client_identity,
+    create_rate_limit_backend,
+)
+from .audit import AuditLog
+from .auth import access_token_user_id, bearer_token
+from .coalescing import SingleFlight
+from .db import (
+    REQUEST_WRITE_PIN,
+    CircuitBreaker,
+    Database,
+    DatabaseHealth,
+    DatabasePool,
+    DatabaseUnavailable,
+    MonitoredCursor,
+    PoolExhausted,
+    ReadRouter,
+    ReadYourWritesMiddleware,
+    WritePin,
+    is_connection_error,
+)
+from .deadlines import (
+    REQUEST_CONNECTIONS,
+    REQUEST_DEADLINE,
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    cancel_queries,
+    deadline_response,
+)
+from .idempotency import (
+    IdempotencyStore,
+    InMemoryIdempotencyBackend,
+    PostgresIdempotencyBackend,
+    request_fingerprint,
+)
+from .observability import (
+    LoopWatchdog,
+    instrument_app,
+    monitor_event_loop_lag,
+    setup_tracing,
+)
+from .profiling import ContinuousProfiler, profile_stacks, route_of
+from .responses import add_exception_handlers, reject
+from .routes import parse_route_settings, route_template
+
+__all__ = [
+    "PRIORITY_CRITICAL",
+    "PRIORITY_LOW",
+    "PRIORITY_NORMAL",
+    "REQUEST_CONNECTIONS",
+    "REQUEST_DEADLINE",
+    "REQUEST_WRITE_PIN",
+    "AdmissionControl",
+    "AdmissionMiddleware",
+    "AuditLog",
+    "CircuitBreaker",
+    "ConcurrencyLimiter",
+    "ContinuousProfiler",
+    "Database",
+    "DatabaseHealth",
+    "DatabasePool",
+    "DatabaseUnavailable",
+    "DeadlineExceeded",
+    "DeadlineMiddleware",
+    "IdempotencyStore",
+    "InMemoryIdempotencyBackend",
+    "InMemoryRateLimitBackend",
+    "LoadShedder",
+    "LoopWatchdog",
+    "MonitoredCursor",
+    "PostgresIdempotencyBackend",
+    "PoolExhausted",
+    "ReadRouter",
+    "ReadYourWritesMiddleware",
+    "SharedRateLimitBackend",
+    "SingleFlight",
+    "WritePin",
+    "access_token_user_id",
+    "add_exception_handlers",
+    "bearer_token",
+    "cancel_queries",
+    "client_address",
+    "client_identity",
+    "create_rate_limit_backend",
+    "deadline_response",
+    "instrument_app",
+    "is_connection_error",
+    "monitor_event_loop_lag",
+    "parse_route_settings",
+    "profile_stacks",
+    "reject",
+    "request_fingerprint",
+    "route_of",
+    "route_template",
+    "setup_tracing",
+]
@@ -0,0 +1,327 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from jose import JWTError
+from prometheus_client import Counter, Gauge
+
+from .responses import reject
+from .routes import route_template
+
+
+def client_identity(
+    request: Request, decode: Callable[[str], dict], trusted_proxies: int = 0
+) -> str:
+    """Rate limit key: the token's user_id when valid, otherwise the client IP"""
+    authorization = request.headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        try:
+            payload = decode(authorization[7:])
+            if payload.get("user_id") is not None:
+                return f"user:{payload['user_id']}"
+        except JWTError:
+            pass
+    return f"ip:{client_address(request, trusted_proxies)}"
+
+
+def client_address(request: Request, trusted_proxies: int = 0) -> str:
+    """The caller's IP as seen by the outermost of `trusted_proxies` proxies
+
+    Each proxy appends the address it got the request from to
+    X-Forwarded-For, so only the last trusted_proxies hops are believed;
+    anything left of them was written by the client and could be rotated to
+    dodge per-IP limits. With no trusted proxies the header is ignored.
+    """
+    if trusted_proxies > 0:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(trusted_proxies, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+
+class InMemoryRateLimitBackend:
+    """Token bucket per key, held in process memory (limits are per pod)"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+
+    async def acquire(self, key: str) -> float:
+        """Take a token; return 0 when allowed, else seconds until one is free"""
+        return self.take(key)
+
+    def take(self, key: str) -> float:
+        """acquire() for synchronous callers"""
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        self._buckets[key] = bucket
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+
+class SharedRateLimitBackend:
+    """Fixed-window counters in Redis so the limit holds across all pods
+
+    Each key may spend `burst` requests per `burst / rate` seconds, which
+    matches the long-run rate of the in-memory token bucket.
+    """
+
+    def __init__(self, client, rate: float, burst: int, prefix: str = "ratelimit"):
+        self.client = client
+        self.burst = burst
+        self.window_ms = max(1, int(burst / rate * 1000))
+        self.prefix = prefix
+
+    async def acquire(self, key: str) -> float:
+        redis_key = f"{self.prefix}:{key}"
+        try:
+            count = await self.client.incr(redis_key)
+            if count == 1:
+                await self.client.pexpire(redis_key, self.window_ms)
+            if count <= self.burst:
+                return 0.0
+            ttl_ms = await self.client.pttl(redis_key)
+        except Exception:
+            # Fail open: a broken shared store must not take the service down
+            RATE_LIMIT_BACKEND_ERRORS.inc()
+            return 0.0
+        return (ttl_ms if ttl_ms > 0 else self.window_ms) / 1000
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests per route; excess requests queue for a while"""
+
+    def __init__(self, limits: dict, default_limit: int, queue_timeout: float):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.queue_timeout = queue_timeout
+        self._semaphores = {}
+
+    def _semaphore(self, route: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(route)
+        if semaphore is None:
+            limit = int(self.limits.get(route, self.default_limit))
+            semaphore = self._semaphores[route] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def acquire(self, route: str) -> bool:
+        try:
+            await asyncio.wait_for(self._semaphore(route).acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        ADMISSION_IN_FLIGHT.labels(route=route).inc()
+        return True
+
+    def release(self, route: str):
+        ADMISSION_IN_FLIGHT.labels(route=route).dec()
+        self._semaphores[route].release()
+
+
+def create_rate_limit_backend(redis_url: Optional[str], rate: float, burst: int):
+    if redis_url:
+        # Optional dependency, only needed for the shared backend
+        import redis.asyncio as redis_asyncio
+
+        return SharedRateLimitBackend(redis_asyncio.from_url(redis_url), rate, burst)
+    return InMemoryRateLimitBackend(rate, burst)
+
+
+# Load shedding
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class LoadShedder:
+    """CoDel-style overload detector fed by event-loop lag and DB query latency
+
+    A signal only counts as overloaded when its minimum over a whole interval
+    stays above target, i.e. there is a standing queue rather than a burst.
+    Level 1 sheds low priority routes; level 2 (minimum above twice the
+    target) sheds normal priority reads as well. Critical routes never shed.
+    """
+
+    def __init__(self, lag_target: float, db_target: float, interval: float):
+        self.lag_target = lag_target
+        self.db_target = db_target
+        self.interval = interval
+        self.level = 0
+        self.last_lag = 0.0
+        self._window_start = time.monotonic()
+        self._min_lag = math.inf
+        self._min_db_latency = math.inf
+
+    def record_lag(self, seconds: float):
+        self.last_lag = seconds
+        self._min_lag = min(self._min_lag, seconds)
+        self._maybe_evaluate()
+
+    def record_db_latency(self, seconds: float):
+        self._min_db_latency = min(self._min_db_latency, seconds)
+        self._maybe_evaluate()
+
+    def _maybe_evaluate(self):
+        now = time.monotonic()
+        if now - self._window_start < self.interval:
+            return
+        # Intervals without samples of a signal say nothing about that signal
+        pressure = max(
+            self._min_lag / self.lag_target if self._min_lag < math.inf else 0,
+            (
+                self._min_db_latency / self.db_target
+                if self._min_db_latency < math.inf
+                else 0
+            ),
+        )
+        self.level = 2 if pressure > 2 else 1 if pressure > 1 else 0
+        self._window_start = now
+        self._min_lag = math.inf
+        self._min_db_latency = math.inf
+
+    def should_shed(self, priority: int) -> bool:
+        return priority != PRIORITY_CRITICAL and self.level >= 3 - priority
+
+
+class AdmissionControl:
+    """Decides per request whether to shed, rate limit or queue it
+
+    Checks run cheapest first: load shedding by route priority, the rate
+    limit keyed by identify(request), then the per-route concurrency cap.
+    Writes and critical_routes are never shed; /admin routes and
+    listing_routes go first.
+    """
+
+    def __init__(
+        self,
+        rate_limiter,
+        concurrency_limiter: ConcurrencyLimiter,
+        shedder: LoadShedder,
+        identify: Callable[[Request], str],
+        critical_routes=frozenset(),
+        listing_routes=frozenset(),
+        exempt_paths=frozenset(),
+        enabled: bool = True,
+        shedding_enabled: bool = True,
+    ):
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.shedder = shedder
+        self.identify = identify
+        self.critical_routes = critical_routes
+        self.listing_routes = listing_routes
+        self.exempt_paths = exempt_paths
+        self.enabled = enabled
+        self.shedding_enabled = shedding_enabled
+        LOAD_SHEDDING_LEVEL.set_function(lambda: self.shedder.level)
+
+    def route_priority(self, method: str, route: str) -> int:
+        if route in self.critical_routes or method not in ("GET", "HEAD"):
+            return PRIORITY_CRITICAL
+        if route.startswith("/admin") or route in self.listing_routes:
+            return PRIORITY_LOW
+        return PRIORITY_NORMAL
+
+    async def admit(self, scope, route: str) -> Optional[JSONResponse]:
+        """None once admitted (release(route) when done), else the rejection"""
+        if self.shedding_enabled:
+            priority = self.route_priority(scope["method"], route)
+            if self.shedder.should_shed(priority):
+                LOAD_SHED_REQUESTS.labels(route=route, priority=str(priority)).inc()
+                return reject(503, "Service overloaded", self.shedder.interval)
+
+        retry_after = await self.rate_limiter.acquire(self.identify(Request(scope)))
+        if retry_after:
+            ADMISSION_REJECTIONS.labels(route=route, reason="rate_limited").inc()
+            return reject(429, "Too many requests", retry_after)
+
+        limiter = self.concurrency_limiter
+        if not await limiter.acquire(route):
+            ADMISSION_REJECTIONS.labels(route=route, reason="concurrency").inc()
+            return reject(503, "Too many concurrent requests", limiter.queue_timeout)
+        return None
+
+    def release(self, route: str):
+        self.concurrency_limiter.release(route)
+
+
+class AdmissionMiddleware:
+    """Runs AdmissionControl in front of the app as plain ASGI
+
+    The concurrency slot is held until the response starts, so a streaming
+    response does not keep a slot for as long as its client stays connected.
+    """
+
+    def __init__(self, app, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        control = self.control
+        if (
+            scope["type"] != "http"
+            or not control.enabled
+            or scope["path"] in control.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(scope)
+        rejection = await control.admit(scope, route)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+
+        held = True
+
+        def release():
+            nonlocal held
+            if held:
+                held = False
+                control.release(route)
+
+        async def send_releasing(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_releasing)
+        finally:
+            release()
+
+
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests rejected by admission control",
+    ["route", "reason"],
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight_requests", "Admitted requests in flight", ["route"]
+)
+RATE_LIMIT_BACKEND_ERRORS = Counter(
+    "rate_limit_backend_errors_total", "Shared rate limit store errors (failed open)"
+)
+LOAD_SHED_REQUESTS = Counter(
+    "load_shed_requests_total",
+    "Requests rejected by load shedding",
+    ["route", "priority"],
+)
+LOAD_SHEDDING_LEVEL = Gauge(
+    "load_shedding_level", "0 = admit all, 1 = shed low priority, 2 = shed reads"
+)
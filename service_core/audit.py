@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+import psycopg2.extras
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge, Histogram
+
+from .admission import InMemoryRateLimitBackend
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+SQL_CREATE_AUDIT_LOG = """
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id BIGSERIAL PRIMARY KEY,
+        occurred_at TIMESTAMP NOT NULL,
+        action VARCHAR(64) NOT NULL,
+        outcome VARCHAR(16) NOT NULL,
+        user_id INTEGER,
+        client VARCHAR(255),
+        detail JSONB NOT NULL DEFAULT '{}'
+    )
+"""
+SQL_INSERT_AUDIT_EVENTS = (
+    "INSERT INTO audit_log (occurred_at, action, outcome, user_id, client, detail) "
+    "VALUES %s"
+)
+
+
+class AuditLog:
+    """Audit trail written in batches off the request path
+
+    record() appends to a bounded in-process queue and never touches the
+    database, so a request pays microseconds for it. run() flushes the queue
+    with one multi-row INSERT per batch: every flush_interval, or as soon as
+    batch_size events are waiting. A failed batch goes back to the front of
+    the queue and is retried on the next flush.
+
+    When the queue is full, overflow picks what is lost: "drop_oldest" keeps
+    the newest events, "drop_newest" keeps the backlog. Each user (or client
+    address, for anonymous events) may record `rate` events per second with
+    bursts of `burst`. The excess is dropped and counted, so one caller
+    looping on a failing login cannot crowd everyone else out of the queue.
+    Events still queued when the process dies are lost, the price of keeping
+    the write off the request path.
+    """
+
+    def __init__(
+        self,
+        database,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow: str = "drop_oldest",
+        rate: float = 5,
+        burst: int = 20,
+        enabled: bool = True,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.database = database
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.enabled = enabled
+        self.limiter = InMemoryRateLimitBackend(rate, burst)
+        # (occurred_at, action, outcome, user_id, client, detail)
+        self._queue = deque()
+        # record() runs on the event loop, flush_once() in the threadpool
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        AUDIT_QUEUE_DEPTH.set_function(lambda: len(self._queue))
+
+    def create_table(self, cursor):  # pragma: no cover
+        cursor.execute(SQL_CREATE_AUDIT_LOG)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audit_log_occurred_at "
+            "ON audit_log (occurred_at)"
+        )
+
+    def record(
+        self,
+        action: str,
+        outcome: str = "success",
+        user_id: Optional[int] = None,
+        client: Optional[str] = None,
+        **detail,
+    ) -> bool:
+        """Queue an event; False when rate limiting or overflow dropped it"""
+        if not self.enabled:
+            return False
+        key = f"user:{user_id}" if user_id is not None else f"ip:{client}"
+        if self.limiter.take(key):
+            AUDIT_EVENTS.labels(action=action, result="rate_limited").inc()
+            return False
+        event = (datetime.utcnow(), action, outcome, user_id, client, detail)
+        with self._lock:
+            full = len(self._queue) >= self.max_queue
+            if full and self.overflow == "drop_newest":
+                dropped = event
+            else:
+                dropped = self._queue.popleft() if full else None
+                self._queue.append(event)
+            queued = len(self._queue)
+        if dropped is not None:
+            AUDIT_EVENTS.labels(action=dropped[1], result="overflow").inc()
+        if dropped is event:
+            return False
+        AUDIT_EVENTS.labels(action=action, result="queued").inc()
+        if queued >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def flush_once(self) -> int:
+        """Write up to batch_size queued events in one INSERT; returns how many"""
+        with self._lock:
+            count = min(self.batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(count)]
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            with self.database.checkout() as (conn, cursor):
+                try:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        SQL_INSERT_AUDIT_EVENTS,
+                        [(*event[:5], json.dumps(event[5])) for event in batch],
+                        page_size=len(batch),
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        except Exception:
+            AUDIT_FLUSH_FAILURES.inc()
+            self._requeue(batch)
+            raise
+        AUDIT_FLUSH_DURATION.observe(time.perf_counter() - started)
+        AUDIT_FLUSH_BATCH_SIZE.observe(len(batch))
+        AUDIT_EVENTS_WRITTEN.inc(len(batch))
+        return len(batch)
+
+    def _requeue(self, batch: list):
+        """Put a failed batch back in front of newer events, as far as it fits;
+        its oldest events are dropped first"""
+        with self._lock:
+            room = max(0, self.max_queue - len(self._queue))
+            kept = batch[len(batch) - room :] if room < len(batch) else batch
+            self._queue.extendleft(reversed(kept))
+        for event in batch[: len(batch) - len(kept)]:
+            AUDIT_EVENTS.labels(action=event[1], result="overflow").inc()
+
+    async def run(self):  # pragma: no cover
+        """Flush every flush_interval, or as soon as a batch is waiting"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await run_in_threadpool(self.flush_once) == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception(
+                    "audit flush failed, %d events queued", len(self._queue)
+                )
+
+    def drain(self):  # pragma: no cover
+        """Flush everything still queued, on shutdown"""
+        try:
+            while self.flush_once():
+                pass
+        except Exception:
+            logger.exception("%d audit events lost at shutdown", len(self._queue))
+
+
+AUDIT_EVENTS = Counter(
+    "audit_events_total",
+    "Audit events recorded, by action and result (queued, rate_limited, overflow)",
+    ["action", "result"],
+)
+AUDIT_EVENTS_WRITTEN = Counter(
+    "audit_events_written_total", "Audit events written to audit_log"
+)
+AUDIT_QUEUE_DEPTH = Gauge("audit_queue_depth", "Audit events waiting to be written")
+AUDIT_FLUSH_BATCH_SIZE = Histogram(
+    "audit_flush_batch_size",
+    "Audit events written per INSERT",
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000],
+)
+AUDIT_FLUSH_DURATION = Histogram(
+    "audit_flush_duration_seconds", "Time to write one batch of audit events"
+)
+AUDIT_FLUSH_FAILURES = Counter(
+    "audit_flush_failures_total", "Audit batches that failed and were requeued"
+)
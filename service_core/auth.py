@@ -0,0 +1,22 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def bearer_token(authorization: Optional[str]) -> str:
+    """The token of an "Authorization: Bearer <token>" header, else 401"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    return authorization.split(" ")[1]
+
+
+def access_token_user_id(payload: dict) -> int:
+    """The user_id of decoded access token claims, else 401
+
+    Refresh tokens are only good for /token/refresh; untyped tokens predate
+    the refresh flow and are access tokens.
+    """
+    user_id = payload.get("user_id")
+    if user_id is None or payload.get("type", "access") != "access":
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+
+from .deadlines import REQUEST_CONNECTIONS, REQUEST_DEADLINE, cancel_queries
+
+
+class Flight:
+    """One shared in-flight call and the callers still waiting on it"""
+
+    __slots__ = ("future", "connections", "waiters")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.connections = set()
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight call and its result
+
+    The wrapped function is blocking (psycopg2) and runs in the threadpool.
+    Shared results are handed to every caller, so callers must not mutate them.
+    The shared call is not tied to the leader's request: it runs until the
+    later of the leader's deadline and timeout seconds from its start, and
+    its queries are cancelled once every caller has stopped waiting.
+    """
+
+    def __init__(self, name: str, key_func, timeout: float):
+        self.name = name
+        self.key_func = key_func
+        self.timeout = timeout
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}
+        SINGLE_FLIGHT_RATIO.labels(group=name).set_function(self.coalescing_ratio)
+
+    def coalescing_ratio(self) -> float:
+        total = self.leaders + self.followers
+        return self.followers / total if total else 0.0
+
+    async def run(self, fn, *args):
+        key = self.key_func(*args)
+        flight = self._calls.get(key)
+        if flight is not None:
+            self.followers += 1
+            SINGLE_FLIGHT_CALLS.labels(group=self.name, role="follower").inc()
+            try:
+                return await self._wait(key, flight, self.timeout)
+            except asyncio.TimeoutError:
+                # The shared call is stuck, query on our own
+                return await run_in_threadpool(fn, *args)
+
+        self.leaders += 1
+        SINGLE_FLIGHT_CALLS.labels(group=self.name, role="leader").inc()
+        flight = Flight(asyncio.get_running_loop().create_future())
+        # Nobody may be waiting, so don't warn about unretrieved exceptions
+        flight.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = flight
+        deadline = max(REQUEST_DEADLINE.get() or 0, time.monotonic() + self.timeout)
+        call = asyncio.ensure_future(
+            run_in_threadpool(
+                self._shared_call, flight.connections, deadline, fn, *args
+            )
+        )
+        call.add_done_callback(lambda call: self._finish(key, flight, call))
+        return await self._wait(key, flight, None)
+
+    async def _wait(self, key, flight: Flight, timeout):
+        flight.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.future), timeout)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.future.done():
+                self._abandon(key, flight)
+
+    def _abandon(self, key, flight: Flight):
+        """Nobody waits on the shared call any more: cancel its queries"""
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        SINGLE_FLIGHT_ABANDONED.labels(group=self.name).inc()
+        if flight.connections:
+            asyncio.get_running_loop().run_in_executor(
+                None, cancel_queries, list(flight.connections)
+            )
+
+    def _finish(self, key, flight: Flight, call: asyncio.Future):
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        if call.cancelled():
+            flight.future.cancel()
+        elif call.exception() is not None:
+            flight.future.set_exception(call.exception())
+        else:
+            flight.future.set_result(call.result())
+
+    @staticmethod
+    def _shared_call(connections: set, deadline: float, fn, *args):
+        # Bounded and cancellable on its own, not through the leader's request
+        REQUEST_CONNECTIONS.set(connections)
+        REQUEST_DEADLINE.set(deadline)
+        return fn(*args)
+
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total",
+    "Coalesced read calls by role (leader queries, followers share)",
+    ["group", "role"],
+)
+SINGLE_FLIGHT_ABANDONED = Counter(
+    "single_flight_abandoned_total",
+    "Shared calls cancelled because every caller stopped waiting",
+    ["group"],
+)
+SINGLE_FLIGHT_RATIO = Gauge(
+    "single_flight_coalescing_ratio",
+    "Share of read calls served by another caller's in-flight query",
+    ["group"],
+)
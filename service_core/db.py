@@ -0,0 +1,776 @@
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras  # Import extras explicitly for RealDictCursor
+import psycopg2.pool
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from .deadlines import REQUEST_CONNECTIONS, REQUEST_DEADLINE, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseHealth:
+    """Cached database health, refreshed by the background readiness checker"""
+
+    def __init__(self, failure_threshold: int, error_window: int):
+        self.failure_threshold = failure_threshold
+        self.error_window = error_window
+        self.consecutive_failures = 0
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # One [second, queries, errors] bucket per second of the error window
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    def record_check(self, error: Optional[str] = None):
+        with self._lock:
+            if error is None:
+                self.consecutive_failures = 0
+                self.last_success = time.monotonic()
+                self.last_error = None
+            else:
+                self.consecutive_failures += 1
+                self.last_error = error
+
+    def record_query(self, failed: bool = False):
+        second = int(time.monotonic())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+                self._prune(second)
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            if failed:
+                bucket[2] += 1
+
+    def _prune(self, second: int):
+        while self._buckets and self._buckets[0][0] <= second - self.error_window:
+            self._buckets.popleft()
+
+    def error_rate(self) -> float:
+        with self._lock:
+            self._prune(int(time.monotonic()))
+            queries = sum(bucket[1] for bucket in self._buckets)
+            errors = sum(bucket[2] for bucket in self._buckets)
+        return errors / queries if queries else 0.0
+
+    @property
+    def ready(self) -> bool:
+        """Ready once a check has succeeded and failures are not sustained"""
+        return (
+            self.last_success is not None
+            and self.consecutive_failures < self.failure_threshold
+        )
+
+
+class DatabasePool(psycopg2.pool.ThreadedConnectionPool):
+    """Threaded connection pool that tracks how many connections are checked out
+
+    ThreadedConnectionPool raises PoolError the moment all maxconn
+    connections are out. Here getconn() waits up to timeout seconds for
+    one to come back, but never past the current request's deadline, then
+    raises PoolExhausted. Async handlers check out connections on the event
+    loop, where waiting would stall every other request, so there it raises
+    PoolExhausted at once instead.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout: float = 5, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self.in_use = 0
+        self._count_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        timeout = self.timeout
+        deadline = REQUEST_DEADLINE.get()
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        if on_event_loop():
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            acquired = self._slots.acquire(timeout=timeout)
+        if not acquired:
+            DB_POOL_TIMEOUTS.inc()
+            raise PoolExhausted(retry_after=1)
+        try:
+            conn = super().getconn(key)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._count_lock:
+            self.in_use += 1
+        return conn
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._slots.release()
+        with self._count_lock:
+            self.in_use -= 1
+
+
+def on_event_loop() -> bool:
+    """True when called from the thread running an asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class MonitoredCursor(psycopg2.extras.RealDictCursor):
+    """RealDictCursor that feeds query outcomes to readiness and load shedding
+
+    Each Database uses a subclass with `database` bound to itself.
+    """
+
+    database: "Database" = None
+
+    def execute(self, query, vars=None):
+        database = self.database
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except psycopg2.errors.QueryCanceled:
+            # A deadline or cancel hit this query; the database itself is fine
+            database.record_latency(time.perf_counter() - start)
+            raise
+        except psycopg2.Error as e:
+            database.health.record_query(failed=True)
+            if is_connection_error(e) and self.on_primary():
+                database.breaker.record_failure()
+            raise
+        database.record_latency(time.perf_counter() - start)
+        database.health.record_query()
+        if self.on_primary():
+            database.breaker.record_success()
+        return result
+
+    def on_primary(self) -> bool:
+        return id(self.connection) not in self.database.router.checked_out
+
+
+def is_connection_error(e: Exception) -> bool:
+    """Lost or refused connection, or a server shutting down. Errors with a
+    query-level SQLSTATE (deadlocks, timeouts) say nothing about whether the
+    database is up; psycopg2 raises those as OperationalError subclasses."""
+    return type(e) is psycopg2.OperationalError or isinstance(
+        e, SERVER_UNAVAILABLE_ERRORS
+    )
+
+
+SERVER_UNAVAILABLE_ERRORS = (
+    psycopg2.errors.AdminShutdown,
+    psycopg2.errors.CrashShutdown,
+    psycopg2.errors.CannotConnectNow,
+)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of connecting while the circuit breaker is open"""
+
+    message = "Database unavailable"
+
+    def __init__(self, retry_after: float):
+        super().__init__(self.message)
+        self.retry_after = retry_after
+
+
+class PoolExhausted(DatabaseUnavailable):
+    """Raised when no pooled connection is returned within the pool timeout"""
+
+    message = "Database connection pool exhausted"
+
+
+class CircuitBreaker:
+    """Fails database calls fast while the primary is down
+
+    Closed: calls go through, and failure_threshold consecutive connection
+    failures open the circuit. Open: calls raise DatabaseUnavailable at once
+    for reset_timeout seconds instead of blocking in connect(). Half-open:
+    one probe call goes through; its success closes the circuit and its
+    failure opens it again. A probe that never reports back is replaced
+    after reset_timeout.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self.opened_at + self.reset_timeout:
+                    DB_CIRCUIT_REJECTIONS.inc()
+                    raise DatabaseUnavailable(self.retry_after)
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if (
+                    self.probe_started is not None
+                    and now < self.probe_started + self.reset_timeout
+                ):
+                    DB_CIRCUIT_REJECTIONS.inc()
+                    raise DatabaseUnavailable(self.reset_timeout)
+                self.probe_started = now
+
+    def record_success(self):
+        if self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.failures = 0
+            # A call started before the circuit opened proves little; wait
+            # for the half-open probe
+            if self.state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        self.state = state
+        self.probe_started = None
+        DB_CIRCUIT_TRANSITIONS.labels(state=state).inc()
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the next probe may be let through"""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+
+# Read replica routing
+class WritePin:
+    """Read-your-writes state of one request (see ReadYourWritesMiddleware)"""
+
+    __slots__ = ("client_wrote_at", "wrote_at")
+
+    def __init__(self, client_wrote_at: Optional[float] = None):
+        self.client_wrote_at = client_wrote_at  # presented by the client
+        self.wrote_at: Optional[float] = None  # set when this request writes
+
+
+# Mutated rather than set, so writes made in the threadpool are seen
+REQUEST_WRITE_PIN = contextvars.ContextVar("request_write_pin", default=None)
+
+
+class ReadRouter:
+    """Sends read-only queries to replicas and keeps writes on the primary
+
+    Reads about an owner (a user_id) that was written to within
+    read_your_writes_window seconds stay on the primary, so a client always
+    sees its own mutations. The pod that took a write remembers it per owner.
+    The client carries it to other pods in a cookie (ReadYourWritesMiddleware),
+    and any read it makes within the window also goes to the primary.
+    Replicas lagging more than max_lag seconds are skipped until they catch
+    up.
+    """
+
+    def __init__(
+        self,
+        replica_urls: List[str],
+        read_your_writes_window: float,
+        max_lag: float,
+        pool_factory,
+        max_tracked_owners: int = 10000,
+    ):
+        self.replica_urls = replica_urls
+        self.read_your_writes_window = read_your_writes_window
+        self.max_lag = max_lag
+        self.pool_factory = pool_factory
+        self.max_tracked_owners = max_tracked_owners
+        self.lag = {index: 0.0 for index in range(len(replica_urls))}
+        self.checked_out = {}  # id(conn) -> pool the connection belongs to
+        self._pools = {}
+        self._recent_writes = OrderedDict()  # owner -> monotonic write time
+        self._lock = threading.Lock()
+        self._next = 0
+        for index in self.lag:
+            DB_REPLICA_LAG.labels(replica=f"replica-{index}").set_function(
+                lambda index=index: self.lag[index]
+            )
+
+    def record_write(self, owner):
+        with self._lock:
+            self._recent_writes.pop(owner, None)
+            self._recent_writes[owner] = time.monotonic()
+            if len(self._recent_writes) > self.max_tracked_owners:
+                self._recent_writes.popitem(last=False)
+        pin = REQUEST_WRITE_PIN.get()
+        if pin is not None:
+            pin.wrote_at = time.time()
+
+    def wrote_recently(self, owner) -> bool:
+        written_at = self._recent_writes.get(owner)
+        return (
+            written_at is not None
+            and time.monotonic() - written_at < self.read_your_writes_window
+        )
+
+    def client_wrote_recently(self) -> bool:
+        """The current request presented a write from within the window"""
+        pin = REQUEST_WRITE_PIN.get()
+        if pin is None or pin.client_wrote_at is None:
+            return False
+        age = time.time() - pin.client_wrote_at
+        # Small negative ages are clock skew between pods; larger ones forged
+        return -1 < age < self.read_your_writes_window
+
+    def choose_replica(self, owner=None) -> Optional[int]:
+        """Pick a replica index for a read, or None to use the primary"""
+        if not self.replica_urls:
+            return None
+        if self.client_wrote_recently() or (
+            owner is not None and self.wrote_recently(owner)
+        ):
+            DB_READ_ROUTING.labels(target="primary", reason="read_your_writes").inc()
+            return None
+        healthy = [index for index, lag in self.lag.items() if lag <= self.max_lag]
+        if not healthy:
+            DB_READ_ROUTING.labels(target="primary", reason="replica_lag").inc()
+            return None
+        with self._lock:
+            self._next += 1
+            index = healthy[self._next % len(healthy)]
+        DB_READ_ROUTING.labels(target="replica", reason="read").inc()
+        return index
+
+    def pool(self, index: int):
+        with self._lock:
+            if index not in self._pools:
+                self._pools[index] = self.pool_factory(self.replica_urls[index])
+            return self._pools[index]
+
+    def getconn(self, index: int):
+        pool = self.pool(index)
+        conn = pool.getconn()
+        self.checked_out[id(conn)] = pool
+        return conn
+
+    def putconn(self, conn) -> bool:
+        """Return a replica connection to its pool; False for other connections"""
+        pool = self.checked_out.pop(id(conn), None)
+        if pool is None:
+            return False
+        pool.putconn(conn)
+        return True
+
+    def check_lag(self):
+        """Refresh the replication lag of every replica"""
+        for index in self.lag:
+            conn = None
+            try:
+                conn = self.getconn(index)
+                cursor = conn.cursor()
+                cursor.execute(SQL_REPLICA_LAG)
+                self.lag[index] = float(cursor.fetchone()["lag"] or 0)
+                cursor.close()
+            except Exception:
+                self.lag[index] = math.inf
+            finally:
+                if conn is not None:
+                    self.putconn(conn)
+
+    def closeall(self):
+        for pool in self._pools.values():
+            pool.closeall()
+
+
+class ReadYourWritesMiddleware:
+    """Carries read-your-writes pins across pods in a cookie
+
+    When a request writes, its response sets the last_write cookie and the
+    X-Last-Write header to the write's wall-clock time. A request that sends
+    either back within the database's read_your_writes_window reads from
+    the primary, whichever pod it lands on. Browsers return the cookie on
+    their own. Other clients echo the header. Does nothing without replicas.
+    """
+
+    COOKIE = "last_write"
+    HEADER = "x-last-write"
+
+    def __init__(self, app, database: "Database"):
+        self.app = app
+        self.database = database
+
+    async def __call__(self, scope, receive, send):
+        router = self.database.router
+        if scope["type"] != "http" or not router.replica_urls:
+            await self.app(scope, receive, send)
+            return
+        connection = HTTPConnection(scope)
+        presented = connection.headers.get(self.HEADER) or connection.cookies.get(
+            self.COOKIE
+        )
+        try:
+            pin = WritePin(float(presented) if presented else None)
+        except ValueError:
+            pin = WritePin()
+        token = REQUEST_WRITE_PIN.set(pin)
+
+        async def pinning_send(message):
+            if message["type"] == "http.response.start" and pin.wrote_at is not None:
+                value = f"{pin.wrote_at:.3f}"
+                headers = MutableHeaders(scope=message)
+                headers.append(self.HEADER, value)
+                headers.append(
+                    "set-cookie",
+                    f"{self.COOKIE}={value}; "
+                    f"Max-Age={math.ceil(router.read_your_writes_window)}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, pinning_send)
+        finally:
+            REQUEST_WRITE_PIN.reset(token)
+
+
+SQL_REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag
+"""
+
+
+def get_database_url():  # pragma: no cover
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable is required")
+    return database_url
+
+
+class Database:
+    """A service's PostgreSQL access: the primary pool, read replicas, cached
+    health, the circuit breaker and per-request deadlines
+
+    connect() and connect_read() check out a connection, and release()
+    returns either kind. Handlers use checkout(), which also opens and
+    closes the cursor.
+    """
+
+    def __init__(
+        self,
+        min_conn: int,
+        max_conn: int,
+        connect_timeout: int,
+        health: DatabaseHealth,
+        breaker: CircuitBreaker,
+        replica_urls: List[str] = (),
+        read_your_writes_window: float = 5,
+        replica_max_lag: float = 10,
+        shedder=None,
+        url_factory=get_database_url,
+        pool_timeout: float = 5,
+    ):
+        self.min_conn = min_conn
+        self.max_conn = max_conn
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self.health = health
+        self.breaker = breaker
+        self.shedder = shedder
+        self.url_factory = url_factory
+        self.pool: Optional[DatabasePool] = None
+        self._pool_lock = threading.Lock()
+        # Set while the schema initialization is failing; keeps /ready at 503
+        self.schema_error: Optional[str] = None
+        self.cursor_factory = type(
+            "MonitoredCursor", (MonitoredCursor,), {"database": self}
+        )
+        self.router = ReadRouter(
+            list(replica_urls),
+            read_your_writes_window,
+            replica_max_lag,
+            pool_factory=self.new_pool,
+        )
+        DB_POOL_IN_USE.set_function(lambda: self.pool.in_use if self.pool else 0)
+        DB_POOL_MAX.set(max_conn)
+        DB_READY.set_function(lambda: 1 if self.health.ready else 0)
+        DB_QUERY_ERROR_RATIO.set_function(lambda: self.health.error_rate())
+        DB_CIRCUIT_STATE.set_function(
+            lambda: ("closed", "half_open", "open").index(self.breaker.state)
+        )
+
+    def new_pool(self, url: str) -> DatabasePool:  # pragma: no cover
+        return DatabasePool(
+            self.min_conn,
+            self.max_conn,
+            url,
+            timeout=self.pool_timeout,
+            cursor_factory=self.cursor_factory,
+            connect_timeout=self.connect_timeout,
+        )
+
+    def get_pool(self) -> DatabasePool:  # pragma: no cover
+        """Return the primary connection pool, creating it on first use"""
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = self.new_pool(self.url_factory())
+        return self.pool
+
+    def record_latency(self, seconds: float):
+        if self.shedder is not None:
+            self.shedder.record_db_latency(seconds)
+
+    def connect(self):  # pragma: no cover
+        """Get a pooled connection to the primary"""
+        self.breaker.before_call()
+        try:
+            conn = self.get_pool().getconn()
+        except psycopg2.Error as e:
+            self.health.record_query(failed=True)
+            if is_connection_error(e):
+                self.breaker.record_failure()
+            raise
+        return self.bind_to_request(conn)
+
+    def connect_read(self, owner=None):
+        """Get a connection for a read-only query, from a replica when possible"""
+        index = self.router.choose_replica(owner)
+        if index is None:
+            return self.connect()
+        try:
+            return self.bind_to_request(self.router.getconn(index))
+        except (psycopg2.Error, PoolExhausted):
+            DB_READ_ROUTING.labels(target="primary", reason="replica_error").inc()
+            return self.connect()
+
+    def release(self, conn):
+        """Return a connection obtained from connect() or connect_read()"""
+        connections = REQUEST_CONNECTIONS.get()
+        if connections is not None:
+            connections.discard(conn)
+        if self.router.putconn(conn):
+            return
+        if self.pool is not None:
+            self.pool.putconn(conn)
+        else:
+            conn.close()
+
+    def checkout(self, read: bool = False, owner=None) -> "Checkout":
+        """with database.checkout() as (conn, cursor): ...
+
+        read=True routes through connect_read(owner). The cursor is closed
+        and the connection released on the way out; committing or rolling
+        back stays with the caller.
+        """
+        return Checkout(self, read, owner)
+
+    def bind_to_request(self, conn):
+        """Bound a freshly checked out connection by the current request's deadline
+
+        SET LOCAL lasts until the transaction ends, and the pool rolls back
+        connections returned mid-transaction, so the timeout never outlives
+        the request. Outside a request (background tasks) this does nothing.
+        """
+        deadline = REQUEST_DEADLINE.get()
+        if deadline is None:
+            return conn
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded()
+            cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            try:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = %s",
+                    (max(1, int(remaining * 1000)),),
+                )
+            finally:
+                cursor.close()
+        except Exception:
+            self.release(conn)
+            raise
+        connections = REQUEST_CONNECTIONS.get()
+        if connections is not None:
+            connections.add(conn)
+        return conn
+
+    def check(self):
+        """Run a trivial query and record the outcome in health"""
+        conn = None
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            self.health.record_check()
+        except Exception as e:
+            self.health.record_check(error=str(e))
+        finally:
+            if conn is not None:
+                self.release(conn)
+
+    async def run_health_checks(self, interval: float):  # pragma: no cover
+        """Refresh health every interval seconds"""
+        while True:
+            await run_in_threadpool(self.check)
+            await asyncio.sleep(interval)
+
+    def init_schema(self, init) -> bool:
+        """Run the blocking init(); on failure log it and report not ready"""
+        try:
+            init()
+        except Exception as e:
+            self.schema_error = str(e) or type(e).__name__
+            DB_SCHEMA_INIT_FAILURES.inc()
+            logger.exception("schema initialization failed")
+            return False
+        self.schema_error = None
+        return True
+
+    async def run_schema_init(self, init, interval: float):  # pragma: no cover
+        """Retry init() every interval seconds until it succeeds"""
+        while not await run_in_threadpool(self.init_schema, init):
+            await asyncio.sleep(interval)
+
+    async def run_replica_lag_checks(self, interval: float):  # pragma: no cover
+        while True:
+            await run_in_threadpool(self.router.check_lag)
+            await asyncio.sleep(interval)
+
+    def pool_stats(self) -> dict:
+        in_use = self.pool.in_use if self.pool else 0
+        return {
+            "in_use": in_use,
+            "max": self.max_conn,
+            "saturation": round(in_use / self.max_conn, 3),
+        }
+
+    def readiness(self, service: str) -> dict:
+        """The /ready body; 503 unless the schema is initialized, health is ready
+        and the circuit is not open"""
+        if self.schema_error is not None:
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "status": "not_ready",
+                    "service": service,
+                    "database": "schema_failed",
+                    "error": self.schema_error,
+                },
+            )
+        if not self.health.ready or self.breaker.state == CircuitBreaker.OPEN:
+            # Only sustained failures (or no successful check yet) take us out
+            # of rotation
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "status": "not_ready",
+                    "service": service,
+                    "database": "disconnected",
+                    "circuit": self.breaker.state,
+                    "error": self.health.last_error,
+                    "consecutive_failures": self.health.consecutive_failures,
+                },
+            )
+
+        return {
+            "status": "ready",
+            "service": service,
+            "database": "connected",
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.health.consecutive_failures,
+            "query_error_rate": round(self.health.error_rate(), 4),
+            "pool": self.pool_stats(),
+        }
+
+    def closeall(self):
+        if self.pool is not None:
+            self.pool.closeall()
+        self.router.closeall()
+
+
+class Checkout:
+    """Connection and cursor held for one with-block (see Database.checkout)"""
+
+    __slots__ = ("database", "read", "owner", "conn", "cursor")
+
+    def __init__(self, database: Database, read: bool, owner):
+        self.database = database
+        self.read = read
+        self.owner = owner
+
+    def __enter__(self):
+        database = self.database
+        conn = database.connect_read(self.owner) if self.read else database.connect()
+        try:
+            cursor = conn.cursor()
+        except BaseException:
+            database.release(conn)
+            raise
+        self.conn, self.cursor = conn, cursor
+        return conn, cursor
+
+    def __exit__(self, *exc_info):
+        try:
+            self.cursor.close()
+        finally:
+            self.database.release(self.conn)
+
+
+DB_CIRCUIT_STATE = Gauge(
+    "db_circuit_state", "Database circuit breaker: 0 closed, 1 half-open, 2 open"
+)
+DB_CIRCUIT_TRANSITIONS = Counter(
+    "db_circuit_transitions_total", "Circuit breaker state changes", ["state"]
+)
+DB_CIRCUIT_REJECTIONS = Counter(
+    "db_circuit_rejections_total", "Database calls failed fast by the open circuit"
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Database connections checked out of the pool"
+)
+DB_POOL_MAX = Gauge("db_pool_connections_max", "Maximum database pool size")
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Connection checkouts that gave up waiting for a free pooled connection",
+)
+DB_SCHEMA_INIT_FAILURES = Counter(
+    "db_schema_init_failures_total", "Failed schema initialization attempts"
+)
+DB_READY = Gauge("db_ready", "1 if the cached database health is ready")
+DB_QUERY_ERROR_RATIO = Gauge(
+    "db_query_error_ratio", "Share of failed database queries in the error window"
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds", "Replication lag per read replica", ["replica"]
+)
+DB_READ_ROUTING = Counter(
+    "db_read_routing_total", "Read query routing decisions", ["target", "reason"]
+)
@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import time
+from typing import Optional
+
+import psycopg2
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter
+
+from .routes import route_template
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before it could start another query"""
+
+
+# Absolute time.monotonic() deadline of the current request, if any
+REQUEST_DEADLINE = contextvars.ContextVar("request_deadline", default=None)
+# Connections the current request holds, cancelled if it is abandoned
+REQUEST_CONNECTIONS = contextvars.ContextVar("request_connections", default=None)
+
+
+def cancel_queries(connections):
+    """Cancel whatever the given connections are running (blocking, thread-safe)"""
+    for conn in list(connections):
+        try:
+            conn.cancel()
+        except psycopg2.Error:
+            pass
+
+
+class DeadlineMiddleware:
+    """Gives every request a deadline and stops work nobody is waiting for
+
+    Queries run with statement_timeout set to what is left of the deadline
+    (see Database.bind_to_request). A receive pump watches for the client
+    going away while the handler runs. When the client disconnects, or the
+    deadline passes while the handler is still busy, the handler is cancelled
+    and its running queries are cancelled in Postgres, which frees their
+    connections at once. A deadline answers 504 if the response has not
+    started yet.
+
+    deadlines maps route templates to seconds (0 = no deadline); routes not
+    in it get default_deadline. The dict is read on every request.
+    """
+
+    def __init__(
+        self, app, deadlines: Optional[dict] = None, default_deadline: float = 10
+    ):
+        self.app = app
+        self.deadlines = {} if deadlines is None else deadlines
+        self.default_deadline = default_deadline
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = route_template(scope)
+        timeout = self.deadlines.get(route, self.default_deadline)
+        if timeout <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        messages = asyncio.Queue()
+        response = {"started": False, "complete": False, "abandoned": False}
+
+        async def pump():
+            """Read ahead of the handler until the client disconnects"""
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def guarded_send(message):
+            if response["abandoned"]:
+                return
+            if message["type"] == "http.response.start":
+                response["started"] = True
+            elif not message.get("more_body", False):
+                response["complete"] = True
+            await send(message)
+
+        connections = set()
+        deadline_token = REQUEST_DEADLINE.set(time.monotonic() + timeout)
+        connections_token = REQUEST_CONNECTIONS.set(connections)
+        try:
+            # Tasks copy the context now, so the handler sees both variables
+            handler = asyncio.ensure_future(self.app(scope, messages.get, guarded_send))
+            disconnect = asyncio.ensure_future(pump())
+        finally:
+            REQUEST_DEADLINE.reset(deadline_token)
+            REQUEST_CONNECTIONS.reset(connections_token)
+
+        try:
+            await asyncio.wait(
+                {handler, disconnect},
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not handler.done() and response["complete"]:
+                # Nothing is waiting on a handler that already responded
+                await handler
+            if handler.done():
+                handler.result()
+                return
+
+            response["abandoned"] = True
+            if disconnect.done():
+                REQUEST_CLIENT_DISCONNECTS.labels(route=route).inc()
+            else:
+                if not response["started"]:
+                    await deadline_response(route, "deadline")(scope, receive, send)
+                else:
+                    REQUEST_TIMEOUTS.labels(route=route, reason="deadline").inc()
+            handler.cancel()
+            if connections:
+                await run_in_threadpool(cancel_queries, connections)
+            try:
+                await handler
+            except (asyncio.CancelledError, Exception):
+                pass
+        finally:
+            disconnect.cancel()
+
+
+def deadline_response(route: str, reason: str) -> JSONResponse:
+    REQUEST_TIMEOUTS.labels(route=route, reason=reason).inc()
+    return JSONResponse(
+        status_code=504, content={"detail": "Request deadline exceeded"}
+    )
+
+
+REQUEST_TIMEOUTS = Counter(
+    "request_timeouts_total",
+    "Requests answered or abandoned past their deadline (504)",
+    ["route", "reason"],
+)
+REQUEST_CLIENT_DISCONNECTS = Counter(
+    "request_client_disconnects_total",
+    "Requests abandoned because the client disconnected mid-handler",
+    ["route"],
+)
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter
+
+from .responses import reject
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryIdempotencyBackend:
+    """Idempotency keys in process memory, bounded in size (limits are per pod)
+
+    Only safe with a single replica; PostgresIdempotencyBackend is shared.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # (user_id, key) -> entry dict
+        self._lock = threading.Lock()
+
+    def claim(
+        self, user_id: int, key: str, fingerprint: str, ttl: float, lock_timeout: float
+    ) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and not claimable(entry, now):
+                return dict(entry)
+            self._entries.pop((user_id, key), None)
+            self._entries[(user_id, key)] = {
+                "fingerprint": fingerprint,
+                "status_code": None,
+                "body": None,
+                "locked_until": now + lock_timeout,
+                "expires_at": now + ttl,
+            }
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        return None
+
+    def complete(self, user_id: int, key: str, status_code: int, body):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None:
+                entry["status_code"], entry["body"] = status_code, body
+
+    def release(self, user_id: int, key: str):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and entry["status_code"] is None:
+                del self._entries[(user_id, key)]
+
+
+def claimable(entry: dict, now: float) -> bool:
+    """An expired entry, or a claim whose holder never finished in time"""
+    return entry["expires_at"] <= now or (
+        entry["status_code"] is None and entry["locked_until"] <= now
+    )
+
+
+SQL_CREATE_IDEMPOTENCY_KEYS = """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key VARCHAR(255) NOT NULL,
+        fingerprint CHAR(64) NOT NULL,
+        status_code SMALLINT,
+        body JSONB,
+        locked_until TIMESTAMPTZ NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (user_id, key)
+    )
+"""
+# Inserts a new claim or takes over a claimable row; no row back means a
+# live entry already holds the key
+SQL_CLAIM_IDEMPOTENCY_KEY = """
+    INSERT INTO idempotency_keys AS k
+        (user_id, key, fingerprint, locked_until, expires_at)
+    VALUES (
+        %(user_id)s, %(key)s, %(fingerprint)s,
+        now() + %(lock_timeout)s * interval '1 second',
+        now() + %(ttl)s * interval '1 second'
+    )
+    ON CONFLICT (user_id, key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint, status_code = NULL, body = NULL,
+        locked_until = EXCLUDED.locked_until, expires_at = EXCLUDED.expires_at
+    WHERE k.expires_at <= now()
+        OR (k.status_code IS NULL AND k.locked_until <= now())
+    RETURNING true AS claimed
+"""
+
+
+class PostgresIdempotencyBackend:
+    """Idempotency keys in an idempotency_keys table shared by every replica
+
+    The (user_id, key) primary key makes the claim atomic across pods.
+    Expired rows are deleted at most every purge_interval seconds.
+    """
+
+    def __init__(self, database, purge_interval: float = 3600):
+        self.database = database
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+
+    def create_table(self, cursor):  # pragma: no cover
+        cursor.execute(SQL_CREATE_IDEMPOTENCY_KEYS)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at "
+            "ON idempotency_keys (expires_at)"
+        )
+
+    def claim(
+        self, user_id: int, key: str, fingerprint: str, ttl: float, lock_timeout: float
+    ) -> Optional[dict]:
+        with self.database.checkout() as (conn, cursor):
+            try:
+                cursor.execute(
+                    SQL_CLAIM_IDEMPOTENCY_KEY,
+                    {
+                        "user_id": user_id,
+                        "key": key,
+                        "fingerprint": fingerprint,
+                        "lock_timeout": lock_timeout,
+                        "ttl": ttl,
+                    },
+                )
+                existing = None
+                if cursor.fetchone() is None:
+                    cursor.execute(
+                        "SELECT fingerprint, status_code, body FROM idempotency_keys "
+                        "WHERE user_id = %s AND key = %s",
+                        (user_id, key),
+                    )
+                    # Released since the claim failed: treat as still in flight
+                    existing = cursor.fetchone() or {
+                        "fingerprint": fingerprint,
+                        "status_code": None,
+                    }
+                now = time.monotonic()
+                if now >= self._next_purge:
+                    self._next_purge = now + self.purge_interval
+                    cursor.execute(
+                        "DELETE FROM idempotency_keys WHERE expires_at <= now()"
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return existing
+
+    def complete(self, user_id: int, key: str, status_code: int, body):
+        self._write(
+            "UPDATE idempotency_keys SET status_code = %s, body = %s "
+            "WHERE user_id = %s AND key = %s",
+            (status_code, json.dumps(body), user_id, key),
+        )
+
+    def release(self, user_id: int, key: str):
+        self._write(
+            "DELETE FROM idempotency_keys "
+            "WHERE user_id = %s AND key = %s AND status_code IS NULL",
+            (user_id, key),
+        )
+
+    def _write(self, query: str, params: tuple):
+        with self.database.checkout() as (conn, cursor):
+            try:
+                cursor.execute(query, params)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+class IdempotencyStore:
+    """Responses by Idempotency-Key, kept for a TTL
+
+    The first request with a key claims it, runs the handler and stores the
+    response. A retry with the same key and request, on whichever pod the
+    backend is shared with, replays the stored response without running
+    the handler. A claim is held for lock_timeout seconds. If its pod dies
+    before storing a response, a retry after that runs the handler again,
+    so lock_timeout should exceed the longest request deadline.
+    """
+
+    def __init__(self, backend, ttl: float, lock_timeout: float = 60):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    def create_table(self, cursor):  # pragma: no cover
+        self.backend.create_table(cursor)
+
+    async def run(self, key: str, fingerprint: str, handler, user_id: int = 0):
+        """Await handler() once per (user_id, key); retries get the stored
+        response"""
+        entry = await run_in_threadpool(
+            self.backend.claim, user_id, key, fingerprint, self.ttl, self.lock_timeout
+        )
+        if entry is not None:
+            if entry["fingerprint"] != fingerprint:
+                IDEMPOTENCY_REQUESTS.labels(outcome="mismatch").inc()
+                return JSONResponse(
+                    status_code=422,
+                    content={
+                        "detail": "Idempotency-Key reused for a different request"
+                    },
+                )
+            if entry["status_code"] is None:
+                IDEMPOTENCY_REQUESTS.labels(outcome="in_progress").inc()
+                return reject(409, "Request with this Idempotency-Key in progress", 1)
+            IDEMPOTENCY_REQUESTS.labels(outcome="replayed").inc()
+            return JSONResponse(
+                status_code=entry["status_code"],
+                content=entry["body"],
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        IDEMPOTENCY_REQUESTS.labels(outcome="new").inc()
+        try:
+            result = await handler()
+        except HTTPException as e:
+            # Client errors are final; anything else may succeed on retry
+            if 400 <= e.status_code < 500 and e.status_code != 429:
+                await self._settle(
+                    self.backend.complete,
+                    user_id,
+                    key,
+                    e.status_code,
+                    {"detail": e.detail},
+                )
+            else:
+                await self._settle(self.backend.release, user_id, key)
+            raise
+        except BaseException:
+            await self._settle(self.backend.release, user_id, key)
+            raise
+        await self._settle(
+            self.backend.complete, user_id, key, 200, jsonable_encoder(result)
+        )
+        return result
+
+    async def _settle(self, method, *args):
+        """Record the outcome; on failure the claim simply runs out"""
+        try:
+            await run_in_threadpool(method, *args)
+        except Exception:
+            IDEMPOTENCY_STORE_ERRORS.inc()
+            logger.exception("could not record the Idempotency-Key outcome")
+
+
+def request_fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+IDEMPOTENCY_REQUESTS = Counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key", ["outcome"]
+)
+IDEMPOTENCY_STORE_ERRORS = Counter(
+    "idempotency_store_errors_total",
+    "Idempotency-Key outcomes that could not be recorded",
+)
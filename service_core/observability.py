@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_fastapi_instrumentator import Instrumentator
+
+from .profiling import route_of
+
+logger = logging.getLogger(__name__)
+
+
+def setup_tracing(service_name: str):
+    """Export spans over OTLP and trace psycopg2; call before any DB connection
+
+    OTEL_SERVICE_NAME overrides service_name.
+    """
+    resource = Resource.create(
+        {"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}
+    )
+    trace.set_tracer_provider(TracerProvider(resource=resource))
+    trace.get_tracer_provider().add_span_processor(
+        BatchSpanProcessor(OTLPSpanExporter())
+    )
+    Psycopg2Instrumentor().instrument()
+
+
+def instrument_app(app, instrumentator: Optional[Instrumentator] = None):
+    """Trace every request and expose Prometheus metrics on /metrics"""
+    FastAPIInstrumentor.instrument_app(app)
+    (instrumentator or Instrumentator()).instrument(app).expose(app)
+
+
+async def monitor_event_loop_lag(
+    shedder, watchdog, interval: float
+):  # pragma: no cover
+    """Measure how late the loop wakes us up and feed it to the load shedder"""
+    loop = asyncio.get_running_loop()
+    while True:
+        watchdog.beat()
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        shedder.record_lag(lag)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_SAMPLES.observe(lag)
+
+
+class LoopWatchdog:
+    """Reports callbacks that block the event loop, with their stack and route
+
+    monitor_event_loop_lag beats from the loop every interval seconds. A
+    watchdog thread checks the beats, and once the loop is threshold seconds
+    overdue it captures the loop thread's stack. The stall is reported while
+    it is still happening, so the report shows the blocking call itself
+    rather than whatever runs after it. Each stall is reported once.
+    """
+
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop_thread: Optional[int] = None
+        self.due_at: Optional[float] = None
+        self.reported = False
+        self.last_report: Optional[tuple] = None  # (route, stack)
+        self._stop = threading.Event()
+
+    def beat(self):
+        self.loop_thread = threading.get_ident()
+        self.due_at = time.monotonic() + self.interval
+        self.reported = False
+
+    def check(self) -> Optional[str]:
+        """Report the current stall, if any; returns its route"""
+        due_at = self.due_at
+        if due_at is None or self.reported:
+            return None
+        overdue = time.monotonic() - due_at
+        frame = sys._current_frames().get(self.loop_thread)
+        if overdue < self.threshold or frame is None:
+            return None
+        self.reported = True
+        route = route_of(frame) or "none"
+        stack = "".join(traceback.format_stack(frame))
+        self.last_report = (route, stack)
+        EVENT_LOOP_BLOCKED.labels(route=route).inc()
+        logger.warning(
+            "Event loop blocked for over %.0f ms in route %s at:\n%s",
+            overdue * 1000,
+            route,
+            stack,
+        )
+        return route
+
+    def start(self):
+        threading.Thread(target=self._run, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):  # pragma: no cover
+        while not self._stop.wait(self.threshold / 2):
+            self.check()
+
+
+EVENT_LOOP_LAG = Gauge("event_loop_lag_seconds", "Most recent event loop lag sample")
+EVENT_LOOP_LAG_SAMPLES = Histogram(
+    "event_loop_lag_samples_seconds",
+    "Event loop lag, sampled every LOOP_LAG_SAMPLE_INTERVAL",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Event loop stalls longer than BLOCKING_THRESHOLD, by the route blocking it",
+    ["route"],
+)
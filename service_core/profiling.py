@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from prometheus_client import Counter
+from starlette.routing import Route
+
+IDLE_LEAVES = {("selectors.py", "select"), ("threading.py", "wait")}
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def folded_stack(frame, thread_name: str) -> str:
+    """One stack as "thread;outermost;...;innermost" (folded format)"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(f"thread {thread_name}")
+    return ";".join(reversed(labels))
+
+
+def is_idle(frame) -> bool:
+    """Parked in select() or a lock wait outside any request; the same wait
+    inside a handler blocks that request (and the loop) so it is kept"""
+    code = frame.f_code
+    leaf = (os.path.basename(code.co_filename), code.co_name)
+    return leaf in IDLE_LEAVES and route_of(frame) is None
+
+
+def route_of(frame) -> Optional[str]:
+    """Route template of the request a stack is serving, if any: the
+    Route.handle frame that dispatched to the endpoint holds the route"""
+    while frame is not None:
+        if frame.f_code is ROUTE_HANDLE_CODE:
+            route = frame.f_locals.get("self")
+            return getattr(route, "path", None)
+        frame = frame.f_back
+    return None
+
+
+def thread_stacks():
+    """(thread name, innermost frame) for every thread but the caller's"""
+    own = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident != own:
+            yield names.get(ident, str(ident)), frame
+
+
+def profile_stacks(seconds: float, hz: float, include_idle: bool = False) -> str:
+    """Sample every thread at hz for seconds, return folded stacks
+
+    The output (one "frame;frame;... count" line per distinct stack) feeds
+    flamegraph.pl, speedscope or inferno directly.
+    """
+    counts = {}
+    interval = 1 / hz
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_name, frame in thread_stacks():
+            if include_idle or not is_idle(frame):
+                stack = folded_stack(frame, thread_name)
+                counts[stack] = counts.get(stack, 0) + 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+class ContinuousProfiler:
+    """Low-rate background sampler that credits CPU time to routes
+
+    Runs in its own thread so it keeps sampling while the event loop is
+    blocked, which is when it matters. Each thread found running a route's
+    code adds 1/hz seconds to route_cpu_seconds_total for that route. A
+    sampler cannot tell CPU from blocking, so time a handler spends blocked
+    in psycopg2 or bcrypt on the loop is counted too. Work handed to the
+    threadpool runs outside the route's frames and is not credited.
+    """
+
+    def __init__(self, hz: float):
+        self.hz = hz
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="continuous-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sample(self):
+        for _, frame in thread_stacks():
+            route = route_of(frame)
+            if route is not None:
+                ROUTE_CPU_SECONDS.labels(route=route).inc(1 / self.hz)
+
+    def _run(self):  # pragma: no cover
+        while not self._stop.wait(1 / self.hz):
+            self.sample()
+
+
+ROUTE_HANDLE_CODE = Route.handle.__code__
+ROUTE_CPU_SECONDS = Counter(
+    "route_cpu_seconds_total",
+    "Sampled time threads spent running each route's code (CPU and blocking)",
+    ["route"],
+)
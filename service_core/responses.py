@@ -0,0 +1,37 @@
+import math
+
+import psycopg2.errors
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from .db import DatabaseUnavailable
+from .deadlines import DeadlineExceeded, deadline_response
+from .routes import route_template
+
+
+def reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def query_canceled_handler(request: Request, exc: Exception):
+    return deadline_response(route_template(request.scope), "statement_timeout")
+
+
+async def deadline_exceeded_handler(request: Request, exc: Exception):
+    return deadline_response(route_template(request.scope), "deadline")
+
+
+async def database_unavailable_handler(request: Request, exc: DatabaseUnavailable):
+    return reject(503, str(exc), exc.retry_after)
+
+
+def add_exception_handlers(app):
+    """504 for cancelled queries and spent deadlines, 503 while the circuit
+    breaker is open or no pooled connection frees up in time"""
+    app.add_exception_handler(psycopg2.errors.QueryCanceled, query_canceled_handler)
+    app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+    app.add_exception_handler(DatabaseUnavailable, database_unavailable_handler)
@@ -0,0 +1,29 @@
+from starlette.routing import Match
+
+# Resolved once per request and shared by every middleware that needs it
+ROUTE_SCOPE_KEY = "service_core.route"
+
+
+def parse_route_settings(value: str) -> dict:
+    """Parse "/route=value,/other=value" into {route: value}"""
+    settings = {}
+    for item in value.split(","):
+        if "=" in item:
+            route, setting = item.rsplit("=", 1)
+            settings[route.strip()] = float(setting)
+    return settings
+
+
+def route_template(scope) -> str:
+    """Resolve the route path template (e.g. /todos/{todo_id}) for a request"""
+    route_path = scope.get(ROUTE_SCOPE_KEY)
+    if route_path is None:
+        route_path = "unmatched"
+        app = scope.get("app")
+        for route in app.router.routes if app is not None else ():
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                route_path = route.path
+                break
+        scope[ROUTE_SCOPE_KEY] = route_path
+    return route_path
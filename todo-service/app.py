@@ -1,75 +1,92 @@
+import asyncio
+import json
+import logging
 import os
-from typing import List, Optional
+import random
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
 
+import httpx
 import psycopg2
-import psycopg2.extras  # Import extras explicitly for RealDictCursor
-
-# httpx removed - not used
-from fastapi import Depends, FastAPI, Header, HTTPException
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from jose import JWTError, jwt
-
-# OpenTelemetry SDK and Instrumentation
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from prometheus_client import Counter, Gauge, Histogram
 from prometheus_fastapi_instrumentator import Instrumentator, metrics
 from pydantic import BaseModel
 
-# Configure OpenTelemetry SDK
-resource = Resource.create(
-    {
-        "service.name": os.getenv("OTEL_SERVICE_NAME", "todo-service"),
-    }
+from service_core import (
+    REQUEST_CONNECTIONS,
+    REQUEST_DEADLINE,
+    AdmissionControl,
+    AdmissionMiddleware,
+    AuditLog,
+    CircuitBreaker,
+    ConcurrencyLimiter,
+    ContinuousProfiler,
+    Database,
+    DatabaseHealth,
+    DatabaseUnavailable,
+    DeadlineMiddleware,
+    IdempotencyStore,
+    LoadShedder,
+    LoopWatchdog,
+    PostgresIdempotencyBackend,
+    ReadYourWritesMiddleware,
+    SingleFlight,
+    access_token_user_id,
+    add_exception_handlers,
+    bearer_token,
+    client_address,
+    client_identity,
+    create_rate_limit_backend,
+    instrument_app,
+    monitor_event_loop_lag,
+    parse_route_settings,
+    profile_stacks,
+    request_fingerprint,
+    setup_tracing,
 )
-trace.set_tracer_provider(TracerProvider(resource=resource))
-otlp_exporter = OTLPSpanExporter()
-span_processor = BatchSpanProcessor(otlp_exporter)
-trace.get_tracer_provider().add_span_processor(span_processor)
 
-
-# Enable psycopg2 instrumentation BEFORE any db connections
-Psycopg2Instrumentor().instrument()
+# Tracing must be set up before any database connection is made
+setup_tracing("todo-service")
 
 app = FastAPI(title="Todo Service", version="1.0.0")
+logger = logging.getLogger("todo-service")
 
-
-# Enable FastAPI auto-instrumentation
-FastAPIInstrumentor.instrument_app(app)
-
-# Prometheus metrics instrumentation
-Instrumentator().add(metrics.requests()).add(  # Request counter (http_requests_total)
-    metrics.latency(  # Custom latency buckets
-        buckets=[
-            0.005,
-            0.01,
-            0.025,
-            0.05,
-            0.075,
-            0.1,
-            0.25,
-            0.5,
-            0.75,
-            1.0,
-            2.5,
-            5.0,
-            7.5,
-            10.0,
-        ]
-    )
-).instrument(app).expose(app)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify your frontend domain
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Prometheus metrics with latency buckets down to 5ms
+instrument_app(
+    app,
+    Instrumentator()
+    .add(metrics.requests())
+    .add(
+        metrics.latency(
+            buckets=[
+                0.005,
+                0.01,
+                0.025,
+                0.05,
+                0.075,
+                0.1,
+                0.25,
+                0.5,
+                0.75,
+                1.0,
+                2.5,
+                5.0,
+                7.5,
+                10.0,
+            ]
+        )
+    ),
 )
 
 # Security
@@ -77,8 +94,166 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:8001")
 
+# Service-to-service HTTP (pooled keep-alive client per upstream)
+SERVICE_HTTP_TIMEOUT = float(os.getenv("SERVICE_HTTP_TIMEOUT", "2"))
+SERVICE_HTTP_MAX_CONNECTIONS = int(os.getenv("SERVICE_HTTP_MAX_CONNECTIONS", "20"))
+# Below the upstream's idle timeout (uvicorn --timeout-keep-alive) so the
+# client never reuses a connection the server is about to close
+SERVICE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("SERVICE_HTTP_KEEPALIVE_EXPIRY", "60"))
+SERVICE_HTTP2 = os.getenv("SERVICE_HTTP2", "false") == "true"
+SERVICE_HTTP_RETRIES = int(os.getenv("SERVICE_HTTP_RETRIES", "2"))
+SERVICE_HTTP_BACKOFF = float(os.getenv("SERVICE_HTTP_BACKOFF", "0.05"))
+SERVICE_HTTP_BACKOFF_MAX = float(os.getenv("SERVICE_HTTP_BACKOFF_MAX", "1"))
+
+# User enrichment for admin lists (user-service batch lookups)
+USER_BATCH_MAX_IDS = int(os.getenv("USER_BATCH_MAX_IDS", "500"))
+
+# User existence checks on todo creation (answers cached for USER_EXISTS_TTL)
+USER_EXISTENCE_CHECK = os.getenv("USER_EXISTENCE_CHECK", "false") == "true"
+USER_EXISTS_TTL = float(os.getenv("USER_EXISTS_TTL", "60"))
+USER_EXISTS_MAX_ENTRIES = int(os.getenv("USER_EXISTS_MAX_ENTRIES", "10000"))
+
+# Token verification keys (user-service JWKS; tokens without a kid are HS256)
+JWKS_URL = os.getenv("JWKS_URL", "")
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", "300"))
+JWKS_MIN_REFETCH_INTERVAL = float(os.getenv("JWKS_MIN_REFETCH_INTERVAL", "30"))
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "true") == "true"
+
+# Database pool and readiness
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "2"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "10"))
+# Seconds a request waits for a free pooled connection before a 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+READINESS_CHECK_INTERVAL = float(os.getenv("READINESS_CHECK_INTERVAL", "5"))
+# A failed schema initialization is retried this often; /ready is 503 meanwhile
+SCHEMA_INIT_RETRY_INTERVAL = float(os.getenv("SCHEMA_INIT_RETRY_INTERVAL", "10"))
+READINESS_FAILURE_THRESHOLD = int(os.getenv("READINESS_FAILURE_THRESHOLD", "3"))
+READINESS_ERROR_WINDOW = int(os.getenv("READINESS_ERROR_WINDOW", "60"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+
+# Database circuit breaker
+DB_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", "5"))
+DB_BREAKER_RESET_TIMEOUT = float(os.getenv("DB_BREAKER_RESET_TIMEOUT", "10"))
+
+# Read replicas (comma-separated DATABASE_READ_URL, empty = primary only)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "10"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "5"))
+
+# Admission control
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true") == "true"
+ADMISSION_EXEMPT_PATHS = {"/health", "/ready", "/metrics"}
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Proxies in front of the service that append to X-Forwarded-For (the
+# ingress counts as one); 0 keys anonymous callers by the peer address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+ROUTE_CONCURRENCY_LIMITS = os.getenv("ROUTE_CONCURRENCY_LIMITS", "/admin/todos=2")
+DEFAULT_CONCURRENCY_LIMIT = int(os.getenv("DEFAULT_CONCURRENCY_LIMIT", "64"))
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "2"))
+
+# Load shedding
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "true") == "true"
+SHED_LOOP_LAG_TARGET = float(os.getenv("SHED_LOOP_LAG_TARGET", "0.05"))
+SHED_DB_LATENCY_TARGET = float(os.getenv("SHED_DB_LATENCY_TARGET", "0.1"))
+SHED_INTERVAL = float(os.getenv("SHED_INTERVAL", "1"))
+LOOP_LAG_SAMPLE_INTERVAL = float(os.getenv("LOOP_LAG_SAMPLE_INTERVAL", "0.1"))
+# Loop stalls longer than this are reported with the blocking stack (0 = off)
+BLOCKING_THRESHOLD = float(os.getenv("BLOCKING_THRESHOLD", "0.25"))
+CRITICAL_ROUTES = {"/health", "/ready", "/metrics"}
+LISTING_ROUTES = {"/todos"}
+
+# Request deadlines (seconds per route template, 0 = no deadline)
+ROUTE_DEADLINES = os.getenv(
+    "ROUTE_DEADLINES", "/admin/todos=15,/todos/stream=0,/admin/profile=0"
+)
+DEFAULT_DEADLINE = float(os.getenv("DEFAULT_DEADLINE", "10"))
+
+# Profiling (opt-in: /admin/profile needs PROFILING_ENABLED, 0 Hz = no sampling)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false") == "true"
+PROFILING_CONTINUOUS_HZ = float(os.getenv("PROFILING_CONTINUOUS_HZ", "0"))
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+
+# Request coalescing
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "5"))
+
+# Idempotency keys
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# A claim whose pod died is taken over after this; above the longest deadline
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+
+# Audit log (admin and auth events, written in batches off the request path)
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "true") == "true"
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop_oldest")  # or drop_newest
+AUDIT_RATE_PER_USER = float(os.getenv("AUDIT_RATE_PER_USER", "5"))
+AUDIT_BURST_PER_USER = int(os.getenv("AUDIT_BURST_PER_USER", "20"))
+
+# Todo list cache (default GET /todos listing per user, compact rows)
+TODO_CACHE_TTL = float(os.getenv("TODO_CACHE_TTL", "5"))
+TODO_CACHE_MAX_USERS = int(os.getenv("TODO_CACHE_MAX_USERS", "10000"))
+
+# Write batching (group commit for POST /todos)
+WRITE_BATCHING_ENABLED = os.getenv("WRITE_BATCHING_ENABLED", "false") == "true"
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "50"))
+WRITE_BATCH_MAX_DELAY = float(os.getenv("WRITE_BATCH_MAX_DELAY", "0.005"))
+
+# Change feed (Server-Sent Events fed by LISTEN/NOTIFY)
+CHANGE_FEED_CHANNEL = "todo_changes"
+CHANGE_FEED_BUFFER_SIZE = int(os.getenv("CHANGE_FEED_BUFFER_SIZE", "100"))
+CHANGE_FEED_MAX_SUBSCRIBERS = int(os.getenv("CHANGE_FEED_MAX_SUBSCRIBERS", "1000"))
+CHANGE_FEED_HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", "15"))
+CHANGE_FEED_RECONNECT_DELAY = float(os.getenv("CHANGE_FEED_RECONNECT_DELAY", "2"))
+CHANGE_FEED_RECONNECT_MAX_DELAY = float(
+    os.getenv("CHANGE_FEED_RECONNECT_MAX_DELAY", "60")
+)
+# EventSource cannot send headers, so /todos/stream takes a short-lived
+# ticket in the URL instead of the access token (shared by every pod)
+STREAM_TICKET_SECRET = os.getenv("STREAM_TICKET_SECRET", SECRET_KEY)
+STREAM_TICKET_TTL = int(os.getenv("STREAM_TICKET_TTL", "30"))
+NOTIFY_PAYLOAD_LIMIT = 7900  # Postgres caps NOTIFY payloads at 8000 bytes
+
+# Transactional outbox
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true") == "true"
+# none | webhook | memory | log; with none, no outbox rows are written
+OUTBOX_SINK = os.getenv("OUTBOX_SINK", "none")
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL", "")
+OUTBOX_WEBHOOK_TIMEOUT = float(os.getenv("OUTBOX_WEBHOOK_TIMEOUT", "5"))
+OUTBOX_BATCH_SIZE_LIMIT = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+
+# Partitioning (hash partitions by user_id; 0 keeps a plain table)
+TODO_PARTITIONS = int(os.getenv("TODO_PARTITIONS", "16"))
+TODO_PARTITION_MIGRATE = os.getenv("TODO_PARTITION_MIGRATE", "false") == "true"
+
+# Soft delete purge (windows are comma-separated UTC "HH:MM-HH:MM", empty = always)
+PURGE_ENABLED = os.getenv("PURGE_ENABLED", "true") == "true"
+PURGE_RETENTION = float(os.getenv("PURGE_RETENTION", "86400"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_BATCH_PAUSE = float(os.getenv("PURGE_BATCH_PAUSE", "0.5"))
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "300"))
+PURGE_WINDOWS = os.getenv("PURGE_WINDOWS", "01:00-05:00")
+
 # SQL Queries
-SQL_GET_TODO_BY_ID_AND_USER = "SELECT * FROM todos WHERE id = %s AND user_id = %s"
+# Explicit columns keep the search_vector column out of every response row
+TODO_COLUMNS = "id, title, description, completed, user_id, created_at"
+# Soft-deleted rows stay in the table until purged; live queries skip them
+LIVE_TODO = "deleted_at IS NULL"
+SQL_GET_TODO_BY_ID_AND_USER = (
+    f"SELECT {TODO_COLUMNS} FROM todos "
+    f"WHERE id = %s AND user_id = %s AND {LIVE_TODO}"
+)
+TODO_SEARCH_CONFIG = "simple"
+TODO_SORT_ORDERS = {
+    "created_at": "created_at ASC",
+    "-created_at": "created_at DESC",
+    "title": "title ASC",
+    "-title": "title DESC",
+}
 
 # Error messages
 ERROR_TODO_NOT_FOUND = "Todo not found"
@@ -95,6 +270,16 @@ class TodoUpdate(BaseModel):
     completed: Optional[bool] = None
 
 
+class TodoStats(BaseModel):
+    total: int
+    completed: int
+    pending: int
+
+
+class AdminTodoStats(TodoStats):
+    users: int
+
+
 class Todo(BaseModel):
     id: int
     title: str
@@ -104,59 +289,1439 @@ class Todo(BaseModel):
     created_at: str
 
 
+class AdminTodo(Todo):
+    username: Optional[str] = None
+
+
 # Database setup
-def get_db():  # pragma: no cover
-    """Get PostgreSQL database connection"""
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise ValueError("DATABASE_URL environment variable is required")
-    conn = psycopg2.connect(database_url, cursor_factory=psycopg2.extras.RealDictCursor)
-    return conn
+STALE_RESPONSE_HEADERS = {"Warning": '110 - "Response is Stale"'}
+
+LOAD_SHEDDER = LoadShedder(SHED_LOOP_LAG_TARGET, SHED_DB_LATENCY_TARGET, SHED_INTERVAL)
+DATABASE = Database(
+    DB_POOL_MIN_CONN,
+    DB_POOL_MAX_CONN,
+    DB_CONNECT_TIMEOUT,
+    health=DatabaseHealth(READINESS_FAILURE_THRESHOLD, READINESS_ERROR_WINDOW),
+    breaker=CircuitBreaker(DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_RESET_TIMEOUT),
+    replica_urls=[url.strip() for url in DATABASE_READ_URL.split(",") if url.strip()],
+    read_your_writes_window=READ_YOUR_WRITES_WINDOW,
+    replica_max_lag=REPLICA_MAX_LAG,
+    shedder=LOAD_SHEDDER,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+background_tasks: List[asyncio.Task] = []
 
 
 def init_db():  # pragma: no cover
     """Initialize database schema"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
+    with DATABASE.checkout() as (conn, cursor):
+        # Serialize schema changes when several replicas start at once
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('todo-service-schema'))")
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('todos')")
+        existing_table = cursor.fetchone()
+        if existing_table is None and TODO_PARTITIONS:
+            for statement in partitioned_todos_ddl(TODO_PARTITIONS):
+                cursor.execute(statement)
+        elif existing_table is None:
+            cursor.execute(
+                """
+                CREATE TABLE todos (
+                    id SERIAL PRIMARY KEY,
+                    title VARCHAR(255) NOT NULL,
+                    description TEXT,
+                    completed BOOLEAN DEFAULT FALSE,
+                    user_id INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """
+            )
+        elif existing_table["relkind"] == "r" and TODO_PARTITIONS:
+            if TODO_PARTITION_MIGRATE:
+                migrate_todos_to_partitioned(cursor)
+            else:
+                logger.warning(
+                    "todos is not partitioned; "
+                    "set TODO_PARTITION_MIGRATE=true to migrate"
+                )
+        # Full-text search over title and description, kept up to date by Postgres
+        cursor.execute(
+            f"""
+            ALTER TABLE todos ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                to_tsvector(
+                    '{TODO_SEARCH_CONFIG}'::regconfig,
+                    coalesce(title, '') || ' ' || coalesce(description, '')
+                )
+            ) STORED
+        """
+        )
+        cursor.execute(
+            "ALTER TABLE todos ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP"
+        )
+        # Indexes backing the GET /todos filters and sort orders. They are partial
+        # on live rows, so soft-deleted rows awaiting purge never bloat them.
+        for name, definition in (
+            ("idx_todos_user_created", "(user_id, created_at DESC)"),
+            (
+                "idx_todos_user_completed_created",
+                "(user_id, completed, created_at DESC)",
+            ),
+            ("idx_todos_user_title", "(user_id, title)"),
+            ("idx_todos_search", "USING GIN (search_vector)"),
+        ):
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = %s", (name,)
+            )
+            existing = cursor.fetchone()
+            if existing and LIVE_TODO not in existing["indexdef"]:
+                cursor.execute(f"DROP INDEX {name}")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON todos {definition} "
+                f"WHERE {LIVE_TODO}"
+            )
+        # Lets the purge worker find expired rows without scanning live ones
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_todos_deleted_at "
+            "ON todos (deleted_at) WHERE deleted_at IS NOT NULL"
+        )
+        init_todo_stats(cursor)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS todo_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                event_type VARCHAR(32) NOT NULL,
+                todo_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                payload JSONB NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
         """
-        CREATE TABLE IF NOT EXISTS todos (
-            id SERIAL PRIMARY KEY,
+        )
+        IDEMPOTENCY.create_table(cursor)
+        AUDIT.create_table(cursor)
+        conn.commit()
+
+
+def partitioned_todos_ddl(partitions: int) -> List[str]:
+    """Statements creating todos hash-partitioned by user_id
+
+    Every handler filters on user_id, so queries are pruned to one partition.
+    The primary key must contain the partition key; ids still come from the
+    shared todos_id_seq and stay unique across partitions.
+    """
+    statements = [
+        "CREATE SEQUENCE IF NOT EXISTS todos_id_seq AS integer",
+        """
+        CREATE TABLE todos (
+            id INTEGER NOT NULL DEFAULT nextval('todos_id_seq'),
             title VARCHAR(255) NOT NULL,
             description TEXT,
             completed BOOLEAN DEFAULT FALSE,
             user_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deleted_at TIMESTAMP,
+            PRIMARY KEY (user_id, id)
+        ) PARTITION BY HASH (user_id)
+        """,
+    ]
+    statements += [
+        f"CREATE TABLE todos_p{remainder} PARTITION OF todos "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+    statements.append("ALTER SEQUENCE todos_id_seq OWNED BY todos.id")
+    return statements
+
+
+def migrate_todos_to_partitioned(cursor):  # pragma: no cover
+    """Copy a plain todos table into hash partitions, in init_db's transaction
+
+    The old table is locked for the whole copy, so run this once in a
+    maintenance window for large tables. Ids keep coming from the same
+    sequence. The stats triggers are created on the new table only after the
+    copy, so existing counters are not applied twice.
+    """
+    cursor.execute("LOCK TABLE todos IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("ALTER TABLE todos RENAME TO todos_unpartitioned")
+    cursor.execute("ALTER INDEX todos_pkey RENAME TO todos_unpartitioned_pkey")
+    # Detach the sequence so it survives dropping the old table
+    cursor.execute("ALTER SEQUENCE todos_id_seq OWNED BY NONE")
+    for statement in partitioned_todos_ddl(TODO_PARTITIONS):
+        cursor.execute(statement)
+    cursor.execute(
+        "ALTER TABLE todos_unpartitioned ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP"
+    )
+    cursor.execute(
+        "INSERT INTO todos "
+        "(id, title, description, completed, user_id, created_at, deleted_at) "
+        "SELECT id, title, description, completed, user_id, created_at, deleted_at "
+        "FROM todos_unpartitioned"
+    )
+    cursor.execute("DROP TABLE todos_unpartitioned")
+
+
+# Rows of todo_stats_totals; fixed, since the trigger maps users onto them
+TODO_STATS_SHARDS = 16
+
+
+def init_todo_stats(cursor):  # pragma: no cover
+    """Per-user counters kept in step with todos by a trigger, in the same
+    transaction as each write, so stats are a primary key lookup. Only live
+    rows count: soft delete decrements, and the later purge is a no-op.
+
+    The same trigger keeps service-wide totals in TODO_STATS_SHARDS rows of
+    todo_stats_totals (by user_id), so admin stats sum a fixed number of
+    rows and concurrent writers rarely wait on the same counter row."""
+    cursor.execute(
+        "SELECT to_regclass('todo_stats') IS NOT NULL AS stats, "
+        "to_regclass('todo_stats_totals') IS NOT NULL AS totals"
+    )
+    present = cursor.fetchone()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS todo_stats (
+            user_id INTEGER PRIMARY KEY,
+            total BIGINT NOT NULL DEFAULT 0,
+            completed BIGINT NOT NULL DEFAULT 0
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS todo_stats_totals (
+            shard SMALLINT PRIMARY KEY,
+            users BIGINT NOT NULL DEFAULT 0,
+            total BIGINT NOT NULL DEFAULT 0,
+            completed BIGINT NOT NULL DEFAULT 0
         )
     """
     )
-    conn.commit()
-    cursor.close()
-    conn.close()
+    # users counts users with at least one live todo: a user's counter
+    # leaving or reaching zero moves it
+    cursor.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION todo_stats_apply() RETURNS trigger AS $$
+        DECLARE
+            user_total BIGINT;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.deleted_at IS NULL THEN
+                UPDATE todo_stats
+                SET total = total - 1,
+                    completed = completed
+                        - CASE WHEN OLD.completed THEN 1 ELSE 0 END
+                WHERE user_id = OLD.user_id
+                RETURNING total INTO user_total;
+                UPDATE todo_stats_totals
+                SET users = users - CASE WHEN user_total = 0 THEN 1 ELSE 0 END,
+                    total = total - 1,
+                    completed = completed
+                        - CASE WHEN OLD.completed THEN 1 ELSE 0 END
+                WHERE shard = mod(OLD.user_id, {TODO_STATS_SHARDS});
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.deleted_at IS NULL THEN
+                INSERT INTO todo_stats AS s (user_id, total, completed)
+                VALUES (
+                    NEW.user_id, 1, CASE WHEN NEW.completed THEN 1 ELSE 0 END
+                )
+                ON CONFLICT (user_id) DO UPDATE
+                SET total = s.total + 1,
+                    completed = s.completed + EXCLUDED.completed
+                RETURNING s.total INTO user_total;
+                UPDATE todo_stats_totals
+                SET users = users + CASE WHEN user_total = 1 THEN 1 ELSE 0 END,
+                    total = total + 1,
+                    completed = completed
+                        + CASE WHEN NEW.completed THEN 1 ELSE 0 END
+                WHERE shard = mod(NEW.user_id, {TODO_STATS_SHARDS});
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """
+    )
+    cursor.execute(
+        """
+        CREATE OR REPLACE TRIGGER todo_stats_insert_delete
+        AFTER INSERT OR DELETE ON todos
+        FOR EACH ROW EXECUTE FUNCTION todo_stats_apply()
+    """
+    )
+    cursor.execute(
+        """
+        CREATE OR REPLACE TRIGGER todo_stats_update
+        AFTER UPDATE OF completed, user_id, deleted_at ON todos
+        FOR EACH ROW
+        WHEN (
+            OLD.completed IS DISTINCT FROM NEW.completed
+            OR OLD.user_id IS DISTINCT FROM NEW.user_id
+            OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+        )
+        EXECUTE FUNCTION todo_stats_apply()
+    """
+    )
+    if present["stats"] and present["totals"]:
+        return
+    # Block writers while existing rows are counted so nothing is missed
+    cursor.execute("LOCK TABLE todos IN SHARE ROW EXCLUSIVE MODE")
+    if not present["stats"]:
+        cursor.execute(
+            """
+            INSERT INTO todo_stats (user_id, total, completed)
+            SELECT user_id, count(*), count(*) FILTER (WHERE completed)
+            FROM todos WHERE deleted_at IS NULL GROUP BY user_id
+        """
+        )
+    cursor.execute(
+        f"""
+        INSERT INTO todo_stats_totals (shard, users, total, completed)
+        SELECT shard.n, count(s.user_id) FILTER (WHERE s.total > 0),
+            coalesce(sum(s.total), 0), coalesce(sum(s.completed), 0)
+        FROM generate_series(0, {TODO_STATS_SHARDS - 1}) AS shard(n)
+        LEFT JOIN todo_stats s ON mod(s.user_id, {TODO_STATS_SHARDS}) = shard.n
+        GROUP BY shard.n
+        ON CONFLICT (shard) DO UPDATE
+        SET users = EXCLUDED.users, total = EXCLUDED.total,
+            completed = EXCLUDED.completed
+    """
+    )
 
 
 async def verify_token(authorization: str = Header(None)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    token = bearer_token(authorization)
+    try:
+        payload = await decode_token(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return access_token_user_id(payload)
+
+
+# Admission control, deadlines and load shedding
+ADMISSION = AdmissionControl(
+    create_rate_limit_backend(
+        RATE_LIMIT_REDIS_URL, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST
+    ),
+    ConcurrencyLimiter(
+        parse_route_settings(ROUTE_CONCURRENCY_LIMITS),
+        DEFAULT_CONCURRENCY_LIMIT,
+        CONCURRENCY_QUEUE_TIMEOUT,
+    ),
+    LOAD_SHEDDER,
+    identify=lambda request: client_identity(
+        request, TOKEN_KEYS.decode, TRUSTED_PROXY_HOPS
+    ),
+    critical_routes=CRITICAL_ROUTES,
+    listing_routes=LISTING_ROUTES,
+    exempt_paths=ADMISSION_EXEMPT_PATHS,
+    enabled=ADMISSION_CONTROL_ENABLED,
+    shedding_enabled=LOAD_SHEDDING_ENABLED,
+)
+ROUTE_DEADLINE_SETTINGS = parse_route_settings(ROUTE_DEADLINES)
+LOOP_WATCHDOG = LoopWatchdog(BLOCKING_THRESHOLD, LOOP_LAG_SAMPLE_INTERVAL)
+
+add_exception_handlers(app)
+app.add_middleware(ReadYourWritesMiddleware, database=DATABASE)
+app.add_middleware(AdmissionMiddleware, control=ADMISSION)
+app.add_middleware(
+    DeadlineMiddleware,
+    deadlines=ROUTE_DEADLINE_SETTINGS,
+    default_deadline=DEFAULT_DEADLINE,
+)
+# CORS stays outermost so admission rejections and 504s still carry CORS headers
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, specify your frontend domain
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+# Token verification keys
+class UnknownSigningKey(JWTError):
+    pass
+
+
+class JWKSCache:
+    """user-service's public signing keys, cached so tokens verify locally
+
+    Refreshed in the background; a token signed with a key we have not seen
+    (a rotation) triggers one early refetch, at most every
+    JWKS_MIN_REFETCH_INTERVAL. Tokens without a kid are HS256 with SECRET_KEY.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.keys = {}  # kid -> public JWK
+        self.checked_at = None
+        self.client = httpx.Client(timeout=5)
+
+    def refresh(self):
+        response = self.client.get(self.url)
+        response.raise_for_status()
+        self.keys = {key["kid"]: key for key in response.json()["keys"]}
+
+    def refresh_if_stale(self, max_age: float):
+        now = time.monotonic()
+        if not self.url or (
+            self.checked_at is not None and now - self.checked_at < max_age
+        ):
+            return
+        self.checked_at = now
+        try:
+            self.refresh()
+        except Exception:
+            # Keep verifying with the keys we already have
+            JWKS_REFRESH_ERRORS.inc()
+            logger.exception("fetching JWKS from %s failed", self.url)
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if self.keys and not JWT_ACCEPT_HS256:
+                raise JWTError("HS256 tokens are not accepted")
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if kid not in self.keys:
+            raise UnknownSigningKey(kid)
+        return jwt.decode(token, self.keys[kid], algorithms=["RS256"])
+
+
+JWKS_REFRESH_ERRORS = Counter(
+    "jwks_refresh_errors_total", "Failed fetches of the user-service JWKS"
+)
+JWKS_KEYS = Gauge("jwks_keys", "Signing keys in the cached JWKS")
+
+TOKEN_KEYS = JWKSCache(JWKS_URL)
+JWKS_KEYS.set_function(lambda: len(TOKEN_KEYS.keys))
+# Concurrent requests with a new kid share a single refetch
+JWKS_FLIGHT = SingleFlight(
+    "jwks", key_func=lambda max_age: max_age, timeout=SINGLE_FLIGHT_TIMEOUT
+)
+
+
+async def decode_token(token: str) -> dict:
+    try:
+        return TOKEN_KEYS.decode(token)
+    except UnknownSigningKey:
+        await JWKS_FLIGHT.run(TOKEN_KEYS.refresh_if_stale, JWKS_MIN_REFETCH_INTERVAL)
+        return TOKEN_KEYS.decode(token)
+
+
+async def run_jwks_refresher():  # pragma: no cover
+    while True:
+        await run_in_threadpool(TOKEN_KEYS.refresh_if_stale, JWKS_REFRESH_INTERVAL)
+        await asyncio.sleep(JWKS_REFRESH_INTERVAL)
+
+
+# Idempotency keys
+IDEMPOTENCY = IdempotencyStore(
+    PostgresIdempotencyBackend(DATABASE), IDEMPOTENCY_TTL, IDEMPOTENCY_LOCK_TIMEOUT
+)
+
+
+# Audit log
+AUDIT = AuditLog(
+    DATABASE,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL,
+    overflow=AUDIT_OVERFLOW,
+    rate=AUDIT_RATE_PER_USER,
+    burst=AUDIT_BURST_PER_USER,
+    enabled=AUDIT_ENABLED,
+)
+
+
+# Todo list cache
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# The C string encoder behind json.dumps, without its per-call overhead
+encode_json_string = json.encoder.encode_basestring
+
+
+class CompactTodo:
+    """A cached todo row at a fraction of the size of a dict or a Todo model
+
+    Slots instead of an instance dict, an interned title (many todos share
+    theirs), created_at as integer microseconds and completed as a bool.
+    to_json() renders the same JSON as the Todo response model.
+    """
+
+    __slots__ = ("id", "user_id", "completed", "created_at", "title", "description")
+
+    def __init__(self, id, user_id, completed, created_at, title, description):
+        self.id = id
+        self.user_id = user_id
+        self.completed = completed
+        self.created_at = created_at
+        self.title = title
+        self.description = description
+
+    @classmethod
+    def from_row(cls, row) -> "CompactTodo":
+        created_at = row["created_at"]
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        return cls(
+            row["id"],
+            row["user_id"],
+            bool(row["completed"]),
+            (created_at - EPOCH) // MICROSECOND,
+            sys.intern(row["title"]),
+            row["description"],
+        )
+
+    def to_json(self) -> bytes:
+        return (
+            '{"id":%d,"title":%s,"description":%s,"completed":%s,'
+            '"user_id":%d,"created_at":"%s"}'
+            % (
+                self.id,
+                encode_json_string(self.title),
+                (
+                    "null"
+                    if self.description is None
+                    else encode_json_string(self.description)
+                ),
+                "true" if self.completed else "false",
+                self.user_id,
+                EPOCH + self.created_at * MICROSECOND,
+            )
+        ).encode()
+
+
+def todos_json(todos) -> bytes:
+    return b"[" + b",".join(todo.to_json() for todo in todos) + b"]"
+
+
+class TodoListCache:
+    """Per-user default todo listings as tuples of CompactTodo
+
+    Bounded LRU with a TTL. Writes invalidate the user's entry, locally and
+    on every pod through the change feed; a listing fetched before the
+    latest invalidation of its user is not stored.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, todos)
+        self._invalidated = OrderedDict()  # user_id -> monotonic time
+        TODO_CACHE_ROWS.set_function(
+            lambda: sum(len(todos) for _, todos in self._entries.values())
+        )
+
+    def get(self, user_id: int, allow_stale: bool = False) -> Optional[tuple]:
+        """The user's listing; allow_stale also returns it past its TTL"""
+        entry = self._entries.get(user_id)
+        expired = entry is not None and entry[0] <= time.monotonic()
+        if entry is None or (expired and not allow_stale):
+            TODO_CACHE_REQUESTS.labels(result="miss").inc()
+            return None
+        self._entries.move_to_end(user_id)
+        TODO_CACHE_REQUESTS.labels(result="stale" if expired else "hit").inc()
+        return entry[1]
+
+    def put(self, user_id: int, rows, fetched_at: float) -> tuple:
+        todos = tuple(CompactTodo.from_row(row) for row in rows)
+        if self.invalidated_at(user_id) < fetched_at:
+            self._entries[user_id] = (time.monotonic() + self.ttl, todos)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return todos
+
+    def invalidated_at(self, user_id: int) -> float:
+        """Monotonic time of the user's latest invalidation, -inf if none"""
+        return self._invalidated.get(user_id, float("-inf"))
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+        self._invalidated[user_id] = time.monotonic()
+        self._invalidated.move_to_end(user_id)
+        while len(self._invalidated) > self.max_users:
+            self._invalidated.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
 
-    token = authorization.split(" ")[1]
+
+TODO_CACHE_REQUESTS = Counter(
+    "todo_cache_requests_total", "Default todo listings by cache result", ["result"]
+)
+TODO_CACHE_ROWS = Gauge("todo_cache_rows", "Todo rows held in the list cache")
+
+TODO_CACHE = TodoListCache(TODO_CACHE_MAX_USERS, TODO_CACHE_TTL)
+
+
+# Change feed
+def todo_change_message(event: str, user_id: int, todo_id: int, todo=None) -> dict:
+    message = {"event": event, "id": todo_id, "user_id": user_id}
+    if todo is not None:
+        message["todo"] = {
+            "id": todo["id"],
+            "title": todo["title"],
+            "description": todo["description"],
+            "completed": bool(todo["completed"]),
+            "user_id": todo["user_id"],
+            "created_at": str(todo["created_at"]),
+        }
+    return message
+
+
+def todo_change_payload(event: str, user_id: int, todo_id: int, todo=None) -> str:
+    message = todo_change_message(event, user_id, todo_id, todo)
+    payload = json.dumps(message)
+    if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+        # Too big for NOTIFY; subscribers fetch the todo themselves
+        del message["todo"]
+        payload = json.dumps(message)
+    return payload
+
+
+# The data-modifying CTE runs even though nothing reads it: one round trip
+SQL_INSERT_OUTBOX_AND_NOTIFY = """
+    WITH outbox AS (
+        INSERT INTO todo_outbox (event_type, todo_id, user_id, payload)
+        VALUES (%s, %s, %s, %s)
+    )
+    SELECT pg_notify(%s, %s)
+"""
+
+
+def publish_todo_change(cursor, event: str, user_id: int, todo_id: int, todo=None):
+    """Write the change to the outbox and queue its live notification
+
+    Both only take effect when the surrounding write transaction commits.
+    Without an outbox sink nothing would drain the row, so only notify.
+    """
+    notify_args = (
+        CHANGE_FEED_CHANNEL,
+        todo_change_payload(event, user_id, todo_id, todo),
+    )
+    if OUTBOX.sink is None:
+        cursor.execute("SELECT pg_notify(%s, %s)", notify_args)
+        return
+    message = todo_change_message(event, user_id, todo_id, todo)
+    cursor.execute(
+        SQL_INSERT_OUTBOX_AND_NOTIFY,
+        (event, todo_id, user_id, json.dumps(message)) + notify_args,
+    )
+
+
+class ChangeFeedHub:
+    """Fans change events out to the SSE subscribers of this pod
+
+    Each subscriber has a bounded queue. A subscriber that falls behind loses
+    its backlog and gets a single "resync" event telling it to refetch.
+    """
+
+    def __init__(self, buffer_size: int, max_subscribers: int):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.subscriber_count = 0
+        self._subscribers = {}  # user_id -> set of queues
+
+    def subscribe(self, user_id: int) -> Optional[asyncio.Queue]:
+        if self.subscriber_count >= self.max_subscribers:
+            return None
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        self.subscriber_count += 1
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues and queue in queues:
+            queues.discard(queue)
+            self.subscriber_count -= 1
+            if not queues:
+                del self._subscribers[user_id]
+
+    def dispatch(self, message: dict):
+        for queue in self._subscribers.get(message.get("user_id"), ()):
+            self._offer(queue, message)
+        CHANGE_FEED_EVENTS.labels(event=message.get("event", "unknown")).inc()
+
+    def resync_all(self):
+        """Tell everyone to refetch, e.g. after notifications may have been lost"""
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._offer(queue, {"event": "resync"})
+
+    def _offer(self, queue: asyncio.Queue, message: dict):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            CHANGE_FEED_OVERFLOWS.inc()
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"event": "resync"})
+
+
+CHANGE_FEED_EVENTS = Counter(
+    "change_feed_events_total", "Todo change notifications received", ["event"]
+)
+CHANGE_FEED_OVERFLOWS = Counter(
+    "change_feed_overflows_total", "Subscriber buffers dropped for being too slow"
+)
+CHANGE_FEED_SUBSCRIBERS = Gauge(
+    "change_feed_subscribers", "Open change feed streams on this pod"
+)
+CHANGE_FEED_LISTENER_ERRORS = Counter(
+    "change_feed_listener_errors_total",
+    "LISTEN connections lost or failed, each followed by a reconnect",
+)
+
+CHANGE_FEED = ChangeFeedHub(CHANGE_FEED_BUFFER_SIZE, CHANGE_FEED_MAX_SUBSCRIBERS)
+CHANGE_FEED_SUBSCRIBERS.set_function(lambda: CHANGE_FEED.subscriber_count)
+
+
+async def run_change_listener():  # pragma: no cover
+    """LISTEN on a dedicated connection and hand notifications to CHANGE_FEED
+
+    A failed connection is logged and replaced, with full-jitter exponential
+    backoff from CHANGE_FEED_RECONNECT_DELAY up to
+    CHANGE_FEED_RECONNECT_MAX_DELAY.
+    """
+    loop = asyncio.get_running_loop()
+    failures = 0
+    while True:
+        conn = fd = None
+        try:
+            conn = await run_in_threadpool(psycopg2.connect, DATABASE.url_factory())
+            # Read once: a broken connection cannot report its fd later
+            fd = conn.fileno()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CHANGE_FEED_CHANNEL}")
+            # Anything published while we were disconnected is gone
+            CHANGE_FEED.resync_all()
+            TODO_CACHE.clear()
+            readable = asyncio.Event()
+            loop.add_reader(fd, readable.set)
+            failures = 0
+            while True:
+                await readable.wait()
+                readable.clear()
+                conn.poll()
+                while conn.notifies:
+                    message = json.loads(conn.notifies.pop(0).payload)
+                    TODO_CACHE.invalidate(message["user_id"])
+                    CHANGE_FEED.dispatch(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failures += 1
+            CHANGE_FEED_LISTENER_ERRORS.inc()
+            logger.exception("change feed listener failed, reconnecting")
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            if conn is not None:
+                conn.close()
+        delay = min(
+            CHANGE_FEED_RECONNECT_MAX_DELAY,
+            CHANGE_FEED_RECONNECT_DELAY * 2 ** max(failures - 1, 0),
+        )
+        await asyncio.sleep(random.uniform(0, delay))
+
+
+def create_stream_ticket(user_id: int) -> str:
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TICKET_TTL)
+    return jwt.encode(
+        {"user_id": user_id, "type": "stream", "exp": expire},
+        STREAM_TICKET_SECRET,
+        algorithm=ALGORITHM,
+    )
+
+
+async def verify_stream_token(
+    authorization: str = Header(None), ticket: Optional[str] = None
+):
+    """The Authorization header, or a ?ticket= from /todos/stream/ticket
+
+    Tickets are only good for opening the stream, so one that leaks through
+    an access log cannot be used for anything else and soon expires.
+    """
+    if authorization or not ticket:
+        return await verify_token(authorization)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
+        payload = jwt.decode(ticket, STREAM_TICKET_SECRET, algorithms=[ALGORITHM])
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("type") != "stream" or payload.get("user_id") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload["user_id"]
+
+
+# Transactional outbox
+class LogSink:
+    """Writes events to the service log and acknowledges them (debugging only)"""
+
+    def send(self, events: List[dict]):
+        for event in events:
+            logger.info("todo event %s", json.dumps(event))
+
+
+class WebhookSink:
+    """POSTs each batch as a JSON array; any non-2xx response fails the batch"""
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.client = httpx.Client(timeout=timeout)
+
+    def send(self, events: List[dict]):
+        self.client.post(self.url, json=events).raise_for_status()
+
+
+class InMemoryBrokerSink:
+    """Local stand-in for a message broker, keeps the most recent events"""
+
+    def __init__(self, max_events: int = 10000):
+        self.events = deque(maxlen=max_events)
+
+    def send(self, events: List[dict]):
+        self.events.extend(events)
+
+
+def create_outbox_sink():
+    """The configured sink, or None when events should not be recorded"""
+    if OUTBOX_SINK == "webhook" and OUTBOX_WEBHOOK_URL:
+        return WebhookSink(OUTBOX_WEBHOOK_URL, OUTBOX_WEBHOOK_TIMEOUT)
+    if OUTBOX_SINK == "memory":
+        return InMemoryBrokerSink()
+    if OUTBOX_SINK == "log":
+        return LogSink()
+    return None
+
+
+class OutboxDispatcher:
+    """Drains todo_outbox in batches with at-least-once delivery
+
+    Rows are locked with SKIP LOCKED so several pods can drain concurrently,
+    and deleted only after the sink accepted them. A crash in between means
+    the batch is sent again, so consumers de-duplicate on the event id.
+    measure() tracks the whole backlog, including rows other pods hold.
+    """
+
+    def __init__(self, sink, batch_size: int):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.lag = 0.0
+        self.pending = 0
+
+    def measure(self):
+        """Record how many events are undelivered and how old the oldest is"""
+        with DATABASE.checkout() as (conn, cursor):
+            try:
+                cursor.execute(
+                    "SELECT count(*) AS pending, coalesce(EXTRACT(EPOCH FROM "
+                    "CURRENT_TIMESTAMP - min(created_at)), 0) AS age FROM todo_outbox"
+                )
+                row = cursor.fetchone()
+                conn.rollback()
+            except Exception:
+                conn.rollback()
+                raise
+        self.pending = row["pending"]
+        self.lag = float(row["age"])
+
+    def drain_once(self) -> int:
+        with DATABASE.checkout() as (conn, cursor):
+            try:
+                cursor.execute(
+                    "SELECT id, event_type, todo_id, user_id, payload, created_at "
+                    "FROM todo_outbox ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (self.batch_size,),
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    conn.rollback()
+                    return 0
+
+                self.sink.send(
+                    [
+                        {
+                            "id": row["id"],
+                            "event": row["event_type"],
+                            "todo_id": row["todo_id"],
+                            "user_id": row["user_id"],
+                            "payload": row["payload"],
+                            "created_at": str(row["created_at"]),
+                        }
+                        for row in rows
+                    ]
+                )
+                cursor.execute(
+                    "DELETE FROM todo_outbox WHERE id = ANY(%s)",
+                    ([row["id"] for row in rows],),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                OUTBOX_FAILURES.inc()
+                raise
+
+        OUTBOX_BATCH_SIZE.observe(len(rows))
+        for row in rows:
+            OUTBOX_PUBLISHED.labels(event=row["event_type"]).inc()
+        return len(rows)
+
+
+OUTBOX_PUBLISHED = Counter(
+    "outbox_events_published_total", "Outbox events delivered to the sink", ["event"]
+)
+OUTBOX_FAILURES = Counter(
+    "outbox_dispatch_failures_total", "Outbox batches that failed and will be retried"
+)
+OUTBOX_BATCH_SIZE = Histogram(
+    "outbox_batch_size",
+    "Events per dispatched outbox batch",
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500],
+)
+OUTBOX_LAG = Gauge(
+    "outbox_lag_seconds", "Age of the oldest undelivered outbox event when polled"
+)
+OUTBOX_PENDING = Gauge("outbox_pending_events", "Undelivered outbox events when polled")
+
+OUTBOX = OutboxDispatcher(
+    create_outbox_sink() if OUTBOX_ENABLED else None, OUTBOX_BATCH_SIZE_LIMIT
+)
+OUTBOX_LAG.set_function(lambda: OUTBOX.lag)
+OUTBOX_PENDING.set_function(lambda: OUTBOX.pending)
+
+
+async def run_outbox_dispatcher():  # pragma: no cover
+    while True:
+        try:
+            sent = await run_in_threadpool(OUTBOX.drain_once)
+        except Exception:
+            logger.exception("outbox dispatch failed")
+            sent = 0
+        # Keep draining while batches come back full
+        if sent < OUTBOX.batch_size:
+            try:
+                await run_in_threadpool(OUTBOX.measure)
+            except Exception:
+                logger.exception("outbox backlog check failed")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+# Soft delete purge
+def parse_purge_windows(value: str) -> List[tuple]:
+    """Parse "HH:MM-HH:MM,..." into (start, end) minutes of the UTC day"""
+    windows = []
+    for item in value.split(","):
+        if "-" not in item:
+            continue
+        bounds = []
+        for part in item.strip().split("-", 1):
+            hours, minutes = part.split(":")
+            bounds.append(int(hours) * 60 + int(minutes))
+        windows.append(tuple(bounds))
+    return windows
+
+
+def in_purge_window(windows: List[tuple], now: datetime) -> bool:
+    if not windows:
+        return True
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        # A window may wrap past midnight, e.g. 22:00-02:00
+        if start <= minute < end or (end < start and (minute >= start or minute < end)):
+            return True
+    return False
+
+
+class TodoPurger:
+    """Hard-deletes soft-deleted todos in small batches
+
+    Each batch is its own short transaction, so row locks and WAL are spread
+    out instead of landing as one large delete.
+    """
+
+    def __init__(self, batch_size: int, retention: float, windows: List[tuple]):
+        self.batch_size = batch_size
+        self.retention = retention
+        self.windows = windows
+
+    def window_open(self) -> bool:
+        return in_purge_window(self.windows, datetime.utcnow())
+
+    def purge_batch(self) -> int:
+        with DATABASE.checkout() as (conn, cursor):
+            try:
+                cursor.execute(
+                    """
+                    DELETE FROM todos WHERE (user_id, id) IN (
+                        SELECT user_id, id FROM todos
+                        WHERE deleted_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                        ORDER BY deleted_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                """,
+                    (self.retention, self.batch_size),
+                )
+                purged = cursor.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        TODOS_PURGED.inc(purged)
+        TODO_PURGE_BATCHES.inc()
+        return purged
+
+    def backlog(self) -> int:
+        """Soft-deleted rows still in the table, counted via the partial index"""
+        with DATABASE.checkout() as (_, cursor):
+            cursor.execute(
+                "SELECT count(*) AS pending FROM todos WHERE deleted_at IS NOT NULL"
+            )
+            return cursor.fetchone()["pending"]
+
+
+TODOS_PURGED = Counter("todos_purged_total", "Soft-deleted todos hard-deleted")
+TODO_PURGE_BATCHES = Counter("todo_purge_batches_total", "Purge batches committed")
+TODO_PURGE_BACKLOG = Gauge(
+    "todo_purge_backlog", "Soft-deleted todos awaiting purge at the last run"
+)
+TODO_PURGE_WINDOW_OPEN = Gauge(
+    "todo_purge_window_open", "1 while the configured purge window is open"
+)
+TODO_PURGE_LAST_RUN = Gauge(
+    "todo_purge_last_run_timestamp_seconds", "Unix time the last purge run finished"
+)
+
+TODO_PURGER = TodoPurger(
+    PURGE_BATCH_SIZE, PURGE_RETENTION, parse_purge_windows(PURGE_WINDOWS)
+)
+TODO_PURGE_WINDOW_OPEN.set_function(lambda: float(TODO_PURGER.window_open()))
+
+
+async def run_todo_purger():  # pragma: no cover
+    while True:
+        try:
+            # Re-check the window between batches so a run stops when it closes
+            while TODO_PURGER.window_open():
+                if await run_in_threadpool(TODO_PURGER.purge_batch) < PURGE_BATCH_SIZE:
+                    break
+                await asyncio.sleep(PURGE_BATCH_PAUSE)
+            TODO_PURGE_BACKLOG.set(await run_in_threadpool(TODO_PURGER.backlog))
+            TODO_PURGE_LAST_RUN.set(time.time())
+        except Exception:
+            logger.exception("todo purge failed")
+        await asyncio.sleep(PURGE_INTERVAL)
+
+
+# Service-to-service HTTP
+def http2_available() -> bool:
+    try:
+        # Optional dependency: pip install 'httpx[http2]'
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ServiceClient:
+    """Pooled keep-alive HTTP client for one internal upstream
+
+    A single instance is shared by all requests, so calls reuse warm
+    connections rather than paying for a new handshake each time.
+
+    HTTP/2 multiplexing is used when it is enabled, h2 is installed and the
+    upstream negotiates it over TLS. uvicorn speaks only HTTP/1.1, so
+    in-cluster calls rely on keep-alive.
+
+    Failed calls are retried with full-jitter exponential backoff, but
+    never past the current request's deadline:
+    - connection failures are always retried, because the request never
+      reached the upstream;
+    - other transport errors and 502/503/504 responses are retried only
+      for idempotent calls.
+    """
+
+    RETRY_STATUSES = {502, 503, 504}
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float,
+        max_connections: int,
+        keepalive_expiry: float,
+        http2: bool = False,
+        retries: int = 0,
+        backoff: float = 0.05,
+        backoff_max: float = 1.0,
+        transport=None,
+    ):
+        self.host = httpx.URL(base_url).host
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        if http2 and not http2_available():
+            logger.warning("SERVICE_HTTP2 needs the h2 package, using HTTP/1.1")
+            http2 = False
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+            transport=transport,
+        )
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def request(
+        self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs
+    ) -> httpx.Response:
+        """Send a request; idempotent=True marks a read-only POST as retryable"""
+        if idempotent is None:
+            idempotent = method in self.IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._observe(method, "error", started)
+                retryable = idempotent or isinstance(e, self.NOT_SENT_ERRORS)
+                if not (retryable and await self._backoff(attempt, type(e).__name__)):
+                    raise
+                continue
+            self._observe(method, str(response.status_code), started)
+            if not (
+                idempotent
+                and response.status_code in self.RETRY_STATUSES
+                and await self._backoff(attempt, str(response.status_code))
+            ):
+                return response
+
+    async def _backoff(self, attempt: int, reason: str) -> bool:
+        """Sleep before the next attempt; False if there should be none"""
+        if attempt >= self.retries:
+            return False
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+        deadline = REQUEST_DEADLINE.get()
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        SERVICE_HTTP_RETRIES_TOTAL.labels(host=self.host, reason=reason).inc()
+        await asyncio.sleep(delay)
+        return True
+
+    def _observe(self, method: str, status: str, started: float):
+        SERVICE_HTTP_REQUESTS.labels(host=self.host, method=method, status=status).inc()
+        SERVICE_HTTP_DURATION.labels(host=self.host).observe(
+            time.perf_counter() - started
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+SERVICE_HTTP_REQUESTS = Counter(
+    "service_http_requests_total",
+    "Service-to-service HTTP attempts by upstream host and outcome",
+    ["host", "method", "status"],
+)
+SERVICE_HTTP_DURATION = Histogram(
+    "service_http_request_duration_seconds",
+    "Service-to-service HTTP attempt latency by upstream host",
+    ["host"],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+SERVICE_HTTP_RETRIES_TOTAL = Counter(
+    "service_http_retries_total",
+    "Service-to-service HTTP retries by upstream host and cause",
+    ["host", "reason"],
+)
+
+USER_SERVICE_CLIENT = ServiceClient(
+    USER_SERVICE_URL,
+    SERVICE_HTTP_TIMEOUT,
+    SERVICE_HTTP_MAX_CONNECTIONS,
+    SERVICE_HTTP_KEEPALIVE_EXPIRY,
+    http2=SERVICE_HTTP2,
+    retries=SERVICE_HTTP_RETRIES,
+    backoff=SERVICE_HTTP_BACKOFF,
+    backoff_max=SERVICE_HTTP_BACKOFF_MAX,
+)
+
+
+# User existence
+class UserDirectory:
+    """Answers "does this user still exist?" with user-service GET /users/{id}
+
+    Answers are cached for ttl, so an active user costs a dict lookup.
+    Best effort: when user-service cannot answer, the user is assumed to
+    exist, since the token itself was already verified locally.
+    """
+
+    def __init__(self, client: ServiceClient, ttl: float, max_entries: int):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (expires_at, exists)
+
+    async def exists(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            USER_EXISTENCE_CHECKS.labels(result="cached").inc()
+            return entry[1]
+        try:
+            response = await self.client.get(f"/users/{user_id}")
+        except httpx.HTTPError:
+            response = None
+        if response is None or not (response.is_success or response.status_code == 404):
+            USER_EXISTENCE_CHECKS.labels(result="error").inc()
+            return True
+        exists = response.status_code != 404
+        USER_EXISTENCE_CHECKS.labels(result="exists" if exists else "missing").inc()
+        self._entries[user_id] = (time.monotonic() + self.ttl, exists)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return exists
+
+
+USER_EXISTENCE_CHECKS = Counter(
+    "user_existence_checks_total", "User existence checks by result", ["result"]
+)
+
+USER_DIRECTORY = UserDirectory(
+    USER_SERVICE_CLIENT, USER_EXISTS_TTL, USER_EXISTS_MAX_ENTRIES
+)
+
+
+async def verify_existing_user(user_id: int = Depends(verify_token)) -> int:
+    """verify_token, plus (with USER_EXISTENCE_CHECK) a cached check that the
+    user has not been deleted since the token was issued"""
+    if USER_EXISTENCE_CHECK and not await USER_DIRECTORY.exists(user_id):
+        raise HTTPException(status_code=401, detail="User no longer exists")
+    return user_id
+
+
+# User enrichment
+USER_ENRICHMENT_ERRORS = Counter(
+    "user_enrichment_errors_total", "Failed batch username lookups"
+)
+
+
+async def fetch_usernames(user_ids) -> dict:
+    """Usernames by id via POST /users/batch; best effort, {} on failure"""
+    unique_ids = sorted(set(user_ids))
+    usernames = {}
+    try:
+        for start in range(0, len(unique_ids), USER_BATCH_MAX_IDS):
+            response = await USER_SERVICE_CLIENT.post(
+                "/users/batch",
+                json={"ids": unique_ids[start : start + USER_BATCH_MAX_IDS]},
+                idempotent=True,  # a read, safe to retry
+            )
+            response.raise_for_status()
+            usernames.update((user["id"], user["username"]) for user in response.json())
+    except httpx.HTTPError:
+        # The list is still served, just without names
+        USER_ENRICHMENT_ERRORS.inc()
+        logger.warning("username enrichment failed", exc_info=True)
+    return usernames
+
+
+# Write batching
+def insert_todo_batch(items: List[tuple]) -> List[dict]:
+    """Insert (title, description, user_id) items with one statement and commit
+
+    Returns the created rows in the order of the items.
+    """
+    with DATABASE.checkout() as (conn, cursor):
+        try:
+            # Ids are allocated up front so every caller can find its own row
+            cursor.execute(
+                "SELECT nextval('todos_id_seq') AS id FROM generate_series(1, %s)",
+                (len(items),),
+            )
+            ids = [row["id"] for row in cursor.fetchall()]
+            rows = psycopg2.extras.execute_values(
+                cursor,
+                "INSERT INTO todos (id, title, description, user_id) "
+                f"VALUES %s RETURNING {TODO_COLUMNS}",
+                [(todo_id, *item) for todo_id, item in zip(ids, items)],
+                page_size=len(items),
+                fetch=True,
+            )
+            by_id = {row["id"]: row for row in rows}
+            created = [by_id[todo_id] for todo_id in ids]
+            for row in created:
+                publish_todo_change(cursor, "created", row["user_id"], row["id"], row)
+            conn.commit()
+            return created
+        except Exception:
+            conn.rollback()
+            raise
+
+
+class WriteBatcher:
+    """Coalesces concurrent writes into batches that share one commit
+
+    A batch is written once it holds max_size items or max_delay after its
+    first item, trading up to max_delay of latency for far fewer commits
+    (and fsyncs) under load. If a batch fails on bad data, its items are
+    retried one by one so a single bad row cannot fail its neighbours. Any
+    other failure (an outage, a connection lost during COMMIT) fails the whole
+    batch: retrying row by row would multiply load on a struggling database
+    and, when the commit outcome is unknown, could insert rows twice.
+    """
+
+    def __init__(self, write_batch, max_size: int, max_delay: float):
+        self.write_batch = write_batch
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._flushes = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_pending)
+        return await future
+
+    def _flush_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list):
+        # The batch serves many requests, none of whose deadlines should bind it
+        REQUEST_DEADLINE.set(None)
+        REQUEST_CONNECTIONS.set(None)
+        try:
+            rows = await run_in_threadpool(self.write_batch, [i for i, _ in batch])
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            if len(batch) == 1:
+                self._settle(batch[0][1], error=e)
+                return
+            WRITE_BATCH_FALLBACKS.inc()
+            for item, future in batch:
+                try:
+                    row = (await run_in_threadpool(self.write_batch, [item]))[0]
+                except Exception as item_error:
+                    self._settle(future, error=item_error)
+                else:
+                    self._settle(future, row)
+            return
+        except Exception as e:
+            for _, future in batch:
+                self._settle(future, error=e)
+            return
+        WRITE_BATCH_SIZE.observe(len(batch))
+        for (_, future), row in zip(batch, rows):
+            self._settle(future, row)
+
+    @staticmethod
+    def _settle(future: asyncio.Future, result=None, error=None):
+        # A caller that went away has a cancelled future; its row stays written
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+WRITE_BATCH_SIZE = Histogram(
+    "todo_write_batch_size",
+    "Todos inserted per group commit",
+    buckets=[1, 2, 5, 10, 20, 50, 100, 200],
+)
+WRITE_BATCH_FALLBACKS = Counter(
+    "todo_write_batch_fallbacks_total", "Failed batches retried item by item"
+)
+
+TODO_WRITE_BATCHER = WriteBatcher(
+    insert_todo_batch, WRITE_BATCH_MAX_SIZE, WRITE_BATCH_MAX_DELAY
+)
+
+
+# Profiling
+CONTINUOUS_PROFILER = ContinuousProfiler(PROFILING_CONTINUOUS_HZ)
+# Sampling is blocking, one session at a time
+PROFILE_LOCK = asyncio.Lock()
 
 
 @app.on_event("startup")
 async def startup_event():  # pragma: no cover
-    try:
-        init_db()
-    except Exception:
-        # In test environment, database might not be available
-        pass
+    if not DATABASE.init_schema(init_db):
+        background_tasks.append(
+            asyncio.create_task(
+                DATABASE.run_schema_init(init_db, SCHEMA_INIT_RETRY_INTERVAL)
+            )
+        )
+    background_tasks.append(
+        asyncio.create_task(DATABASE.run_health_checks(READINESS_CHECK_INTERVAL))
+    )
+    background_tasks.append(
+        asyncio.create_task(
+            monitor_event_loop_lag(
+                LOAD_SHEDDER, LOOP_WATCHDOG, LOOP_LAG_SAMPLE_INTERVAL
+            )
+        )
+    )
+    if AUDIT_ENABLED:
+        background_tasks.append(asyncio.create_task(AUDIT.run()))
+    if BLOCKING_THRESHOLD > 0:
+        LOOP_WATCHDOG.start()
+    if PROFILING_CONTINUOUS_HZ > 0:
+        CONTINUOUS_PROFILER.start()
+    if JWKS_URL:
+        background_tasks.append(asyncio.create_task(run_jwks_refresher()))
+    background_tasks.append(asyncio.create_task(run_change_listener()))
+    if OUTBOX.sink is not None:
+        background_tasks.append(asyncio.create_task(run_outbox_dispatcher()))
+    elif OUTBOX_ENABLED:
+        logger.warning(
+            "no outbox sink configured (OUTBOX_SINK=%s), change events are "
+            "not recorded",
+            OUTBOX_SINK,
+        )
+    if PURGE_ENABLED:
+        background_tasks.append(asyncio.create_task(run_todo_purger()))
+    if DATABASE.router.replica_urls:
+        background_tasks.append(
+            asyncio.create_task(
+                DATABASE.run_replica_lag_checks(REPLICA_LAG_CHECK_INTERVAL)
+            )
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():  # pragma: no cover
+    for task in background_tasks:
+        task.cancel()
+    CONTINUOUS_PROFILER.stop()
+    LOOP_WATCHDOG.stop()
+    await run_in_threadpool(AUDIT.drain)
+    DATABASE.closeall()
+    await USER_SERVICE_CLIENT.aclose()
 
 
 @app.get("/health")
@@ -167,42 +1732,55 @@ async def health_check():
 
 @app.get("/ready")
 async def readiness_check():
-    """Readiness probe - checks if application can handle traffic (DB connection)"""
-    try:
-        # Test database connection
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        return {"status": "ready", "service": "todo-service", "database": "connected"}
-    except Exception as e:
-        # Database not ready - return 503 Service Unavailable
-        raise HTTPException(
-            status_code=503,
-            detail={
-                "status": "not_ready",
-                "service": "todo-service",
-                "database": "disconnected",
-                "error": str(e),
-            },
-        )
+    """Readiness probe - reports the DB health cached by the background checker"""
+    return DATABASE.readiness("todo-service")
 
 
 @app.post("/todos", response_model=Todo)
-async def create_todo(todo: TodoCreate, user_id: int = Depends(verify_token)):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+async def create_todo(
+    todo: TodoCreate,
+    user_id: int = Depends(verify_existing_user),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+):
+    if idempotency_key is None:
+        return await insert_todo(todo, user_id)
+    return await IDEMPOTENCY.run(
+        idempotency_key,
+        request_fingerprint(todo.title, todo.description),
+        lambda: insert_todo(todo, user_id),
+        user_id=user_id,
+    )
+
+
+async def insert_todo(todo: TodoCreate, user_id: int) -> Todo:
+    if WRITE_BATCHING_ENABLED:
+        created_todo = await TODO_WRITE_BATCHER.submit(
+            (todo.title, todo.description, user_id)
+        )
+        DATABASE.router.record_write(user_id)
+        TODO_CACHE.invalidate(user_id)
+        return Todo(
+            id=created_todo["id"],
+            title=created_todo["title"],
+            description=created_todo["description"],
+            completed=bool(created_todo["completed"]),
+            user_id=created_todo["user_id"],
+            created_at=str(created_todo["created_at"]),
+        )
+
+    with DATABASE.checkout() as (conn, cursor):
         cursor.execute(
             "INSERT INTO todos (title, description, user_id) "
-            "VALUES (%s, %s, %s) RETURNING *",
+            f"VALUES (%s, %s, %s) RETURNING {TODO_COLUMNS}",
             (todo.title, todo.description, user_id),
         )
         created_todo = cursor.fetchone()
+        publish_todo_change(
+            cursor, "created", user_id, created_todo["id"], created_todo
+        )
         conn.commit()
+        DATABASE.router.record_write(user_id)
+        TODO_CACHE.invalidate(user_id)
 
         return Todo(
             id=created_todo["id"],
@@ -212,43 +1790,191 @@ async def create_todo(todo: TodoCreate, user_id: int = Depends(verify_token)):
             user_id=created_todo["user_id"],
             created_at=str(created_todo["created_at"]),
         )
-    finally:
-        cursor.close()
-        conn.close()
+
+
+class TodoFilters(NamedTuple):
+    completed: Optional[bool] = None
+    search: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    sort: str = "-created_at"
+    limit: Optional[int] = None
+    offset: int = 0
+
+
+def build_todos_query(user_id: int, filters: TodoFilters):
+    """Build the GET /todos query; every predicate is served by an index"""
+    conditions = ["user_id = %s", LIVE_TODO]
+    params = [user_id]
+    if filters.completed is not None:
+        conditions.append("completed = %s")
+        params.append(filters.completed)
+    if filters.search:
+        conditions.append(
+            f"search_vector @@ websearch_to_tsquery('{TODO_SEARCH_CONFIG}', %s)"
+        )
+        params.append(filters.search)
+    if filters.created_after is not None:
+        conditions.append("created_at >= %s")
+        params.append(filters.created_after)
+    if filters.created_before is not None:
+        conditions.append("created_at < %s")
+        params.append(filters.created_before)
+
+    query = (
+        f"SELECT {TODO_COLUMNS} FROM todos WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {TODO_SORT_ORDERS[filters.sort]}"
+    )
+    if filters.limit is not None:
+        query += " LIMIT %s"
+        params.append(filters.limit)
+    if filters.offset:
+        query += " OFFSET %s"
+        params.append(filters.offset)
+    return query, params
+
+
+def fetch_todos(user_id: int, filters: TodoFilters = TodoFilters()):
+    with DATABASE.checkout(read=True, owner=user_id) as (_, cursor):
+        cursor.execute(*build_todos_query(user_id, filters))
+        return cursor.fetchall()
+
+
+# Keyed by the user's latest invalidation too: a read after a write on this
+# pod never joins a query that started before it
+TODOS_FLIGHT = SingleFlight(
+    "get_todos",
+    key_func=lambda user_id, filters: (
+        user_id,
+        filters,
+        TODO_CACHE.invalidated_at(user_id),
+    ),
+    timeout=SINGLE_FLIGHT_TIMEOUT,
+)
+
+
+def fetch_todo_listing(user_id: int) -> tuple:
+    """(monotonic time the query started, rows) of the default listing
+
+    The time travels with the rows, so every caller sharing one coalesced
+    query hands TODO_CACHE.put the time the rows were actually read.
+    """
+    fetched_at = time.monotonic()
+    return fetched_at, fetch_todos(user_id)
+
+
+TODO_LISTING_FLIGHT = SingleFlight(
+    "get_todo_listing",
+    key_func=lambda user_id: (user_id, TODO_CACHE.invalidated_at(user_id)),
+    timeout=SINGLE_FLIGHT_TIMEOUT,
+)
 
 
 @app.get("/todos", response_model=List[Todo])
-async def get_todos(user_id: int = Depends(verify_token)):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+async def get_todos(
+    user_id: int = Depends(verify_token),
+    completed: Optional[bool] = None,
+    q: Optional[str] = Query(None, max_length=200, description="Full-text search"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    sort: str = Query("-created_at", pattern="^-?(created_at|title)$"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    filters = TodoFilters(
+        completed, q, created_after, created_before, sort, limit, offset
+    )
+    if filters == TodoFilters() and TODO_CACHE_TTL > 0:
+        # The plain listing the frontend polls is served from compact rows
+        cached = TODO_CACHE.get(user_id)
+        headers = None
+        if cached is None:
+            try:
+                fetched_at, rows = await TODO_LISTING_FLIGHT.run(
+                    fetch_todo_listing, user_id
+                )
+            except DatabaseUnavailable:
+                # While the circuit is open an expired listing beats a 503
+                cached = TODO_CACHE.get(user_id, allow_stale=True)
+                if cached is None:
+                    raise
+                headers = STALE_RESPONSE_HEADERS
+            else:
+                cached = TODO_CACHE.put(user_id, rows, fetched_at)
+        return Response(
+            todos_json(cached), media_type="application/json", headers=headers
+        )
+
+    todos = await TODOS_FLIGHT.run(fetch_todos, user_id, filters)
+
+    return [
+        Todo(
+            id=todo["id"],
+            title=todo["title"],
+            description=todo["description"],
+            completed=bool(todo["completed"]),
+            user_id=todo["user_id"],
+            created_at=str(todo["created_at"]),
+        )
+        for todo in todos
+    ]
+
+
+@app.post("/todos/stream/ticket")
+async def issue_stream_ticket(user_id: int = Depends(verify_token)):
+    """A short-lived ticket for opening /todos/stream?ticket="""
+    return {"ticket": create_stream_ticket(user_id), "expires_in": STREAM_TICKET_TTL}
+
+
+# Declared before /todos/{todo_id} so "stream" is not parsed as an id
+@app.get("/todos/stream")
+async def stream_todo_changes(user_id: int = Depends(verify_stream_token)):
+    """Server-Sent Events stream of the current user's todo changes"""
+    queue = CHANGE_FEED.subscribe(user_id)
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Too many open streams")
+
+    async def events():
+        try:
+            yield f"retry: {int(CHANGE_FEED_RECONNECT_DELAY * 1000)}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), CHANGE_FEED_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            CHANGE_FEED.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Declared before /todos/{todo_id} so "stats" is not parsed as an id
+@app.get("/todos/stats", response_model=TodoStats)
+async def get_todo_stats(user_id: int = Depends(verify_token)):
+    """Counts for the current user, read from the trigger-maintained counters"""
+    with DATABASE.checkout(read=True, owner=user_id) as (_, cursor):
         cursor.execute(
-            "SELECT * FROM todos WHERE user_id = %s ORDER BY created_at DESC",
-            (user_id,),
-        )
-        todos = cursor.fetchall()
-
-        return [
-            Todo(
-                id=todo["id"],
-                title=todo["title"],
-                description=todo["description"],
-                completed=bool(todo["completed"]),
-                user_id=todo["user_id"],
-                created_at=str(todo["created_at"]),
-            )
-            for todo in todos
-        ]
-    finally:
-        cursor.close()
-        conn.close()
+            "SELECT total, completed FROM todo_stats WHERE user_id = %s", (user_id,)
+        )
+        stats = cursor.fetchone() or {"total": 0, "completed": 0}
+
+        return TodoStats(
+            total=stats["total"],
+            completed=stats["completed"],
+            pending=stats["total"] - stats["completed"],
+        )
 
 
 @app.get("/todos/{todo_id}", response_model=Todo)
 async def get_todo(todo_id: int, user_id: int = Depends(verify_token)):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    with DATABASE.checkout(read=True, owner=user_id) as (_, cursor):
         cursor.execute(SQL_GET_TODO_BY_ID_AND_USER, (todo_id, user_id))
         todo = cursor.fetchone()
 
@@ -263,18 +1989,13 @@ async def get_todo(todo_id: int, user_id: int = Depends(verify_token)):
             user_id=todo["user_id"],
             created_at=str(todo["created_at"]),
         )
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.put("/todos/{todo_id}", response_model=Todo)
 async def update_todo(
     todo_id: int, todo_update: TodoUpdate, user_id: int = Depends(verify_token)
 ):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    with DATABASE.checkout() as (conn, cursor):
         # Check if todo exists and belongs to user
         cursor.execute(SQL_GET_TODO_BY_ID_AND_USER, (todo_id, user_id))
         existing = cursor.fetchone()
@@ -296,13 +2017,18 @@ async def update_todo(
             values = list(update_data.values()) + [todo_id, user_id]
 
             cursor.execute(
-                f"UPDATE todos SET {set_clause} WHERE id = %s AND user_id = %s", values
+                f"UPDATE todos SET {set_clause} "
+                f"WHERE id = %s AND user_id = %s AND {LIVE_TODO} "
+                f"RETURNING {TODO_COLUMNS}",
+                values,
             )
+            updated_todo = cursor.fetchone()
+            publish_todo_change(cursor, "updated", user_id, todo_id, updated_todo)
             conn.commit()
-
-        # Get updated todo
-        cursor.execute(SQL_GET_TODO_BY_ID_AND_USER, (todo_id, user_id))
-        updated_todo = cursor.fetchone()
+            DATABASE.router.record_write(user_id)
+            TODO_CACHE.invalidate(user_id)
+        else:
+            updated_todo = existing
 
         return Todo(
             id=updated_todo["id"],
@@ -312,59 +2038,111 @@ async def update_todo(
             user_id=updated_todo["user_id"],
             created_at=str(updated_todo["created_at"]),
         )
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.delete("/todos/{todo_id}")
 async def delete_todo(todo_id: int, user_id: int = Depends(verify_token)):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        # Check if todo exists and belongs to user
+    with DATABASE.checkout() as (conn, cursor):
+        # Soft delete; the purge worker removes the row later, off-peak
         cursor.execute(
-            "SELECT id FROM todos WHERE id = %s AND user_id = %s", (todo_id, user_id)
+            "UPDATE todos SET deleted_at = CURRENT_TIMESTAMP "
+            f"WHERE id = %s AND user_id = %s AND {LIVE_TODO} RETURNING id",
+            (todo_id, user_id),
         )
-        existing = cursor.fetchone()
-
-        if not existing:
+        if not cursor.fetchone():
             raise HTTPException(status_code=404, detail=ERROR_TODO_NOT_FOUND)
 
-        cursor.execute(
-            "DELETE FROM todos WHERE id = %s AND user_id = %s", (todo_id, user_id)
-        )
+        publish_todo_change(cursor, "deleted", user_id, todo_id)
         conn.commit()
+        DATABASE.router.record_write(user_id)
+        TODO_CACHE.invalidate(user_id)
 
         return {"message": "Todo deleted successfully"}
-    finally:
-        cursor.close()
-        conn.close()
 
 
-@app.get("/admin/todos", response_model=List[Todo])
-async def get_all_todos(current_user_id: int = Depends(verify_token)):
-    """Admin endpoint to get all todos (requires authentication)"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM todos ORDER BY created_at DESC")
-        todos = cursor.fetchall()
-
-        return [
-            Todo(
-                id=todo["id"],
-                title=todo["title"],
-                description=todo["description"],
-                completed=bool(todo["completed"]),
-                user_id=todo["user_id"],
-                created_at=str(todo["created_at"]),
-            )
-            for todo in todos
-        ]
-    finally:
-        cursor.close()
-        conn.close()
+def fetch_all_todos() -> list:
+    # Runs in the threadpool so the deadline middleware can see a disconnect
+    # and cancel this (unbounded) query while it runs
+    with DATABASE.checkout(read=True) as (_, cursor):
+        cursor.execute(
+            f"SELECT {TODO_COLUMNS} FROM todos WHERE {LIVE_TODO} "
+            "ORDER BY created_at DESC"
+        )
+        return cursor.fetchall()
+
+
+@app.get("/admin/todos", response_model=List[AdminTodo])
+async def get_all_todos(
+    request: Request,
+    enrich: bool = False,
+    current_user_id: int = Depends(verify_token),
+):
+    """Admin endpoint to get all todos (requires authentication)
+
+    With enrich=true each todo also carries its owner's username, resolved
+    with one batch call to user-service rather than one call per user.
+    """
+    todos = await run_in_threadpool(fetch_all_todos)
+    usernames = await fetch_usernames(t["user_id"] for t in todos) if enrich else {}
+    AUDIT.record(
+        "admin.list_todos",
+        user_id=current_user_id,
+        client=client_address(request, TRUSTED_PROXY_HOPS),
+        count=len(todos),
+        enrich=enrich,
+    )
+    return [
+        AdminTodo(
+            id=todo["id"],
+            title=todo["title"],
+            description=todo["description"],
+            completed=bool(todo["completed"]),
+            user_id=todo["user_id"],
+            created_at=str(todo["created_at"]),
+            username=usernames.get(todo["user_id"]),
+        )
+        for todo in todos
+    ]
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILING_MAX_SECONDS),
+    hz: float = Query(100, gt=0, le=1000),
+    idle: bool = False,
+    current_user_id: int = Depends(verify_token),
+):
+    """Sample all threads for `seconds` and return folded stacks (opt-in)
+
+    Render with e.g. `flamegraph.pl profile.folded > profile.svg`, or load
+    into speedscope. idle=true keeps threads parked in select()/waits.
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if PROFILE_LOCK.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with PROFILE_LOCK:
+        return await run_in_threadpool(profile_stacks, seconds, hz, idle)
+
+
+@app.get("/admin/todos/stats", response_model=AdminTodoStats)
+async def get_all_todo_stats(current_user_id: int = Depends(verify_token)):
+    """Admin-wide counts from the trigger-maintained totals, a fixed number of
+    rows whatever the number of users or todos"""
+    with DATABASE.checkout(read=True) as (_, cursor):
+        cursor.execute(
+            "SELECT coalesce(sum(users), 0) AS users, "
+            "coalesce(sum(total), 0) AS total, "
+            "coalesce(sum(completed), 0) AS completed FROM todo_stats_totals"
+        )
+        stats = cursor.fetchone()
+
+        return AdminTodoStats(
+            users=stats["users"],
+            total=stats["total"],
+            completed=stats["completed"],
+            pending=stats["total"] - stats["completed"],
+        )
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,9 +1,81 @@
-from unittest.mock import MagicMock, patch
-
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
 import pytest
-from app import ALGORITHM, SECRET_KEY, app
+from app import (
+    ADMISSION,
+    ALGORITHM,
+    DATABASE,
+    NOTIFY_PAYLOAD_LIMIT,
+    OUTBOX,
+    ROUTE_DEADLINE_SETTINGS,
+    SECRET_KEY,
+    TODO_LISTING_FLIGHT,
+    USER_SERVICE_CLIENT,
+    ChangeFeedHub,
+    CompactTodo,
+    InMemoryBrokerSink,
+    JWKSCache,
+    OutboxDispatcher,
+    ServiceClient,
+    Todo,
+    TodoFilters,
+    TodoListCache,
+    TodoPurger,
+    UserDirectory,
+    WebhookSink,
+    WriteBatcher,
+    app,
+    build_todos_query,
+    create_outbox_sink,
+    create_stream_ticket,
+    fetch_todo_listing,
+    in_purge_window,
+    insert_todo_batch,
+    parse_purge_windows,
+    partitioned_todos_ddl,
+    stream_todo_changes,
+    todo_change_payload,
+    todos_json,
+)
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi.testclient import TestClient
-from jose import jwt
+from jose import jwk, jwt
+from prometheus_client import REGISTRY
+from psycopg2 import DataError, OperationalError
+from psycopg2.errors import AdminShutdown, DeadlockDetected, QueryCanceled
+
+from service_core import (
+    REQUEST_CONNECTIONS,
+    REQUEST_DEADLINE,
+    REQUEST_WRITE_PIN,
+    AuditLog,
+    CircuitBreaker,
+    ConcurrencyLimiter,
+    ContinuousProfiler,
+    DatabaseHealth,
+    DatabaseUnavailable,
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    IdempotencyStore,
+    InMemoryIdempotencyBackend,
+    InMemoryRateLimitBackend,
+    LoadShedder,
+    LoopWatchdog,
+    PostgresIdempotencyBackend,
+    ReadRouter,
+    SharedRateLimitBackend,
+    SingleFlight,
+    WritePin,
+    is_connection_error,
+    profile_stacks,
+)
 
 
 @pytest.fixture
@@ -29,6 +101,60 @@ def mock_db():
     return MockDB()
 
 
+@pytest.fixture(autouse=True)
+def admission_limits():
+    """Fresh rate limit and concurrency state for each test"""
+    rate_limiter = InMemoryRateLimitBackend(rate=20, burst=40)
+    concurrency_limiter = ConcurrencyLimiter({}, default_limit=64, queue_timeout=2)
+    with patch.object(ADMISSION, "rate_limiter", rate_limiter), patch.object(
+        ADMISSION, "concurrency_limiter", concurrency_limiter
+    ):
+        yield rate_limiter, concurrency_limiter
+
+
+@pytest.fixture(autouse=True)
+def todo_cache():
+    """Empty todo list cache for each test"""
+    cache = TodoListCache(max_users=100, ttl=60)
+    with patch("app.TODO_CACHE", cache):
+        yield cache
+
+
+class FakeRedis:
+    """Minimal async stand-in for the redis commands the shared backend uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+
+    def _expire_stale(self, key):
+        if key in self.expiry and self.expiry[key] <= time.monotonic():
+            self.values.pop(key, None)
+            self.expiry.pop(key, None)
+
+    async def incr(self, key):
+        self._expire_stale(key)
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    async def pexpire(self, key, milliseconds):
+        self.expiry[key] = time.monotonic() + milliseconds / 1000
+
+    async def pttl(self, key):
+        self._expire_stale(key)
+        if key not in self.expiry:
+            return -1
+        return int((self.expiry[key] - time.monotonic()) * 1000)
+
+
+@pytest.fixture
+def db_health():
+    """Fresh cached readiness state for each test"""
+    health = DatabaseHealth(failure_threshold=3, error_window=60)
+    with patch.object(DATABASE, "health", health):
+        yield health
+
+
 @pytest.fixture
 def auth_headers():
     """Create valid JWT token for testing"""
@@ -49,11 +175,15 @@ class TestHealthCheck:
         assert response.status_code == 200
         assert response.json() == {"status": "healthy", "service": "todo-service"}
 
-    def test_ready_endpoint_success(self, client, mock_db):
-        """Test /ready endpoint when database is available"""
-        with patch("app.get_db", return_value=mock_db.conn):
+    def test_ready_endpoint_success(self, client, mock_db, db_health):
+        """Test /ready endpoint after a successful background check"""
+        with patch.object(
+            DATABASE, "connect", return_value=mock_db.conn
+        ) as mock_get_db:
             # Mock successful DB query
             mock_db.cursor.fetchone.return_value = (1,)
+            DATABASE.check()
+            mock_db.cursor.execute.assert_called_once_with("SELECT 1")
 
             response = client.get("/ready")
             assert response.status_code == 200
@@ -61,13 +191,38 @@ class TestHealthCheck:
             assert data["status"] == "ready"
             assert data["service"] == "todo-service"
             assert data["database"] == "connected"
+            assert data["pool"]["max"] > 0
+
+            # The probe itself is served from the cached state
+            assert mock_get_db.call_count == 1
+
+    def test_ready_endpoint_before_first_check(self, client, db_health):
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["detail"]["status"] == "not_ready"
+
+    def test_ready_endpoint_tolerates_transient_failure(
+        self, client, mock_db, db_health
+    ):
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            DATABASE.check()
+        with patch.object(
+            DATABASE, "connect", side_effect=Exception("Database connection failed")
+        ):
+            DATABASE.check()
+
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["consecutive_failures"] == 1
 
-            # Verify DB query was called
-            mock_db.cursor.execute.assert_called_once_with("SELECT 1")
-
-    def test_ready_endpoint_db_failure(self, client):
+    def test_ready_endpoint_db_failure(self, client, db_health):
         """Test /ready endpoint when database is unavailable"""
-        with patch("app.get_db", side_effect=Exception("Database connection failed")):
+        with patch.object(
+            DATABASE, "connect", side_effect=Exception("Database connection failed")
+        ):
+            for _ in range(db_health.failure_threshold):
+                DATABASE.check()
+
             response = client.get("/ready")
             assert response.status_code == 503
             data = response.json()
@@ -75,9 +230,133 @@ class TestHealthCheck:
             assert data["detail"]["database"] == "disconnected"
             assert "Database connection failed" in data["detail"]["error"]
 
+    def test_failed_schema_init_keeps_pod_not_ready(self, client, mock_db, db_health):
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            DATABASE.check()
+        migrate = MagicMock(side_effect=[RuntimeError("migration failed"), None])
+
+        with patch.object(DATABASE, "schema_error", None):
+            assert DATABASE.init_schema(migrate) is False
+            response = client.get("/ready")
+            assert response.status_code == 503
+            assert response.json()["detail"]["database"] == "schema_failed"
+            assert response.json()["detail"]["error"] == "migration failed"
+
+            assert DATABASE.init_schema(migrate) is True
+            assert client.get("/ready").status_code == 200
+
+    def test_ready_endpoint_reports_query_error_rate(self, client, mock_db, db_health):
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            DATABASE.check()
+        db_health.record_query()
+        db_health.record_query(failed=True)
+
+        response = client.get("/ready")
+        assert response.json()["query_error_rate"] == 0.5
+
+
+def tripped_breaker(reset_timeout=30):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+class TestDatabaseCircuitBreaker:
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        breaker.record_failure()
+        with pytest.raises(DatabaseUnavailable) as raised:
+            breaker.before_call()
+        assert 29 < raised.value.retry_after <= 30
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = tripped_breaker()
+        breaker.opened_at -= 30
+
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(DatabaseUnavailable):
+            breaker.before_call()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_call()
+
+    def test_failed_probe_reopens(self):
+        breaker = tripped_breaker()
+        breaker.opened_at -= 30
+        breaker.before_call()
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(DatabaseUnavailable):
+            breaker.before_call()
+
+    def test_only_connection_errors_count(self):
+        assert is_connection_error(OperationalError("connection refused"))
+        assert is_connection_error(AdminShutdown())
+        assert not is_connection_error(DeadlockDetected())
+        assert not is_connection_error(QueryCanceled())
+
+    def test_open_circuit_returns_503(self, client, auth_headers):
+        breaker = tripped_breaker()
+        with patch.object(DATABASE, "breaker", breaker), patch.object(
+            DATABASE, "connect", side_effect=breaker.before_call
+        ):
+            response = client.get("/todos?completed=true", headers=auth_headers)
+
+        assert response.status_code == 503
+        assert response.json() == {"detail": "Database unavailable"}
+        assert int(response.headers["Retry-After"]) >= 1
+
+    def test_open_circuit_serves_expired_cached_listing(
+        self, client, mock_db, auth_headers, todo_cache
+    ):
+        mock_db.cursor.fetchall.return_value = [
+            {
+                "id": 1,
+                "title": "Test Todo",
+                "description": None,
+                "completed": False,
+                "user_id": 1,
+                "created_at": datetime(2024, 1, 1, 12, 0),
+            }
+        ]
+        todo_cache.ttl = 0
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            assert client.get("/todos", headers=auth_headers).status_code == 200
+
+        breaker = tripped_breaker()
+        with patch.object(DATABASE, "breaker", breaker), patch.object(
+            DATABASE, "connect", side_effect=breaker.before_call
+        ):
+            response = client.get("/todos", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()[0]["title"] == "Test Todo"
+        assert "Stale" in response.headers["Warning"]
+
+    def test_open_circuit_makes_pod_not_ready(self, client, mock_db, db_health):
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            DATABASE.check()
+        with patch.object(DATABASE, "breaker", tripped_breaker()):
+            response = client.get("/ready")
+
+        assert response.status_code == 503
+        assert response.json()["detail"]["circuit"] == "open"
+
 
 class TestTodoCreation:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_create_todo_success(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -117,8 +396,219 @@ class TestTodoCreation:
         assert response.status_code == 401
 
 
+@pytest.fixture
+def idempotency_store():
+    store = IdempotencyStore(InMemoryIdempotencyBackend(), ttl=60)
+    with patch("app.IDEMPOTENCY", store):
+        yield store
+
+
+class TestIdempotency:
+    todo = {
+        "id": 1,
+        "title": "Test Todo",
+        "description": None,
+        "completed": False,
+        "user_id": 1,
+        "created_at": "2024-01-01 12:00:00",
+    }
+
+    @patch.object(DATABASE, "connect")
+    def test_retry_replays_without_touching_the_database(
+        self, mock_get_db, client, mock_db, auth_headers, idempotency_store
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = self.todo
+        headers = {**auth_headers, "Idempotency-Key": "abc"}
+
+        first = client.post("/todos", json={"title": "Test Todo"}, headers=headers)
+        retry = client.post("/todos", json={"title": "Test Todo"}, headers=headers)
+
+        assert retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert mock_get_db.call_count == 1
+
+    @patch.object(DATABASE, "connect")
+    def test_key_reused_for_different_body_is_rejected(
+        self, mock_get_db, client, mock_db, auth_headers, idempotency_store
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = self.todo
+        headers = {**auth_headers, "Idempotency-Key": "abc"}
+
+        client.post("/todos", json={"title": "Test Todo"}, headers=headers)
+        response = client.post("/todos", json={"title": "Other"}, headers=headers)
+
+        assert response.status_code == 422
+        assert mock_get_db.call_count == 1
+
+    @patch.object(DATABASE, "connect")
+    def test_server_errors_are_not_stored(
+        self, mock_get_db, client, mock_db, auth_headers, idempotency_store
+    ):
+        mock_get_db.side_effect = [RuntimeError("db down"), mock_db.conn]
+        mock_db.cursor.fetchone.return_value = self.todo
+        headers = {**auth_headers, "Idempotency-Key": "abc"}
+
+        with pytest.raises(RuntimeError):
+            client.post("/todos", json={"title": "Test Todo"}, headers=headers)
+        response = client.post("/todos", json={"title": "Test Todo"}, headers=headers)
+
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+
+    @pytest.mark.asyncio
+    async def test_store_is_bounded_and_entries_expire(self):
+        backend = InMemoryIdempotencyBackend(max_keys=2)
+        store = IdempotencyStore(backend, ttl=60)
+        for key in ("a", "b", "c"):
+            await store.run(key, "fp", AsyncMock(return_value={"id": key}))
+        assert list(backend._entries) == [(0, "b"), (0, "c")]
+
+        backend._entries[(0, "b")]["expires_at"] = time.monotonic() - 1
+        handler = AsyncMock(return_value={"id": "b2"})
+        assert await store.run("b", "fp", handler) == {"id": "b2"}
+        handler.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_replicas_sharing_a_backend_run_the_handler_once(self):
+        backend = InMemoryIdempotencyBackend()
+        pod_a, pod_b = IdempotencyStore(backend, 60), IdempotencyStore(backend, 60)
+        handler = AsyncMock(return_value={"id": 1})
+
+        assert await pod_a.run("abc", "fp", handler, user_id=1) == {"id": 1}
+        retry = await pod_b.run("abc", "fp", handler, user_id=1)
+        other_user = await pod_b.run("abc", "fp", handler, user_id=2)
+
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert json.loads(retry.body) == {"id": 1}
+        assert other_user == {"id": 1}
+        assert handler.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_claim_of_a_dead_replica_is_taken_over_after_the_lock(self):
+        backend = InMemoryIdempotencyBackend()
+        # The pod that claimed the key died before storing a response
+        backend.claim(1, "abc", "fp", ttl=60, lock_timeout=60)
+        store = IdempotencyStore(backend, ttl=60)
+        handler = AsyncMock(return_value={"id": 1})
+
+        in_flight = await store.run("abc", "fp", handler, user_id=1)
+        backend._entries[(1, "abc")]["locked_until"] = time.monotonic() - 1
+        taken_over = await store.run("abc", "fp", handler, user_id=1)
+
+        assert in_flight.status_code == 409
+        assert taken_over == {"id": 1}
+        handler.assert_awaited_once()
+
+    def test_postgres_backend_returns_the_entry_holding_the_key(self, mock_db):
+        stored = {"fingerprint": "fp", "status_code": 200, "body": {"id": 1}}
+        mock_db.cursor.fetchone.side_effect = [None, stored]
+        backend = PostgresIdempotencyBackend(DATABASE, purge_interval=3600)
+
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            assert backend.claim(1, "abc", "fp", ttl=60, lock_timeout=60) == stored
+            mock_db.cursor.fetchone.side_effect = [{"claimed": True}]
+            assert backend.claim(1, "def", "fp", ttl=60, lock_timeout=60) is None
+
+        claim = mock_db.cursor.execute.call_args_list[0]
+        assert "ON CONFLICT (user_id, key)" in claim.args[0]
+        assert claim.args[1]["user_id"] == 1
+        assert mock_db.conn.commit.call_count == 2
+
+
+class TestWriteBatching:
+    @staticmethod
+    def rows_for(items):
+        return [{"id": index, "item": item} for index, item in enumerate(items)]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_share_one_batch(self):
+        write_batch = MagicMock(side_effect=self.rows_for)
+        batcher = WriteBatcher(write_batch, max_size=10, max_delay=0.01)
+
+        rows = await asyncio.gather(*(batcher.submit(i) for i in "abc"))
+
+        write_batch.assert_called_once_with(["a", "b", "c"])
+        assert [row["item"] for row in rows] == ["a", "b", "c"]
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_written_without_waiting(self):
+        write_batch = MagicMock(side_effect=self.rows_for)
+        batcher = WriteBatcher(write_batch, max_size=2, max_delay=10)
+
+        rows = await asyncio.wait_for(
+            asyncio.gather(batcher.submit("a"), batcher.submit("b")), timeout=1
+        )
+
+        assert [row["item"] for row in rows] == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_retried_item_by_item(self):
+        def write_batch(items):
+            if len(items) > 1 or items == ["bad"]:
+                raise DataError("value too long")
+            return self.rows_for(items)
+
+        batcher = WriteBatcher(write_batch, max_size=10, max_delay=0.01)
+
+        results = await asyncio.gather(
+            batcher.submit("a"), batcher.submit("bad"), return_exceptions=True
+        )
+
+        assert results[0]["item"] == "a"
+        assert isinstance(results[1], DataError)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "error",
+        [OperationalError("connection lost"), DatabaseUnavailable(retry_after=1)],
+    )
+    async def test_batch_lost_to_an_outage_is_not_retried_row_by_row(self, error):
+        write_batch = MagicMock(side_effect=error)
+        batcher = WriteBatcher(write_batch, max_size=10, max_delay=0.01)
+
+        results = await asyncio.gather(
+            batcher.submit("a"), batcher.submit("b"), return_exceptions=True
+        )
+
+        assert all(result is error for result in results)
+        write_batch.assert_called_once()
+
+    @patch.object(DATABASE, "connect")
+    def test_batch_insert_returns_rows_in_caller_order(self, mock_get_db, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = [{"id": 7}, {"id": 8}]
+        returned = [
+            {**TestIdempotency.todo, "id": 8, "title": "second"},
+            {**TestIdempotency.todo, "id": 7, "title": "first"},
+        ]
+
+        with patch("app.psycopg2.extras.execute_values", return_value=returned) as ev:
+            rows = insert_todo_batch([("first", None, 1), ("second", None, 1)])
+
+        assert [row["title"] for row in rows] == ["first", "second"]
+        assert ev.call_args.args[2] == [(7, "first", None, 1), (8, "second", None, 1)]
+        mock_db.conn.commit.assert_called_once()
+
+    def test_create_todo_goes_through_the_batcher(self, client, auth_headers):
+        batcher = MagicMock()
+        batcher.submit = AsyncMock(return_value=TestIdempotency.todo)
+
+        with patch("app.WRITE_BATCHING_ENABLED", True), patch(
+            "app.TODO_WRITE_BATCHER", batcher
+        ):
+            response = client.post(
+                "/todos", json={"title": "Test Todo"}, headers=auth_headers
+            )
+
+        assert response.status_code == 200
+        batcher.submit.assert_awaited_once_with(("Test Todo", None, 1))
+
+
 class TestTodoRetrieval:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_get_todos_success(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -150,7 +640,7 @@ class TestTodoRetrieval:
         assert data[0]["title"] == "Todo 1"
         assert data[1]["completed"] is True
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_get_single_todo_success(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -171,7 +661,7 @@ class TestTodoRetrieval:
         assert data["id"] == 1
         assert data["title"] == "Test Todo"
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_get_todo_not_found(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock - todo not found
         mock_get_db.return_value = mock_db.conn
@@ -183,8 +673,170 @@ class TestTodoRetrieval:
         assert "Todo not found" in response.json()["detail"]
 
 
+class TestTodoListCache:
+    rows = [
+        {
+            "id": 2,
+            "title": 'Caf\u00e9 "run"',
+            "description": None,
+            "completed": True,
+            "user_id": 1,
+            "created_at": datetime(2024, 1, 2, 9, 30, 0, 250000),
+        },
+        {
+            "id": 1,
+            "title": "Test Todo",
+            "description": "Line\nbreak",
+            "completed": False,
+            "user_id": 1,
+            "created_at": datetime(2024, 1, 1, 12, 0),
+        },
+    ]
+
+    def test_compact_rows_render_the_same_json_as_the_model(self):
+        todos = [CompactTodo.from_row(row) for row in self.rows]
+        expected = [
+            Todo(**{**row, "created_at": str(row["created_at"])}).model_dump()
+            for row in self.rows
+        ]
+
+        assert json.loads(todos_json(todos)) == expected
+        assert todos[0].created_at == 1704187800250000
+
+    @patch.object(DATABASE, "connect")
+    def test_default_listing_is_served_from_cache(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = self.rows
+
+        first = client.get("/todos", headers=auth_headers)
+        second = client.get("/todos", headers=auth_headers)
+
+        assert first.json() == second.json()
+        assert [todo["id"] for todo in second.json()] == [2, 1]
+        assert mock_get_db.call_count == 1
+
+    @patch.object(DATABASE, "connect")
+    def test_writes_invalidate_the_users_listing(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = self.rows
+        mock_db.cursor.fetchone.return_value = {"id": 1}
+
+        client.get("/todos", headers=auth_headers)
+        client.delete("/todos/1", headers=auth_headers)
+        client.get("/todos", headers=auth_headers)
+
+        assert mock_get_db.call_count == 3
+
+    def test_listing_fetched_before_an_invalidation_is_not_stored(self):
+        cache = TodoListCache(max_users=10, ttl=60)
+        fetched_at = time.monotonic()
+        cache.invalidate(1)
+
+        cache.put(1, self.rows, fetched_at)
+
+        assert cache.get(1) is None
+
+    @pytest.mark.asyncio
+    async def test_read_after_an_invalidation_does_not_join_an_older_query(
+        self, todo_cache
+    ):
+        query_started = threading.Event()
+        finish_query = threading.Event()
+        calls = []
+
+        def fetch(user_id, filters=None):
+            calls.append(user_id)
+            query_started.set()
+            finish_query.wait(1)
+            return self.rows
+
+        with patch("app.fetch_todos", fetch):
+            leader = asyncio.ensure_future(
+                TODO_LISTING_FLIGHT.run(fetch_todo_listing, 1)
+            )
+            await asyncio.get_running_loop().run_in_executor(
+                None, query_started.wait, 1
+            )
+            # A write lands while the first query is in flight; the next
+            # read must not be handed that query's rows
+            todo_cache.invalidate(1)
+            reader = asyncio.ensure_future(
+                TODO_LISTING_FLIGHT.run(fetch_todo_listing, 1)
+            )
+            await asyncio.sleep(0.01)
+            finish_query.set()
+            (old_at, old_rows), (new_at, new_rows) = await asyncio.gather(
+                leader, reader
+            )
+
+        assert calls == [1, 1]
+        todo_cache.put(1, old_rows, old_at)
+        assert todo_cache.get(1) is None
+        todo_cache.put(1, new_rows, new_at)
+        assert todo_cache.get(1) is not None
+
+
+class TestTodoFiltering:
+    def test_default_query_lists_newest_first(self):
+        query, params = build_todos_query(1, TodoFilters())
+        assert (
+            "WHERE user_id = %s AND deleted_at IS NULL ORDER BY created_at DESC"
+            in query
+        )
+        assert "LIMIT" not in query
+        assert params == [1]
+
+    def test_all_filters_are_parameterized(self):
+        filters = TodoFilters(
+            completed=True,
+            search="groceries -milk",
+            created_after="2024-01-01",
+            created_before="2024-02-01",
+            sort="title",
+            limit=20,
+            offset=40,
+        )
+        query, params = build_todos_query(1, filters)
+
+        assert "completed = %s" in query
+        assert "search_vector @@ websearch_to_tsquery('simple', %s)" in query
+        assert "created_at >= %s AND created_at < %s" in query
+        assert query.endswith("ORDER BY title ASC LIMIT %s OFFSET %s")
+        assert params[:3] == [1, True, "groceries -milk"]
+        assert params[3:] == ["2024-01-01", "2024-02-01", 20, 40]
+
+    @patch.object(DATABASE, "connect")
+    def test_get_todos_passes_query_parameters(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+
+        response = client.get(
+            "/todos?completed=false&q=report&sort=-title&limit=10",
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        query, params = mock_db.cursor.execute.call_args.args
+        assert "completed = %s" in query
+        assert "ORDER BY title DESC" in query
+        assert params == [1, False, "report", 10]
+
+    def test_get_todos_rejects_unknown_sort(self, client, auth_headers):
+        response = client.get("/todos?sort=description", headers=auth_headers)
+        assert response.status_code == 422
+
+    def test_get_todos_rejects_unbounded_limit(self, client, auth_headers):
+        response = client.get("/todos?limit=100000", headers=auth_headers)
+        assert response.status_code == 422
+
+
 class TestTodoUpdate:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_update_todo_success(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -223,7 +875,7 @@ class TestTodoUpdate:
         assert data["title"] == "New Title"
         assert data["completed"] is True
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_update_todo_not_found(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock - todo not found
         mock_get_db.return_value = mock_db.conn
@@ -237,7 +889,7 @@ class TestTodoUpdate:
 
 
 class TestTodoDelete:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_delete_todo_success(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -249,7 +901,7 @@ class TestTodoDelete:
         data = response.json()
         assert "successfully" in data["message"]
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_delete_todo_not_found(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock - todo not found
         mock_get_db.return_value = mock_db.conn
@@ -258,10 +910,73 @@ class TestTodoDelete:
         response = client.delete("/todos/999", headers=auth_headers)
 
         assert response.status_code == 404
+        mock_db.conn.commit.assert_not_called()
+
+    @patch.object(DATABASE, "connect")
+    def test_delete_is_a_single_soft_delete_update(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {"id": 1}
+
+        client.delete("/todos/1", headers=auth_headers)
+
+        query, params = mock_db.cursor.execute.call_args_list[0].args
+        assert query.startswith("UPDATE todos SET deleted_at = CURRENT_TIMESTAMP")
+        assert "deleted_at IS NULL" in query
+        assert params == (1, 1)
+        assert not any(
+            "DELETE FROM todos" in c.args[0]
+            for c in mock_db.cursor.execute.call_args_list
+        )
+
+
+class TestTodoPurge:
+    def test_purge_windows_parse_and_wrap_midnight(self):
+        windows = parse_purge_windows("01:00-05:00, 22:30-00:30")
+        assert windows == [(60, 300), (1350, 30)]
+        assert in_purge_window(windows, datetime(2024, 1, 1, 3, 0))
+        assert in_purge_window(windows, datetime(2024, 1, 1, 23, 0))
+        assert in_purge_window(windows, datetime(2024, 1, 1, 0, 15))
+        assert not in_purge_window(windows, datetime(2024, 1, 1, 12, 0))
+
+    def test_no_windows_means_always_open(self):
+        assert in_purge_window(parse_purge_windows(""), datetime(2024, 1, 1, 12, 0))
+
+    @patch.object(DATABASE, "connect")
+    def test_purge_batch_is_bounded_and_committed(self, mock_get_db, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.rowcount = 25
+
+        purged = TodoPurger(batch_size=25, retention=3600, windows=[]).purge_batch()
+
+        assert purged == 25
+        query, params = mock_db.cursor.execute.call_args.args
+        assert "DELETE FROM todos" in query and "SKIP LOCKED" in query
+        assert "(user_id, id) IN" in query
+        assert params == (3600, 25)
+        mock_db.conn.commit.assert_called_once()
+
+
+class TestPartitioning:
+    def test_ddl_hash_partitions_by_user(self):
+        statements = partitioned_todos_ddl(4)
+
+        assert "PARTITION BY HASH (user_id)" in statements[1]
+        assert "PRIMARY KEY (user_id, id)" in statements[1]
+        assert "nextval('todos_id_seq')" in statements[1]
+        partitions = [s for s in statements if "PARTITION OF todos" in s]
+        assert len(partitions) == 4
+        assert partitions[-1].endswith("(MODULUS 4, REMAINDER 3)")
+
+    def test_per_user_queries_filter_on_the_partition_key(self):
+        query, params = build_todos_query(7, TodoFilters(search="milk", limit=10))
+        assert "user_id = %s" in query
+        assert params[0] == 7
 
 
 class TestAdminEndpoints:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_get_all_todos_admin(self, mock_get_db, client, mock_db, auth_headers):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -293,6 +1008,1075 @@ class TestAdminEndpoints:
         assert data[0]["user_id"] == 1
         assert data[1]["user_id"] == 2
 
+    @patch.object(DATABASE, "connect")
+    def test_records_audit_event(self, mock_get_db, client, mock_db, auth_headers):
+        mock_get_db.return_value = mock_db.conn
+        audit = AuditLog(DATABASE, max_queue=10, batch_size=10, flush_interval=1)
+
+        with patch("app.AUDIT", audit):
+            response = client.get("/admin/todos", headers=auth_headers)
+
+        assert response.status_code == 200
+        (event,) = audit._queue
+        assert event[1:5] == ("admin.list_todos", "success", 1, "testclient")
+        assert event[5] == {"count": 0, "enrich": False}
+
+    @patch.object(DATABASE, "connect")
+    def test_enrich_resolves_usernames_in_one_batch_call(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = [
+            {
+                "id": todo_id,
+                "title": "Todo",
+                "description": None,
+                "completed": False,
+                "user_id": user_id,
+                "created_at": "2024-01-01 12:00:00",
+            }
+            for todo_id, user_id in [(1, 2), (2, 1), (3, 2)]
+        ]
+        user_service = MagicMock()
+        user_service.post = AsyncMock(
+            return_value=MagicMock(
+                json=MagicMock(
+                    return_value=[
+                        {"id": 1, "username": "alice", "email": "a@example.com"},
+                        {"id": 2, "username": "bob", "email": "b@example.com"},
+                    ]
+                )
+            )
+        )
+
+        with patch("app.USER_SERVICE_CLIENT", user_service):
+            response = client.get("/admin/todos?enrich=true", headers=auth_headers)
+
+        assert [todo["username"] for todo in response.json()] == [
+            "bob",
+            "alice",
+            "bob",
+        ]
+        user_service.post.assert_awaited_once_with(
+            "/users/batch", json={"ids": [1, 2]}, idempotent=True
+        )
+
+    @patch.object(DATABASE, "connect")
+    def test_enrichment_failure_still_serves_the_list(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = [
+            {
+                "id": 1,
+                "title": "Todo",
+                "description": None,
+                "completed": False,
+                "user_id": 1,
+                "created_at": "2024-01-01 12:00:00",
+            }
+        ]
+        user_service = MagicMock()
+        user_service.post = AsyncMock(side_effect=httpx.ConnectError("refused"))
+
+        with patch("app.USER_SERVICE_CLIENT", user_service):
+            response = client.get("/admin/todos?enrich=true", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()[0]["username"] is None
+
+    @patch.object(DATABASE, "connect")
+    def test_enrich_through_the_shared_client_retries(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = [
+            {
+                "id": 1,
+                "title": "Todo",
+                "description": None,
+                "completed": False,
+                "user_id": 1,
+                "created_at": "2024-01-01 12:00:00",
+            }
+        ]
+        statuses = iter([503, 200])
+
+        def handler(request):
+            return httpx.Response(
+                next(statuses), json=[{"id": 1, "username": "alice", "email": "a@x"}]
+            )
+
+        # The module-level client, as wired from the environment; only its
+        # transport is replaced
+        transport = httpx.AsyncClient(
+            base_url="http://user-service:8001", transport=httpx.MockTransport(handler)
+        )
+        with patch.object(USER_SERVICE_CLIENT, "client", transport), patch.object(
+            USER_SERVICE_CLIENT, "backoff", 0.001
+        ):
+            response = client.get("/admin/todos?enrich=true", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()[0]["username"] == "alice"
+
+
+def service_client(handler, retries=2, backoff=0.001):
+    return ServiceClient(
+        "http://user-service:8001",
+        timeout=1,
+        max_connections=4,
+        keepalive_expiry=60,
+        retries=retries,
+        backoff=backoff,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+class TestServiceClient:
+    @pytest.mark.asyncio
+    async def test_idempotent_call_is_retried_until_it_succeeds(self):
+        statuses = iter([503, 502, 200])
+        client = service_client(lambda request: httpx.Response(next(statuses)))
+        retries = app_metric(
+            "service_http_retries_total", host="user-service", reason="503"
+        )
+
+        response = await client.get("/users/1")
+
+        assert response.status_code == 200
+        assert app_metric(
+            "service_http_retries_total", host="user-service", reason="503"
+        ) == pytest.approx(retries + 1)
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_the_retry_budget(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(503)
+
+        response = await service_client(handler).get("/users/1")
+
+        assert response.status_code == 503
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_non_idempotent_call_is_retried_only_if_never_sent(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise httpx.ConnectError("refused")
+            return httpx.Response(503)
+
+        response = await service_client(handler).post("/todos", json={})
+
+        assert response.status_code == 503
+        assert len(calls) == 2
+
+        marked = []
+        client = service_client(lambda r: marked.append(r) or httpx.Response(503))
+        await client.post("/users/batch", json={"ids": [1]}, idempotent=True)
+        assert len(marked) == 3
+
+    @pytest.mark.asyncio
+    async def test_no_retry_past_the_request_deadline(self):
+        calls = []
+        client = service_client(
+            lambda request: calls.append(request) or httpx.Response(503), backoff=5
+        )
+        deadline = REQUEST_DEADLINE.set(time.monotonic() + 0.01)
+        try:
+            with patch("app.random.uniform", return_value=1):
+                response = await client.get("/users/1")
+        finally:
+            REQUEST_DEADLINE.reset(deadline)
+
+        assert response.status_code == 503
+        assert len(calls) == 1
+
+
+class TestUserExistence:
+    @pytest.mark.asyncio
+    async def test_answers_are_cached_and_errors_fail_open(self):
+        responses = {"/users/1": 200, "/users/2": 404, "/users/3": 500}
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(responses[request.url.path], json={})
+
+        directory = UserDirectory(service_client(handler, retries=0), 60, 100)
+
+        assert await directory.exists(1)
+        assert not await directory.exists(2)
+        assert await directory.exists(3)
+        assert await directory.exists(1)
+        assert not await directory.exists(2)
+        assert await directory.exists(3)
+        assert calls == ["/users/1", "/users/2", "/users/3", "/users/3"]
+
+    def test_deleted_user_cannot_create_todos(self, client, auth_headers):
+        directory = MagicMock()
+        directory.exists = AsyncMock(return_value=False)
+        with patch("app.USER_EXISTENCE_CHECK", True), patch(
+            "app.USER_DIRECTORY", directory
+        ):
+            response = client.post(
+                "/todos", json={"title": "Test"}, headers=auth_headers
+            )
+
+        assert response.status_code == 401
+        directory.exists.assert_awaited_once_with(1)
+
+
+class TestAdmissionControl:
+    @pytest.mark.asyncio
+    async def test_token_bucket_allows_burst_then_throttles(self):
+        limiter = InMemoryRateLimitBackend(rate=1, burst=2)
+        assert await limiter.acquire("user:1") == 0
+        assert await limiter.acquire("user:1") == 0
+        assert await limiter.acquire("user:1") > 0
+        # Buckets are independent per key
+        assert await limiter.acquire("user:2") == 0
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_evicts_least_recent_keys(self):
+        limiter = InMemoryRateLimitBackend(rate=1, burst=1, max_keys=2)
+        for key in ("ip:a", "ip:b", "ip:c"):
+            await limiter.acquire(key)
+        assert len(limiter._buckets) == 2
+
+    @pytest.mark.asyncio
+    async def test_shared_backend_counts_across_callers(self):
+        redis = FakeRedis()
+        pod_a = SharedRateLimitBackend(redis, rate=1, burst=2)
+        pod_b = SharedRateLimitBackend(redis, rate=1, burst=2)
+        assert await pod_a.acquire("user:1") == 0
+        assert await pod_b.acquire("user:1") == 0
+        retry_after = await pod_a.acquire("user:1")
+        assert 0 < retry_after <= 2
+
+    @pytest.mark.asyncio
+    async def test_shared_backend_fails_open(self):
+        redis = MagicMock()
+        redis.incr.side_effect = ConnectionError("redis down")
+        backend = SharedRateLimitBackend(redis, rate=1, burst=1)
+        assert await backend.acquire("user:1") == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limiter_times_out_queued_requests(self):
+        limiter = ConcurrencyLimiter({"/admin/todos": 1}, 10, queue_timeout=0.01)
+        assert await limiter.acquire("/admin/todos")
+        assert not await limiter.acquire("/admin/todos")
+        limiter.release("/admin/todos")
+        assert await asyncio.wait_for(limiter.acquire("/admin/todos"), 1)
+
+    @patch.object(DATABASE, "connect")
+    def test_rate_limited_request_returns_429(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        with patch.object(
+            ADMISSION, "rate_limiter", InMemoryRateLimitBackend(rate=0.5, burst=1)
+        ):
+            assert client.get("/todos", headers=auth_headers).status_code == 200
+            response = client.get("/todos", headers=auth_headers)
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+    def test_concurrency_limit_returns_503(self, client, auth_headers):
+        limiter = MagicMock(queue_timeout=2)
+        limiter.acquire = AsyncMock(return_value=False)
+        with patch.object(ADMISSION, "concurrency_limiter", limiter):
+            response = client.get("/admin/todos", headers=auth_headers)
+
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        limiter.acquire.assert_called_once_with("/admin/todos")
+
+    def test_health_is_exempt(self, client):
+        with patch.object(
+            ADMISSION, "rate_limiter", InMemoryRateLimitBackend(rate=0.1, burst=1)
+        ):
+            for _ in range(3):
+                assert client.get("/health").status_code == 200
+
+
+class TestRequestDeadlines:
+    def test_connection_outside_a_request_is_untouched(self, mock_db):
+        assert DATABASE.bind_to_request(mock_db.conn) is mock_db.conn
+        mock_db.conn.cursor.assert_not_called()
+
+    def test_statement_timeout_is_the_remaining_budget(self, mock_db):
+        connections = set()
+        deadline = REQUEST_DEADLINE.set(time.monotonic() + 2)
+        tracked = REQUEST_CONNECTIONS.set(connections)
+        try:
+            DATABASE.bind_to_request(mock_db.conn)
+            assert connections == {mock_db.conn}
+            with patch.object(DATABASE, "pool", None):
+                DATABASE.release(mock_db.conn)
+            assert connections == set()
+        finally:
+            REQUEST_DEADLINE.reset(deadline)
+            REQUEST_CONNECTIONS.reset(tracked)
+
+        query, (milliseconds,) = mock_db.cursor.execute.call_args[0]
+        assert query == "SET LOCAL statement_timeout = %s"
+        assert 1900 < milliseconds <= 2000
+
+    def test_expired_deadline_releases_the_connection(self, mock_db):
+        deadline = REQUEST_DEADLINE.set(time.monotonic() - 1)
+        try:
+            with patch.object(DATABASE, "pool", None), pytest.raises(DeadlineExceeded):
+                DATABASE.bind_to_request(mock_db.conn)
+        finally:
+            REQUEST_DEADLINE.reset(deadline)
+        mock_db.cursor.execute.assert_not_called()
+        mock_db.conn.close.assert_called_once()
+
+    @patch.object(DATABASE, "connect")
+    def test_statement_timeout_returns_504(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.execute.side_effect = QueryCanceled()
+
+        response = client.get("/admin/todos", headers=auth_headers)
+
+        assert response.status_code == 504
+        assert response.json() == {"detail": "Request deadline exceeded"}
+
+    def test_deadline_returns_504_and_cancels_the_query(self, client, auth_headers):
+        conn = MagicMock()
+
+        def slow_query():
+            REQUEST_CONNECTIONS.get().add(conn)
+            time.sleep(0.3)
+            return []
+
+        with patch("app.fetch_all_todos", slow_query), patch.dict(
+            ROUTE_DEADLINE_SETTINGS, {"/admin/todos": 0.05}
+        ):
+            response = client.get("/admin/todos", headers=auth_headers)
+
+        assert response.status_code == 504
+        conn.cancel.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_client_disconnect_cancels_the_query(self):
+        conn = MagicMock()
+        handler_started = asyncio.Event()
+        client_gone = asyncio.Event()
+
+        async def handler(scope, receive, send):
+            REQUEST_CONNECTIONS.get().add(conn)
+            handler_started.set()
+            await asyncio.sleep(10)
+
+        async def receive():
+            if not handler_started.is_set():
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await client_gone.wait()
+            return {"type": "http.disconnect"}
+
+        send = AsyncMock()
+        scope = {"type": "http", "method": "GET", "path": "/todos", "root_path": ""}
+        call = asyncio.ensure_future(DeadlineMiddleware(handler)(scope, receive, send))
+        await asyncio.wait_for(handler_started.wait(), 1)
+        client_gone.set()
+        await asyncio.wait_for(call, 1)
+
+        conn.cancel.assert_called_once()
+        send.assert_not_called()
+
+    def test_streaming_route_has_no_deadline(self):
+        assert ROUTE_DEADLINE_SETTINGS["/todos/stream"] == 0
+
+
+class TestProfiling:
+    def test_profile_returns_folded_stacks(self):
+        sleeper = threading.Thread(target=time.sleep, args=(0.2,), name="sleeper")
+        sleeper.start()
+        folded = profile_stacks(0.05, hz=200, include_idle=True)
+        sleeper.join()
+
+        lines = folded.splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+            assert stack.startswith("thread ")
+        assert any(line.startswith("thread sleeper;") for line in lines)
+
+    def test_continuous_profiler_credits_the_route(self, client, mock_db, auth_headers):
+        profiler = ContinuousProfiler(hz=10)
+
+        def get_db_while_sampled():
+            sampler = threading.Thread(target=profiler.sample)
+            sampler.start()
+            sampler.join()
+            return mock_db.conn
+
+        route_cpu = app_metric("route_cpu_seconds_total", route="/todos/{todo_id}")
+        with patch.object(DATABASE, "connect", side_effect=get_db_while_sampled):
+            client.get("/todos/1", headers=auth_headers)
+
+        assert app_metric(
+            "route_cpu_seconds_total", route="/todos/{todo_id}"
+        ) == pytest.approx(route_cpu + 0.1)
+
+    def test_profile_endpoint_is_opt_in(self, client, auth_headers):
+        assert client.get("/admin/profile", headers=auth_headers).status_code == 404
+
+        with patch("app.PROFILING_ENABLED", True):
+            response = client.get(
+                "/admin/profile?seconds=0.05&hz=100&idle=true", headers=auth_headers
+            )
+            unauthenticated = client.get("/admin/profile")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.text.startswith("thread ")
+        assert unauthenticated.status_code in (401, 403)
+
+
+class TestLoopWatchdog:
+    def test_punctual_loop_is_not_reported(self):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+        assert watchdog.check() is None
+        watchdog.beat()
+        assert watchdog.check() is None
+
+    def test_blocking_handler_is_reported_with_stack_and_route(
+        self, client, mock_db, auth_headers
+    ):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+
+        def blocking_get_db():
+            watchdog.beat()  # on the loop thread, like monitor_event_loop_lag
+            checks = [threading.Timer(0.1, watchdog.check) for _ in range(2)]
+            for check in checks:
+                check.start()
+            time.sleep(0.2)
+            return mock_db.conn
+
+        blocked = app_metric("event_loop_blocked_total", route="/todos/{todo_id}")
+        with patch.object(DATABASE, "connect", side_effect=blocking_get_db):
+            client.get("/todos/1", headers=auth_headers)
+
+        route, stack = watchdog.last_report
+        assert route == "/todos/{todo_id}"
+        assert "blocking_get_db" in stack
+        # Two checks during one stall, one report
+        assert app_metric(
+            "event_loop_blocked_total", route="/todos/{todo_id}"
+        ) == pytest.approx(blocked + 1)
+
+
+def app_metric(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def overloaded_shedder(level):
+    shedder = LoadShedder(lag_target=0.05, db_target=0.1, interval=0)
+    shedder.record_lag(0.05 * (1.5 if level == 1 else 3))
+    assert shedder.level == level
+    return shedder
+
+
+class TestLoadShedding:
+    def test_standing_lag_raises_level(self):
+        shedder = LoadShedder(lag_target=0.05, db_target=0.1, interval=0)
+        shedder.record_lag(0.01)
+        assert shedder.level == 0
+        shedder.record_lag(0.08)
+        assert shedder.level == 1
+        shedder.record_db_latency(0.5)
+        assert shedder.level == 2
+
+    def test_short_spike_within_interval_is_ignored(self):
+        shedder = LoadShedder(lag_target=0.05, db_target=0.1, interval=0.05)
+        shedder.record_lag(0.5)
+        shedder.record_lag(0.001)
+        time.sleep(0.06)
+        shedder.record_lag(0.5)
+        # Minimum over the interval was below target
+        assert shedder.level == 0
+
+    def test_level_one_sheds_listing_and_admin_only(self, client, auth_headers):
+        with patch.object(ADMISSION, "shedder", overloaded_shedder(1)), patch.object(
+            DATABASE, "connect"
+        ) as mock_get_db:
+            mock_get_db.return_value.cursor.return_value.fetchone.return_value = None
+            assert client.get("/todos", headers=auth_headers).status_code == 503
+            assert client.get("/admin/todos", headers=auth_headers).status_code == 503
+            assert client.get("/todos/1", headers=auth_headers).status_code == 404
+            assert client.get("/health").status_code == 200
+
+    def test_level_two_keeps_writes_flowing(self, client, mock_db, auth_headers):
+        mock_db.cursor.fetchone.return_value = {
+            "id": 1,
+            "title": "Test Todo",
+            "description": None,
+            "completed": False,
+            "user_id": 1,
+            "created_at": "2024-01-01 12:00:00",
+        }
+        with patch.object(ADMISSION, "shedder", overloaded_shedder(2)), patch.object(
+            DATABASE, "connect", return_value=mock_db.conn
+        ):
+            response = client.get("/todos/1", headers=auth_headers)
+            assert response.status_code == 503
+            assert "Retry-After" in response.headers
+
+            response = client.post(
+                "/todos", json={"title": "Test Todo"}, headers=auth_headers
+            )
+            assert response.status_code == 200
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_reads_share_one_call(self):
+        flight = SingleFlight("test_share", key_func=lambda key: key, timeout=5)
+        calls = []
+
+        def slow_fetch(key):
+            calls.append(key)
+            time.sleep(0.05)
+            return [{"id": 1, "key": key}]
+
+        results = await asyncio.gather(
+            *(flight.run(slow_fetch, 1) for _ in range(5)), flight.run(slow_fetch, 2)
+        )
+
+        assert calls.count(1) == 1
+        assert calls.count(2) == 1
+        assert results[0] is results[4]
+        assert flight.coalescing_ratio() == pytest.approx(4 / 6)
+
+    @pytest.mark.asyncio
+    async def test_leader_error_is_shared_with_followers(self):
+        flight = SingleFlight("test_error", key_func=lambda key: key, timeout=5)
+
+        def failing_fetch(key):
+            time.sleep(0.02)
+            raise RuntimeError("db down")
+
+        results = await asyncio.gather(
+            *(flight.run(failing_fetch, 1) for _ in range(3)), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.leaders == 1
+
+    @pytest.mark.asyncio
+    async def test_follower_falls_back_after_timeout(self):
+        flight = SingleFlight("test_timeout", key_func=lambda key: key, timeout=0.01)
+        calls = []
+
+        def fetch(key):
+            calls.append(key)
+            time.sleep(0.1 if len(calls) == 1 else 0)
+            return len(calls)
+
+        await asyncio.gather(flight.run(fetch, 1), flight.run(fetch, 1))
+
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_shared_call_has_its_own_deadline_and_connections(self):
+        flight = SingleFlight("test_deadline", key_func=lambda key: key, timeout=5)
+        seen = []
+
+        def fetch(key):
+            seen.append((REQUEST_DEADLINE.get(), REQUEST_CONNECTIONS.get()))
+            return key
+
+        leader_connections = set()
+        deadline = REQUEST_DEADLINE.set(time.monotonic() + 0.01)
+        tracked = REQUEST_CONNECTIONS.set(leader_connections)
+        try:
+            assert await flight.run(fetch, 1) == 1
+        finally:
+            REQUEST_DEADLINE.reset(deadline)
+            REQUEST_CONNECTIONS.reset(tracked)
+
+        [(shared_deadline, shared_connections)] = seen
+        assert shared_deadline - time.monotonic() == pytest.approx(5, abs=0.5)
+        assert shared_connections is not None
+        assert shared_connections is not leader_connections
+
+    @pytest.mark.asyncio
+    async def test_follower_keeps_the_result_when_the_leader_goes_away(self):
+        flight = SingleFlight("test_leader_gone", key_func=lambda key: key, timeout=5)
+        calls = []
+
+        def fetch(key):
+            calls.append(key)
+            time.sleep(0.05)
+            return "rows"
+
+        leader = asyncio.ensure_future(flight.run(fetch, 1))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.run(fetch, 1))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "rows"
+        assert calls == [1]
+
+    @pytest.mark.asyncio
+    async def test_abandoned_shared_call_is_cancelled(self):
+        flight = SingleFlight("test_abandoned", key_func=lambda key: key, timeout=5)
+        conn = MagicMock()
+        started = threading.Event()
+
+        def fetch(key):
+            REQUEST_CONNECTIONS.get().add(conn)
+            started.set()
+            time.sleep(0.1)
+            return key
+
+        leader = asyncio.ensure_future(flight.run(fetch, 1))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 1)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        await asyncio.sleep(0.05)
+
+        conn.cancel.assert_called_once()
+        assert flight._calls == {}
+
+    @patch.object(DATABASE, "connect")
+    def test_get_todos_uses_coalesced_fetch(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        with patch("app.TODOS_FLIGHT") as flight:
+            flight.run = AsyncMock(return_value=[])
+            response = client.get("/todos?limit=10", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert flight.run.call_args.args[1] == 1
+
+    @patch.object(DATABASE, "connect")
+    def test_default_listing_uses_coalesced_fetch(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        with patch("app.TODO_LISTING_FLIGHT") as flight:
+            flight.run = AsyncMock(return_value=(time.monotonic(), []))
+            response = client.get("/todos", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert flight.run.call_args.args[1] == 1
+
+
+class FakePool:
+    """Stand-in for a replica connection pool"""
+
+    def __init__(self, url):
+        self.url = url
+        self.conn = MagicMock()
+        self.conn.cursor.return_value.fetchall.return_value = []
+        self.conn.cursor.return_value.fetchone.return_value = {"lag": 0}
+        self.released = 0
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn):
+        self.released += 1
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def replica_router():
+    router = ReadRouter(
+        ["postgresql://replica-a/tododb", "postgresql://replica-b/tododb"],
+        read_your_writes_window=5,
+        max_lag=10,
+        pool_factory=FakePool,
+    )
+    with patch.object(DATABASE, "router", router):
+        yield router
+
+
+class TestReadReplicaRouting:
+    def test_reads_round_robin_across_replicas(self, replica_router):
+        chosen = {replica_router.choose_replica(owner=1) for _ in range(4)}
+        assert chosen == {0, 1}
+
+    def test_read_your_writes_pins_owner_to_primary(self, replica_router):
+        replica_router.record_write(1)
+        assert replica_router.choose_replica(owner=1) is None
+        assert replica_router.choose_replica(owner=2) is not None
+
+    def test_read_your_writes_window_expires(self, replica_router):
+        replica_router.read_your_writes_window = 0.01
+        replica_router.record_write(1)
+        time.sleep(0.02)
+        assert replica_router.choose_replica(owner=1) is not None
+
+    def test_lagging_replicas_are_skipped(self, replica_router):
+        replica_router.lag[0] = 60
+        assert {replica_router.choose_replica() for _ in range(4)} == {1}
+        replica_router.lag[1] = 60
+        assert replica_router.choose_replica() is None
+
+    def test_check_lag_marks_unreachable_replica(self, replica_router):
+        replica_router.pool(1).getconn = MagicMock(side_effect=Exception("down"))
+        replica_router.check_lag()
+        assert replica_router.lag[0] == 0
+        assert replica_router.lag[1] == float("inf")
+
+    @patch.object(DATABASE, "connect")
+    def test_get_todos_reads_from_replica(
+        self, mock_get_db, client, auth_headers, replica_router
+    ):
+        response = client.get("/todos", headers=auth_headers)
+
+        assert response.status_code == 200
+        mock_get_db.assert_not_called()
+        assert sum(replica_router.pool(i).released for i in (0, 1)) == 1
+
+    @patch.object(DATABASE, "connect")
+    def test_reads_after_write_hit_primary(
+        self, mock_get_db, client, mock_db, auth_headers, replica_router
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {
+            "id": 1,
+            "title": "Test Todo",
+            "description": None,
+            "completed": False,
+            "user_id": 1,
+            "created_at": "2024-01-01 12:00:00",
+        }
+        client.post("/todos", json={"title": "Test Todo"}, headers=auth_headers)
+        response = client.get("/todos/1", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert mock_get_db.call_count == 2
+
+    @patch.object(DATABASE, "connect")
+    def test_write_pin_follows_the_client_to_another_pod(
+        self, mock_get_db, client, mock_db, auth_headers, replica_router
+    ):
+        todo = {
+            "id": 1,
+            "title": "Test Todo",
+            "description": None,
+            "completed": False,
+            "user_id": 1,
+            "created_at": "2024-01-01 12:00:00",
+        }
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = todo
+        created = client.post(
+            "/todos", json={"title": "Test Todo"}, headers=auth_headers
+        )
+        other_pod = ReadRouter(
+            replica_router.replica_urls, 5, max_lag=10, pool_factory=FakePool
+        )
+        for i in (0, 1):
+            other_pod.pool(i).conn.cursor.return_value.fetchone.return_value = todo
+
+        with patch.object(DATABASE, "router", other_pod):
+            # The browser sends the cookie back; API clients echo the header
+            client.get("/todos/1", headers=auth_headers)
+            TestClient(app).get(
+                "/todos/1",
+                headers={
+                    **auth_headers,
+                    "X-Last-Write": created.headers["X-Last-Write"],
+                },
+            )
+            # A client that never wrote still reads from a replica
+            TestClient(app).get("/todos/1", headers=auth_headers)
+
+        assert "last_write" in created.cookies
+        assert mock_get_db.call_count == 3
+        assert sum(other_pod.pool(i).released for i in (0, 1)) == 1
+
+    def test_forged_future_write_pin_is_ignored(self, replica_router):
+        token = REQUEST_WRITE_PIN.set(WritePin(time.time() + 3600))
+        try:
+            assert replica_router.choose_replica(owner=1) is not None
+        finally:
+            REQUEST_WRITE_PIN.reset(token)
+
+
+class TestTodoStats:
+    @patch.object(DATABASE, "connect")
+    def test_user_stats_from_counter_row(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {"total": 5, "completed": 2}
+
+        response = client.get("/todos/stats", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json() == {"total": 5, "completed": 2, "pending": 3}
+        query, params = mock_db.cursor.execute.call_args.args
+        assert "FROM todo_stats WHERE user_id = %s" in query
+        assert params == (1,)
+
+    @patch.object(DATABASE, "connect")
+    def test_user_without_todos_has_zero_stats(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+
+        response = client.get("/todos/stats", headers=auth_headers)
+
+        assert response.json() == {"total": 0, "completed": 0, "pending": 0}
+
+    @patch.object(DATABASE, "connect")
+    def test_admin_stats(self, mock_get_db, client, mock_db, auth_headers):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {
+            "users": 3,
+            "total": 10,
+            "completed": 4,
+        }
+
+        response = client.get("/admin/todos/stats", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "total": 10,
+            "completed": 4,
+            "pending": 6,
+            "users": 3,
+        }
+        query = mock_db.cursor.execute.call_args.args[0]
+        assert "FROM todo_stats_totals" in query
+
+    def test_stats_requires_authentication(self, client):
+        assert client.get("/todos/stats").status_code == 401
+
+
+class TestChangeFeed:
+    def test_dispatch_reaches_only_the_owner(self):
+        hub = ChangeFeedHub(buffer_size=10, max_subscribers=10)
+        mine, theirs = hub.subscribe(1), hub.subscribe(2)
+
+        hub.dispatch({"event": "created", "id": 5, "user_id": 1})
+
+        assert mine.get_nowait()["id"] == 5
+        assert theirs.empty()
+
+    def test_slow_subscriber_gets_resync_instead_of_backlog(self):
+        hub = ChangeFeedHub(buffer_size=2, max_subscribers=10)
+        queue = hub.subscribe(1)
+        for todo_id in range(3):
+            hub.dispatch({"event": "updated", "id": todo_id, "user_id": 1})
+
+        assert queue.qsize() == 1
+        assert queue.get_nowait() == {"event": "resync"}
+
+    def test_subscriber_limit_and_unsubscribe(self):
+        hub = ChangeFeedHub(buffer_size=2, max_subscribers=1)
+        queue = hub.subscribe(1)
+        assert hub.subscribe(2) is None
+        hub.unsubscribe(1, queue)
+        assert hub.subscriber_count == 0
+        assert hub.subscribe(2) is not None
+
+    def test_oversized_payload_drops_todo_body(self):
+        todo = {
+            "id": 1,
+            "title": "Big",
+            "description": "x" * NOTIFY_PAYLOAD_LIMIT,
+            "completed": False,
+            "user_id": 1,
+            "created_at": "2024-01-01 12:00:00",
+        }
+        assert "todo" not in todo_change_payload("created", 1, 1, todo)
+        todo["description"] = "small"
+        assert '"todo"' in todo_change_payload("created", 1, 1, todo)
+
+    @patch.object(DATABASE, "connect")
+    def test_mutations_notify_in_the_same_transaction(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {"id": 1}
+
+        client.delete("/todos/1", headers=auth_headers)
+
+        notify = [
+            c for c in mock_db.cursor.execute.call_args_list if "pg_notify" in c.args[0]
+        ]
+        assert len(notify) == 1
+        assert '"event": "deleted"' in notify[0].args[1][-1]
+        mock_db.conn.commit.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_stream_emits_server_sent_events(self):
+        hub = ChangeFeedHub(buffer_size=10, max_subscribers=10)
+        with patch("app.CHANGE_FEED", hub):
+            response = await stream_todo_changes(user_id=1)
+            events = response.body_iterator
+            assert (await events.__anext__()).startswith("retry:")
+
+            hub.dispatch({"event": "created", "id": 3, "user_id": 1})
+            chunk = await events.__anext__()
+            await events.aclose()
+
+        assert response.media_type == "text/event-stream"
+        assert chunk.startswith("event: created\ndata: ")
+        assert hub.subscriber_count == 0
+
+    def test_stream_accepts_a_ticket_instead_of_the_access_token(
+        self, client, auth_headers
+    ):
+        response = client.post("/todos/stream/ticket", headers=auth_headers)
+        ticket = response.json()["ticket"]
+        access_token = auth_headers["Authorization"][7:]
+
+        with patch("app.CHANGE_FEED", ChangeFeedHub(10, max_subscribers=0)):
+            assert client.get("/todos/stream").status_code == 401
+            assert client.get(f"/todos/stream?ticket={access_token}").status_code == 401
+            assert client.get(f"/todos/stream?token={access_token}").status_code == 401
+            # Authenticated, then rejected by the subscriber limit
+            assert client.get(f"/todos/stream?ticket={ticket}").status_code == 503
+
+    def test_stream_ticket_is_not_an_access_token(self, client):
+        ticket = create_stream_ticket(1)
+
+        response = client.get("/todos", headers={"Authorization": f"Bearer {ticket}"})
+
+        assert response.status_code == 401
+
+    def test_expired_stream_ticket_is_rejected(self, client):
+        with patch("app.STREAM_TICKET_TTL", -1):
+            ticket = create_stream_ticket(1)
+
+        assert client.get(f"/todos/stream?ticket={ticket}").status_code == 401
+
+
+class TestOutbox:
+    @patch.object(DATABASE, "connect")
+    def test_mutation_writes_outbox_row_in_the_same_statement(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {"id": 1}
+
+        with patch.object(OUTBOX, "sink", InMemoryBrokerSink()):
+            client.delete("/todos/1", headers=auth_headers)
+
+        sql, params = mock_db.cursor.execute.call_args_list[-1].args
+        assert "INSERT INTO todo_outbox" in sql and "pg_notify" in sql
+        assert params[:3] == ("deleted", 1, 1)
+        mock_db.conn.commit.assert_called_once()
+
+    @patch.object(DATABASE, "connect")
+    def test_no_outbox_row_without_a_sink(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {"id": 1}
+
+        with patch.object(OUTBOX, "sink", None):
+            client.delete("/todos/1", headers=auth_headers)
+
+        statements = [c.args[0] for c in mock_db.cursor.execute.call_args_list]
+        assert not any("todo_outbox" in sql for sql in statements)
+        assert any("pg_notify" in sql for sql in statements)
+
+    @patch.object(DATABASE, "connect")
+    def test_measure_reports_the_whole_backlog(self, mock_get_db, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {"pending": 42, "age": 12.5}
+        dispatcher = OutboxDispatcher(InMemoryBrokerSink(), batch_size=10)
+
+        dispatcher.measure()
+
+        assert (dispatcher.pending, dispatcher.lag) == (42, 12.5)
+        assert "FROM todo_outbox" in mock_db.cursor.execute.call_args.args[0]
+
+    @patch.object(DATABASE, "connect")
+    def test_drain_sends_batch_then_deletes_it(self, mock_get_db, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = [
+            {
+                "id": 7,
+                "event_type": "created",
+                "todo_id": 3,
+                "user_id": 1,
+                "payload": {"event": "created", "id": 3},
+                "created_at": "2024-01-01T00:00:00",
+                "age": 2.5,
+            }
+        ]
+        sink = InMemoryBrokerSink()
+
+        assert OutboxDispatcher(sink, batch_size=10).drain_once() == 1
+
+        assert [event["id"] for event in sink.events] == [7]
+        delete = mock_db.cursor.execute.call_args_list[-1].args
+        assert delete[0].startswith("DELETE FROM todo_outbox")
+        assert delete[1] == ([7],)
+        mock_db.conn.commit.assert_called_once()
+
+    @patch.object(DATABASE, "connect")
+    def test_failed_send_keeps_rows_for_retry(self, mock_get_db, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = [
+            {
+                "id": 7,
+                "event_type": "created",
+                "todo_id": 3,
+                "user_id": 1,
+                "payload": {},
+                "created_at": "2024-01-01T00:00:00",
+                "age": 0,
+            }
+        ]
+        sink = MagicMock()
+        sink.send.side_effect = RuntimeError("broker down")
+
+        with pytest.raises(RuntimeError):
+            OutboxDispatcher(sink, batch_size=10).drain_once()
+
+        mock_db.conn.rollback.assert_called_once()
+        mock_db.conn.commit.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "sink, url, expected",
+        [
+            ("none", "", type(None)),
+            ("webhook", "", type(None)),
+            ("unknown", "", type(None)),
+            ("webhook", "http://broker.invalid/events", WebhookSink),
+            ("memory", "", InMemoryBrokerSink),
+        ],
+    )
+    def test_outbox_sink_must_be_configured(self, sink, url, expected):
+        with patch("app.OUTBOX_SINK", sink), patch("app.OUTBOX_WEBHOOK_URL", url):
+            assert type(create_outbox_sink()) is expected
+
+    def test_webhook_sink_fails_on_error_status(self):
+        sink = WebhookSink("http://broker.invalid/events", timeout=1)
+        sink.client = MagicMock()
+        sink.client.post.return_value.raise_for_status.side_effect = RuntimeError
+
+        with pytest.raises(RuntimeError):
+            sink.send([{"id": 1}])
+
 
 class TestTokenVerification:
     def test_verify_token_success(self):
@@ -318,6 +2102,68 @@ class TestTokenVerification:
         response = client.get("/todos", headers=headers)
         assert response.status_code == 401
 
+    def rsa_signer(self, kid):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        private = jwk.construct(pem, "RS256")
+        public = {**private.public_key().to_dict(), "kid": kid}
+        return private.to_pem(), public
+
+    @patch.object(DATABASE, "connect")
+    def test_rs256_token_verifies_with_cached_jwks(self, mock_get_db, client, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        pem, public = self.rsa_signer("k1")
+        keys = JWKSCache("http://user-service/.well-known/jwks.json")
+        keys.keys = {"k1": public}
+        keys.client = MagicMock()
+        token = jwt.encode(
+            {"user_id": 1}, pem, algorithm="RS256", headers={"kid": "k1"}
+        )
+
+        with patch("app.TOKEN_KEYS", keys):
+            response = client.get(
+                "/todos", headers={"Authorization": f"Bearer {token}"}
+            )
+
+        assert response.status_code == 200
+        keys.client.get.assert_not_called()
+
+    def test_unknown_kid_refetches_the_key_set_once(self, client):
+        pem, public = self.rsa_signer("k2")
+        keys = JWKSCache("http://user-service/.well-known/jwks.json")
+        keys.client = MagicMock()
+        keys.client.get.return_value.json.return_value = {"keys": [public]}
+        token = jwt.encode(
+            {"user_id": 1}, pem, algorithm="RS256", headers={"kid": "k2"}
+        )
+        forged = jwt.encode(
+            {"user_id": 1}, pem, algorithm="RS256", headers={"kid": "k3"}
+        )
+
+        with patch("app.TOKEN_KEYS", keys), patch.object(DATABASE, "connect"):
+            ok = client.get("/todos", headers={"Authorization": f"Bearer {token}"})
+            unknown = client.get(
+                "/todos", headers={"Authorization": f"Bearer {forged}"}
+            )
+
+        assert ok.status_code == 200
+        assert unknown.status_code == 401
+        # The second unknown kid falls inside the minimum refetch interval
+        keys.client.get.assert_called_once()
+
+    def test_refresh_token_is_not_an_access_token(self, client):
+        token = jwt.encode(
+            {"sub": "testuser", "user_id": 1, "type": "refresh", "jti": "ab" * 16},
+            SECRET_KEY,
+            algorithm=ALGORITHM,
+        )
+        response = client.get("/todos", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -1,65 +1,168 @@
+import asyncio
+import glob
+import heapq
+import logging
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
-import psycopg2
-import psycopg2.extras  # Import extras explicitly for RealDictCursor
-from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from jose import JWTError, jwt
-
-# OpenTelemetry SDK and Instrumentation
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from fastapi.responses import JSONResponse, PlainTextResponse
+from jose import JWTError, jwk, jwt
 from passlib.context import CryptContext
-from prometheus_fastapi_instrumentator import Instrumentator
+from prometheus_client import Counter, Gauge
 from pydantic import BaseModel
 
-# Configure OpenTelemetry SDK
-resource = Resource.create(
-    {
-        "service.name": os.getenv("OTEL_SERVICE_NAME", "user-service"),
-    }
+from service_core import (
+    AdmissionControl,
+    AdmissionMiddleware,
+    AuditLog,
+    CircuitBreaker,
+    ConcurrencyLimiter,
+    ContinuousProfiler,
+    Database,
+    DatabaseHealth,
+    DatabaseUnavailable,
+    DeadlineMiddleware,
+    IdempotencyStore,
+    LoadShedder,
+    LoopWatchdog,
+    PostgresIdempotencyBackend,
+    ReadYourWritesMiddleware,
+    SingleFlight,
+    access_token_user_id,
+    add_exception_handlers,
+    bearer_token,
+    client_address,
+    client_identity,
+    create_rate_limit_backend,
+    instrument_app,
+    monitor_event_loop_lag,
+    parse_route_settings,
+    profile_stacks,
+    request_fingerprint,
+    setup_tracing,
 )
 
-trace.set_tracer_provider(TracerProvider(resource=resource))
-otlp_exporter = OTLPSpanExporter()
-span_processor = BatchSpanProcessor(otlp_exporter)
-trace.get_tracer_provider().add_span_processor(span_processor)
-
-# Enable psycopg2 instrumentation BEFORE any db connections
-Psycopg2Instrumentor().instrument()
-
+# Tracing must be set up before any database connection is made
+setup_tracing("user-service")
 
 app = FastAPI(title="User Service", version="1.0.0")
+logger = logging.getLogger("user-service")
 
-# Enable FastAPI auto-instrumentation
-FastAPIInstrumentor.instrument_app(app)
-
-# Prometheus metrics instrumentation
-Instrumentator().instrument(app).expose(app)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify your frontend domain
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+instrument_app(app)
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# How often each pod deletes revoked_tokens rows whose token has expired
+TOKEN_DENYLIST_PURGE_INTERVAL = float(
+    os.getenv("TOKEN_DENYLIST_PURGE_INTERVAL", "3600")
+)
+
+# Signing keys (RS256 when JWT_KEYS_DIR holds PEM private keys, else HS256)
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "")
+JWT_KEYS_RELOAD_INTERVAL = float(os.getenv("JWT_KEYS_RELOAD_INTERVAL", "60"))
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "true") == "true"
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Database pool and readiness
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "2"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "10"))
+# Seconds a request waits for a free pooled connection before a 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+READINESS_CHECK_INTERVAL = float(os.getenv("READINESS_CHECK_INTERVAL", "5"))
+# A failed schema initialization is retried this often; /ready is 503 meanwhile
+SCHEMA_INIT_RETRY_INTERVAL = float(os.getenv("SCHEMA_INIT_RETRY_INTERVAL", "10"))
+READINESS_FAILURE_THRESHOLD = int(os.getenv("READINESS_FAILURE_THRESHOLD", "3"))
+READINESS_ERROR_WINDOW = int(os.getenv("READINESS_ERROR_WINDOW", "60"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+
+# Database circuit breaker
+DB_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", "5"))
+DB_BREAKER_RESET_TIMEOUT = float(os.getenv("DB_BREAKER_RESET_TIMEOUT", "10"))
+
+# Read replicas (comma-separated DATABASE_READ_URL, empty = primary only)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "10"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "5"))
+
+# Admission control
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true") == "true"
+ADMISSION_EXEMPT_PATHS = {"/health", "/ready", "/metrics"}
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Proxies in front of the service that append to X-Forwarded-For (the
+# ingress counts as one); 0 keys anonymous callers by the peer address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+ROUTE_CONCURRENCY_LIMITS = os.getenv(
+    "ROUTE_CONCURRENCY_LIMITS", "/login=4,/admin/users=2"
+)
+DEFAULT_CONCURRENCY_LIMIT = int(os.getenv("DEFAULT_CONCURRENCY_LIMIT", "64"))
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "2"))
+
+# Load shedding
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "true") == "true"
+SHED_LOOP_LAG_TARGET = float(os.getenv("SHED_LOOP_LAG_TARGET", "0.05"))
+SHED_DB_LATENCY_TARGET = float(os.getenv("SHED_DB_LATENCY_TARGET", "0.1"))
+SHED_INTERVAL = float(os.getenv("SHED_INTERVAL", "1"))
+LOOP_LAG_SAMPLE_INTERVAL = float(os.getenv("LOOP_LAG_SAMPLE_INTERVAL", "0.1"))
+# Loop stalls longer than this are reported with the blocking stack (0 = off)
+BLOCKING_THRESHOLD = float(os.getenv("BLOCKING_THRESHOLD", "0.25"))
+CRITICAL_ROUTES = {
+    "/health",
+    "/ready",
+    "/metrics",
+    "/login",
+    "/register",
+    "/token/refresh",
+    "/.well-known/jwks.json",
+}
+LISTING_ROUTES = {"/admin/users"}
+
+# Request deadlines (seconds per route template, 0 = no deadline)
+ROUTE_DEADLINES = os.getenv("ROUTE_DEADLINES", "/admin/users=15,/admin/profile=0")
+DEFAULT_DEADLINE = float(os.getenv("DEFAULT_DEADLINE", "10"))
+
+# Profiling (opt-in: /admin/profile needs PROFILING_ENABLED, 0 Hz = no sampling)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false") == "true"
+PROFILING_CONTINUOUS_HZ = float(os.getenv("PROFILING_CONTINUOUS_HZ", "0"))
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+
+# Request coalescing
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "5"))
+
+# Batch user lookups
+USER_BATCH_MAX_IDS = int(os.getenv("USER_BATCH_MAX_IDS", "500"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Idempotency keys
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# A claim whose pod died is taken over after this; above the longest deadline
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+
+# Audit log (admin and auth events, written in batches off the request path)
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "true") == "true"
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop_oldest")  # or drop_newest
+AUDIT_RATE_PER_USER = float(os.getenv("AUDIT_RATE_PER_USER", "5"))
+AUDIT_BURST_PER_USER = int(os.getenv("AUDIT_BURST_PER_USER", "20"))
+
 
 class UserCreate(BaseModel):
     username: str
@@ -75,6 +178,11 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class User(BaseModel):
@@ -83,33 +191,44 @@ class User(BaseModel):
     email: str
 
 
+class UserBatchRequest(BaseModel):
+    ids: List[int]
+
+
 # Database setup
-def get_db():  # pragma: no cover
-    """Get PostgreSQL database connection"""
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise ValueError("DATABASE_URL environment variable is required")
-    conn = psycopg2.connect(database_url, cursor_factory=psycopg2.extras.RealDictCursor)
-    return conn
+LOAD_SHEDDER = LoadShedder(SHED_LOOP_LAG_TARGET, SHED_DB_LATENCY_TARGET, SHED_INTERVAL)
+DATABASE = Database(
+    DB_POOL_MIN_CONN,
+    DB_POOL_MAX_CONN,
+    DB_CONNECT_TIMEOUT,
+    health=DatabaseHealth(READINESS_FAILURE_THRESHOLD, READINESS_ERROR_WINDOW),
+    breaker=CircuitBreaker(DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_RESET_TIMEOUT),
+    replica_urls=[url.strip() for url in DATABASE_READ_URL.split(",") if url.strip()],
+    read_your_writes_window=READ_YOUR_WRITES_WINDOW,
+    replica_max_lag=REPLICA_MAX_LAG,
+    shedder=LOAD_SHEDDER,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+background_tasks: List[asyncio.Task] = []
 
 
 def init_db():  # pragma: no cover
     """Initialize database schema"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
+    with DATABASE.checkout() as (conn, cursor):
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(255) UNIQUE NOT NULL,
+                email VARCHAR(255) UNIQUE NOT NULL,
+                hashed_password TEXT NOT NULL
+            )
         """
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(255) UNIQUE NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            hashed_password TEXT NOT NULL
         )
-    """
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
+        TOKEN_DENYLIST.create_table(cursor)
+        IDEMPOTENCY.create_table(cursor)
+        AUDIT.create_table(cursor)
+        conn.commit()
 
 
 def verify_password(plain_password, hashed_password):
@@ -120,37 +239,307 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+# Token signing keys
+class SigningKeyRing:
+    """RS256 private keys from JWT_KEYS_DIR, published as a JWKS
+
+    Every *.pem key in the directory stays valid for verification and is
+    listed in the JWKS; the last one by file name signs new tokens. To rotate,
+    add a newer key file and remove the old one once the tokens it signed
+    have expired. With no keys configured, tokens are HS256 with SECRET_KEY.
+    """
+
+    def __init__(self, keys_dir: str):
+        self.keys_dir = keys_dir
+        self.signing_kid = None
+        self._private = {}  # kid -> PEM
+        self._public = {}  # kid -> public JWK
+        self.jwks = {"keys": []}
+
+    def load(self):
+        private, public = {}, {}
+        if self.keys_dir:
+            for path in sorted(glob.glob(os.path.join(self.keys_dir, "*.pem"))):
+                kid = os.path.splitext(os.path.basename(path))[0]
+                with open(path) as f:
+                    private[kid] = f.read()
+                public_key = jwk.construct(private[kid], "RS256").public_key()
+                public[kid] = {**public_key.to_dict(), "kid": kid, "use": "sig"}
+        self._private, self._public = private, public
+        self.signing_kid = list(private)[-1] if private else None
+        self.jwks = {"keys": list(public.values())}
+
+    def encode(self, claims: dict) -> str:
+        if self.signing_kid is None:
+            return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+        return jwt.encode(
+            claims,
+            self._private[self.signing_kid],
+            algorithm="RS256",
+            headers={"kid": self.signing_kid},
+        )
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if self.signing_kid is not None and not JWT_ACCEPT_HS256:
+                raise JWTError("HS256 tokens are not accepted")
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if kid not in self._public:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, self._public[kid], algorithms=["RS256"])
+
+
+SIGNING_KEYS = SigningKeyRing(JWT_KEYS_DIR)
+SIGNING_KEYS.load()
+
+
+async def run_signing_key_reloader():  # pragma: no cover
+    while True:
+        await asyncio.sleep(JWT_KEYS_RELOAD_INTERVAL)
+        try:
+            await run_in_threadpool(SIGNING_KEYS.load)
+        except Exception:
+            logger.exception("reloading signing keys failed")
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "type": "access"})
+    encoded_jwt = SIGNING_KEYS.encode(to_encode)
     return encoded_jwt
 
 
+def create_refresh_token(data: dict):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode.update({"exp": expire, "type": "refresh", "jti": uuid.uuid4().hex})
+    return SIGNING_KEYS.encode(to_encode)
+
+
+def issue_tokens(username: str, user_id: int) -> dict:
+    claims = {"sub": username, "user_id": user_id}
+    return {
+        "access_token": create_access_token(claims),
+        "refresh_token": create_refresh_token(claims),
+        "token_type": "bearer",
+    }
+
+
+class TokenDenylist:
+    """Revoked refresh token ids, shared by every replica through Postgres
+
+    Each id is a revoked_tokens row until the token would have expired
+    anyway, so a revocation holds on all pods and across restarts. revoke()
+    inserts with ON CONFLICT DO NOTHING and reports whether this call was
+    the first, so a refresh token is spent exactly once even when two
+    exchanges race on different pods. Ids this pod has seen revoked are also
+    kept in memory (16 raw bytes and an integer expiry) until they expire,
+    so presenting one again costs no query. Expired rows are deleted at most
+    every purge_interval seconds.
+    """
+
+    def __init__(self, database, purge_interval: float = 3600):
+        self.database = database
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._expiry = {}  # jti bytes -> exp
+        self._heap = []  # (exp, jti bytes), soonest expiry first
+        # Sync handlers call revoke() from several threadpool threads
+        self._lock = threading.Lock()
+        TOKEN_DENYLIST_ENTRIES.set_function(lambda: len(self._expiry))
+
+    def create_table(self, cursor):  # pragma: no cover
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                jti UUID PRIMARY KEY,
+                expires_at TIMESTAMPTZ NOT NULL
+            )
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at "
+            "ON revoked_tokens (expires_at)"
+        )
+
+    def revoke(self, jti: str, exp: int) -> bool:
+        """Revoke a token; False if it already was, here or on another pod"""
+        now = time.time()
+        key = bytes.fromhex(jti)
+        with self._lock:
+            self._prune(now)
+            if key in self._expiry:
+                return False
+        with self.database.checkout() as (conn, cursor):
+            try:
+                cursor.execute(
+                    "INSERT INTO revoked_tokens (jti, expires_at) "
+                    "VALUES (%s, to_timestamp(%s)) "
+                    "ON CONFLICT (jti) DO NOTHING RETURNING jti",
+                    (jti, exp),
+                )
+                first = cursor.fetchone() is not None
+                if now >= self._next_purge:
+                    self._next_purge = now + self.purge_interval
+                    cursor.execute(
+                        "DELETE FROM revoked_tokens WHERE expires_at <= now()"
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        with self._lock:
+            if key not in self._expiry:
+                self._expiry[key] = exp
+                heapq.heappush(self._heap, (exp, key))
+        return first
+
+    def _prune(self, now: float):
+        """Forget expired entries; the caller holds _lock"""
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            self._expiry.pop(key, None)
+
+
+TOKEN_DENYLIST_ENTRIES = Gauge(
+    "token_denylist_entries",
+    "Unexpired revoked refresh tokens this pod remembers without a query",
+)
+TOKEN_REFRESHES = Counter("token_refresh_total", "Refresh token exchanges", ["outcome"])
+
+TOKEN_DENYLIST = TokenDenylist(DATABASE, TOKEN_DENYLIST_PURGE_INTERVAL)
+
+
+def decode_refresh_token(token: str) -> dict:
+    try:
+        payload = SIGNING_KEYS.decode(token)
+        if payload.get("type") != "refresh":
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        return payload
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+
+async def spend_refresh_token(payload: dict):
+    """Revoke a decoded refresh token; 401 if it was revoked already"""
+    if not await run_in_threadpool(
+        TOKEN_DENYLIST.revoke, payload["jti"], payload["exp"]
+    ):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+
 async def verify_token(authorization: str = Header(None)):
     """Verify JWT token and return user_id"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-    token = authorization.split(" ")[1]
+    token = bearer_token(authorization)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
+        payload = SIGNING_KEYS.decode(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    return access_token_user_id(payload)
+
+
+# Admission control, deadlines and load shedding
+ADMISSION = AdmissionControl(
+    create_rate_limit_backend(
+        RATE_LIMIT_REDIS_URL, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST
+    ),
+    ConcurrencyLimiter(
+        parse_route_settings(ROUTE_CONCURRENCY_LIMITS),
+        DEFAULT_CONCURRENCY_LIMIT,
+        CONCURRENCY_QUEUE_TIMEOUT,
+    ),
+    LOAD_SHEDDER,
+    identify=lambda request: client_identity(
+        request, SIGNING_KEYS.decode, TRUSTED_PROXY_HOPS
+    ),
+    critical_routes=CRITICAL_ROUTES,
+    listing_routes=LISTING_ROUTES,
+    exempt_paths=ADMISSION_EXEMPT_PATHS,
+    enabled=ADMISSION_CONTROL_ENABLED,
+    shedding_enabled=LOAD_SHEDDING_ENABLED,
+)
+ROUTE_DEADLINE_SETTINGS = parse_route_settings(ROUTE_DEADLINES)
+LOOP_WATCHDOG = LoopWatchdog(BLOCKING_THRESHOLD, LOOP_LAG_SAMPLE_INTERVAL)
+
+add_exception_handlers(app)
+app.add_middleware(ReadYourWritesMiddleware, database=DATABASE)
+app.add_middleware(AdmissionMiddleware, control=ADMISSION)
+app.add_middleware(
+    DeadlineMiddleware,
+    deadlines=ROUTE_DEADLINE_SETTINGS,
+    default_deadline=DEFAULT_DEADLINE,
+)
+# CORS stays outermost so admission rejections and 504s still carry CORS headers
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, specify your frontend domain
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+IDEMPOTENCY = IdempotencyStore(
+    PostgresIdempotencyBackend(DATABASE), IDEMPOTENCY_TTL, IDEMPOTENCY_LOCK_TIMEOUT
+)
+AUDIT = AuditLog(
+    DATABASE,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL,
+    overflow=AUDIT_OVERFLOW,
+    rate=AUDIT_RATE_PER_USER,
+    burst=AUDIT_BURST_PER_USER,
+    enabled=AUDIT_ENABLED,
+)
+CONTINUOUS_PROFILER = ContinuousProfiler(PROFILING_CONTINUOUS_HZ)
+# Sampling is blocking, one session at a time
+PROFILE_LOCK = asyncio.Lock()
 
 
 @app.on_event("startup")
 async def startup_event():  # pragma: no cover
-    try:
-        init_db()
-    except Exception:
-        # In test environment, database might not be available
-        pass
+    if not DATABASE.init_schema(init_db):
+        background_tasks.append(
+            asyncio.create_task(
+                DATABASE.run_schema_init(init_db, SCHEMA_INIT_RETRY_INTERVAL)
+            )
+        )
+    background_tasks.append(
+        asyncio.create_task(DATABASE.run_health_checks(READINESS_CHECK_INTERVAL))
+    )
+    background_tasks.append(
+        asyncio.create_task(
+            monitor_event_loop_lag(
+                LOAD_SHEDDER, LOOP_WATCHDOG, LOOP_LAG_SAMPLE_INTERVAL
+            )
+        )
+    )
+    if AUDIT_ENABLED:
+        background_tasks.append(asyncio.create_task(AUDIT.run()))
+    if BLOCKING_THRESHOLD > 0:
+        LOOP_WATCHDOG.start()
+    if PROFILING_CONTINUOUS_HZ > 0:
+        CONTINUOUS_PROFILER.start()
+    if JWT_KEYS_DIR:
+        background_tasks.append(asyncio.create_task(run_signing_key_reloader()))
+    if DATABASE.router.replica_urls:
+        background_tasks.append(
+            asyncio.create_task(
+                DATABASE.run_replica_lag_checks(REPLICA_LAG_CHECK_INTERVAL)
+            )
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():  # pragma: no cover
+    for task in background_tasks:
+        task.cancel()
+    CONTINUOUS_PROFILER.stop()
+    LOOP_WATCHDOG.stop()
+    await run_in_threadpool(AUDIT.drain)
+    DATABASE.closeall()
 
 
 @app.get("/health")
@@ -159,11 +548,37 @@ async def health_check():
     return {"status": "healthy", "service": "user-service"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe - reports the DB health cached by the background checker"""
+    return DATABASE.readiness("user-service")
+
+
+@app.get("/.well-known/jwks.json")
+async def get_jwks():
+    """Public signing keys; verifiers cache them and check tokens locally"""
+    return JSONResponse(
+        SIGNING_KEYS.jwks,
+        headers={"Cache-Control": f"public, max-age={JWKS_MAX_AGE}"},
+    )
+
+
 @app.post("/register", response_model=User)
-async def register(user: UserCreate):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+async def register(
+    user: UserCreate, idempotency_key: Optional[str] = Header(None, max_length=255)
+):
+    if idempotency_key is None:
+        return await create_user(user)
+    # The password stays out of the fingerprint so it is never stored
+    return await IDEMPOTENCY.run(
+        idempotency_key,
+        request_fingerprint(user.username, user.email),
+        lambda: create_user(user),
+    )
+
+
+async def create_user(user: UserCreate) -> User:
+    with DATABASE.checkout() as (conn, cursor):
         # Check if user exists
         cursor.execute(
             "SELECT id FROM users WHERE username = %s OR email = %s",
@@ -183,18 +598,14 @@ async def register(user: UserCreate):
         )
         user_id = cursor.fetchone()["id"]
         conn.commit()
+        DATABASE.router.record_write(user_id)
 
         return User(id=user_id, username=user.username, email=user.email)
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.post("/login", response_model=Token)
-async def login(user_login: UserLogin):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+async def login(user_login: UserLogin, request: Request):
+    with DATABASE.checkout() as (_, cursor):
         cursor.execute(
             "SELECT id, username, hashed_password FROM users WHERE username = %s",
             (user_login.username,),
@@ -204,88 +615,251 @@ async def login(user_login: UserLogin):
         if not user or not verify_password(
             user_login.password, user["hashed_password"]
         ):
+            AUDIT.record(
+                "login",
+                "failure",
+                client=client_address(request, TRUSTED_PROXY_HOPS),
+                username=user_login.username,
+            )
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        access_token = create_access_token(
-            data={"sub": user["username"], "user_id": user["id"]}
+        AUDIT.record(
+            "login",
+            user_id=user["id"],
+            client=client_address(request, TRUSTED_PROXY_HOPS),
         )
-        return {"access_token": access_token, "token_type": "bearer"}
-    finally:
-        cursor.close()
-        conn.close()
+        return issue_tokens(user["username"], user["id"])
 
 
-@app.get("/verify")
-async def verify_jwt_token(user_id: int = Depends(verify_token)):
-    """Verify JWT token and return user info"""
-    conn = get_db()
-    cursor = conn.cursor()
+@app.post("/token/refresh", response_model=Token)
+async def refresh_tokens(request: RefreshRequest):
+    """Exchange a refresh token for new tokens, with no password check or user
+    lookup; the only query spends the presented token"""
     try:
+        payload = decode_refresh_token(request.refresh_token)
+        # Rotate: the presented refresh token cannot be used a second time
+        await spend_refresh_token(payload)
+    except HTTPException:
+        TOKEN_REFRESHES.labels(outcome="rejected").inc()
+        raise
+    TOKEN_REFRESHES.labels(outcome="issued").inc()
+    return issue_tokens(payload["sub"], payload["user_id"])
+
+
+@app.post("/token/revoke")
+async def revoke_refresh_token(request: RefreshRequest):
+    """Log out: the refresh token stops working; access tokens run out soon"""
+    payload = decode_refresh_token(request.refresh_token)
+    await spend_refresh_token(payload)
+    return {"message": "Token revoked"}
+
+
+def fetch_user(user_id: int):
+    with DATABASE.checkout(read=True, owner=user_id) as (_, cursor):
         cursor.execute(
             "SELECT id, username, email FROM users WHERE id = %s", (user_id,)
         )
-        user = cursor.fetchone()
+        return cursor.fetchone()
 
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
 
-        return {
-            "valid": True,
-            "user": User(id=user["id"], username=user["username"], email=user["email"]),
-        }
-    finally:
-        cursor.close()
-        conn.close()
+# /verify and /users/{user_id} run the same lookup, so they share one group;
+# keying by user_id also coalesces repeated /verify calls for the same token
+USER_FLIGHT = SingleFlight(
+    "get_user", key_func=lambda user_id: user_id, timeout=SINGLE_FLIGHT_TIMEOUT
+)
+
+
+async def load_user(user_id: int):
+    """fetch_user through USER_FLIGHT; while the database circuit is open, a
+    cached row (even an expired one) is served instead"""
+    try:
+        user = await USER_FLIGHT.run(fetch_user, user_id)
+    except DatabaseUnavailable:
+        found, _ = USER_CACHE.get_many([user_id], allow_stale=True)
+        if user_id not in found:
+            raise
+        return found[user_id]
+    if user:
+        USER_CACHE.put_many([user])
+    return user
+
+
+@app.get("/verify")
+async def verify_jwt_token(user_id: int = Depends(verify_token)):
+    """Verify JWT token and return user info"""
+    user = await load_user(user_id)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return {
+        "valid": True,
+        "user": User(id=user["id"], username=user["username"], email=user["email"]),
+    }
 
 
 @app.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: int):
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    user = await load_user(user_id)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return User(id=user["id"], username=user["username"], email=user["email"])
+
+
+class UserCache:
+    """Recently looked up user rows by id, bounded in size and kept for a TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (expires_at, row)
+
+    def get_many(self, ids: List[int], allow_stale: bool = False):
+        """Return ({id: row} for fresh hits, [ids to look up]); allow_stale
+        also counts entries past their TTL as hits"""
+        now = time.monotonic()
+        found, missing = {}, []
+        for user_id in ids:
+            entry = self._entries.get(user_id)
+            if entry is not None and (allow_stale or entry[0] > now):
+                self._entries.move_to_end(user_id)
+                found[user_id] = entry[1]
+            else:
+                missing.append(user_id)
+        USER_CACHE_LOOKUPS.labels(result="hit").inc(len(found))
+        USER_CACHE_LOOKUPS.labels(result="miss").inc(len(missing))
+        return found, missing
+
+    def put_many(self, rows: List[dict]):
+        expires_at = time.monotonic() + self.ttl
+        for row in rows:
+            self._entries[row["id"]] = (expires_at, row)
+            self._entries.move_to_end(row["id"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+USER_CACHE_LOOKUPS = Counter(
+    "user_cache_lookups_total", "Batch user lookups by cache result", ["result"]
+)
+
+USER_CACHE = UserCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL)
+
+
+def fetch_users(user_ids: List[int]) -> List[dict]:
+    with DATABASE.checkout(read=True) as (_, cursor):
         cursor.execute(
-            "SELECT id, username, email FROM users WHERE id = %s", (user_id,)
+            "SELECT id, username, email FROM users WHERE id = ANY(%s)", (user_ids,)
         )
-        user = cursor.fetchone()
+        return cursor.fetchall()
+
 
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+async def lookup_users(user_ids: List[int]) -> List[User]:
+    """Resolve many ids with one query for the cache misses; unknown ids are
+    left out, and results follow the order of first appearance"""
+    unique_ids = list(dict.fromkeys(user_ids))
+    if len(unique_ids) > USER_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=422, detail=f"At most {USER_BATCH_MAX_IDS} ids per request"
+        )
+    found, missing = USER_CACHE.get_many(unique_ids)
+    if missing:
+        try:
+            rows = await run_in_threadpool(fetch_users, missing)
+        except DatabaseUnavailable:
+            # While the circuit is open, answer from expired entries if all
+            # ids are cached; a partial answer would look like unknown ids
+            stale, missing = USER_CACHE.get_many(missing, allow_stale=True)
+            if missing:
+                raise
+            rows = list(stale.values())
+        else:
+            USER_CACHE.put_many(rows)
+        found.update((row["id"], row) for row in rows)
+
+    return [
+        User(id=user["id"], username=user["username"], email=user["email"])
+        for user in (found[user_id] for user_id in unique_ids if user_id in found)
+    ]
+
+
+@app.get("/users", response_model=List[User])
+async def get_users(ids: str = Query(..., description="Comma-separated user ids")):
+    try:
+        user_ids = [int(user_id) for user_id in ids.split(",") if user_id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail="ids must be comma-separated integers"
+        )
+    return await lookup_users(user_ids)
 
-        return User(id=user["id"], username=user["username"], email=user["email"])
-    finally:
-        cursor.close()
-        conn.close()
 
+@app.post("/users/batch", response_model=List[User])
+async def get_users_batch(request: UserBatchRequest):
+    return await lookup_users(request.ids)
 
-@app.get("/admin/users", response_model=List[User])
-async def get_all_users(current_user_id: int = Depends(verify_token)):
-    """Admin endpoint to get all users (requires authentication)"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+
+def fetch_all_users() -> list:
+    # Runs in the threadpool so the deadline middleware can see a disconnect
+    # and cancel this (unbounded) query while it runs
+    with DATABASE.checkout(read=True) as (_, cursor):
         cursor.execute("SELECT id, username, email FROM users ORDER BY id")
-        users = cursor.fetchall()
+        return cursor.fetchall()
+
 
-        return [
-            User(id=user["id"], username=user["username"], email=user["email"])
-            for user in users
-        ]
-    finally:
-        cursor.close()
-        conn.close()
+@app.get("/admin/users", response_model=List[User])
+async def get_all_users(request: Request, current_user_id: int = Depends(verify_token)):
+    """Admin endpoint to get all users (requires authentication)"""
+    users = await run_in_threadpool(fetch_all_users)
+    AUDIT.record(
+        "admin.list_users",
+        user_id=current_user_id,
+        client=client_address(request, TRUSTED_PROXY_HOPS),
+        count=len(users),
+    )
+    return [
+        User(id=user["id"], username=user["username"], email=user["email"])
+        for user in users
+    ]
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILING_MAX_SECONDS),
+    hz: float = Query(100, gt=0, le=1000),
+    idle: bool = False,
+    current_user_id: int = Depends(verify_token),
+):
+    """Sample all threads for `seconds` and return folded stacks (opt-in)
+
+    Render with e.g. `flamegraph.pl profile.folded > profile.svg`, or load
+    into speedscope. idle=true keeps threads parked in select()/waits.
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if PROFILE_LOCK.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with PROFILE_LOCK:
+        return await run_in_threadpool(profile_stacks, seconds, hz, idle)
 
 
 @app.post("/admin/create-admin")
-async def create_admin(current_user_id: int = Depends(verify_token)):
+async def create_admin(request: Request, current_user_id: int = Depends(verify_token)):
     """Create default admin user (requires authentication)"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    with DATABASE.checkout() as (conn, cursor):
         # Check if admin already exists
         cursor.execute("SELECT id FROM users WHERE username = %s", ("admin",))
         existing = cursor.fetchone()
 
         if existing:
+            AUDIT.record(
+                "admin.create_admin",
+                "noop",
+                user_id=current_user_id,
+                client=client_address(request, TRUSTED_PROXY_HOPS),
+            )
             return {"message": "Admin user already exists", "username": "admin"}
 
         # Create admin user with password from environment variable
@@ -298,6 +872,13 @@ async def create_admin(current_user_id: int = Depends(verify_token)):
         )
         user_id = cursor.fetchone()["id"]
         conn.commit()
+        DATABASE.router.record_write(user_id)
+        AUDIT.record(
+            "admin.create_admin",
+            user_id=current_user_id,
+            client=client_address(request, TRUSTED_PROXY_HOPS),
+            admin_id=user_id,
+        )
 
         return {
             "message": "Admin user created",
@@ -305,9 +886,6 @@ async def create_admin(current_user_id: int = Depends(verify_token)):
             "password": default_password,  # Return for initial setup only
             "id": user_id,
         }
-    finally:
-        cursor.close()
-        conn.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,16 +1,48 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
 
 import pytest
 from app import (
+    ADMISSION,
     ALGORITHM,
+    DATABASE,
+    ROUTE_DEADLINE_SETTINGS,
     SECRET_KEY,
+    SigningKeyRing,
+    TokenDenylist,
+    UserCache,
     app,
     create_access_token,
+    create_refresh_token,
+    fetch_user,
     get_password_hash,
     verify_password,
 )
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi.testclient import TestClient
 from jose import jwt
+from prometheus_client import REGISTRY
+from psycopg2.errors import QueryCanceled
+
+from service_core import (
+    REQUEST_CONNECTIONS,
+    REQUEST_DEADLINE,
+    AuditLog,
+    CircuitBreaker,
+    DatabaseHealth,
+    DatabasePool,
+    IdempotencyStore,
+    InMemoryIdempotencyBackend,
+    InMemoryRateLimitBackend,
+    LoadShedder,
+    PoolExhausted,
+    ReadRouter,
+    SingleFlight,
+)
 
 
 @pytest.fixture
@@ -44,15 +76,74 @@ def mock_db():
     return MockDB()
 
 
+@pytest.fixture(autouse=True)
+def rate_limiter():
+    """Fresh rate limit state for each test"""
+    limiter = InMemoryRateLimitBackend(rate=20, burst=40)
+    with patch.object(ADMISSION, "rate_limiter", limiter):
+        yield limiter
+
+
+@pytest.fixture(autouse=True)
+def user_cache():
+    """Empty user cache for each test"""
+    cache = UserCache(max_entries=100, ttl=60)
+    with patch("app.USER_CACHE", cache):
+        yield cache
+
+
+@pytest.fixture(autouse=True)
+def audit_log():
+    """Empty audit queue for each test; nothing is flushed"""
+    audit = AuditLog(DATABASE, max_queue=100, batch_size=10, flush_interval=1)
+    with patch("app.AUDIT", audit):
+        yield audit
+
+
+@pytest.fixture
+def db_health():
+    """Fresh cached readiness state for each test"""
+    health = DatabaseHealth(failure_threshold=3, error_window=60)
+    with patch.object(DATABASE, "health", health):
+        yield health
+
+
 class TestHealthCheck:
     def test_health_endpoint(self, client):
         response = client.get("/health")
         assert response.status_code == 200
         assert response.json() == {"status": "healthy", "service": "user-service"}
 
+    def test_ready_endpoint_success(self, client, mock_db, db_health):
+        with patch.object(
+            DATABASE, "connect", return_value=mock_db.conn
+        ) as mock_get_db:
+            DATABASE.check()
+
+            response = client.get("/ready")
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "ready"
+            assert data["service"] == "user-service"
+            # The probe itself is served from the cached state
+            assert mock_get_db.call_count == 1
+
+    def test_ready_endpoint_db_failure(self, client, db_health):
+        with patch.object(
+            DATABASE, "connect", side_effect=Exception("Database connection failed")
+        ):
+            for _ in range(db_health.failure_threshold):
+                DATABASE.check()
+
+            response = client.get("/ready")
+            assert response.status_code == 503
+            data = response.json()
+            assert data["detail"]["status"] == "not_ready"
+            assert "Database connection failed" in data["detail"]["error"]
+
 
 class TestUserRegistration:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_register_new_user_success(self, mock_get_db, client, mock_db):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -75,7 +166,7 @@ class TestUserRegistration:
         assert data["email"] == "test@example.com"
         assert data["id"] == 1
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_register_existing_user_fails(self, mock_get_db, client, mock_db):
         # Setup mock - user already exists
         mock_get_db.return_value = mock_db.conn
@@ -92,9 +183,42 @@ class TestUserRegistration:
         assert response.status_code == 409
         assert "User already exists" in response.json()["detail"]
 
+    @patch.object(DATABASE, "connect")
+    def test_register_retry_replays_without_hashing_again(
+        self, mock_get_db, client, mock_db
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.side_effect = [None, {"id": 1}]
+        user_data = {
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123",
+        }
+        headers = {"Idempotency-Key": "signup-1"}
+
+        with patch(
+            "app.IDEMPOTENCY", IdempotencyStore(InMemoryIdempotencyBackend(), ttl=60)
+        ), patch("app.get_password_hash", return_value="hashed") as hash_password:
+            first = client.post("/register", json=user_data, headers=headers)
+            retry = client.post("/register", json=user_data, headers=headers)
+
+        assert retry.status_code == 200
+        assert (
+            retry.json()
+            == first.json()
+            == {
+                "id": 1,
+                "username": "testuser",
+                "email": "test@example.com",
+            }
+        )
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        hash_password.assert_called_once()
+        assert mock_get_db.call_count == 1
+
 
 class TestUserLogin:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_login_success(self, mock_get_db, client, mock_db):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -114,8 +238,11 @@ class TestUserLogin:
         data = response.json()
         assert "access_token" in data
         assert data["token_type"] == "bearer"
+        refresh = jwt.decode(data["refresh_token"], SECRET_KEY, algorithms=[ALGORITHM])
+        assert refresh["type"] == "refresh"
+        assert refresh["user_id"] == 1
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_login_invalid_credentials(self, mock_get_db, client, mock_db):
         # Setup mock - user doesn't exist
         mock_get_db.return_value = mock_db.conn
@@ -128,7 +255,7 @@ class TestUserLogin:
         assert response.status_code == 401
         assert "Invalid credentials" in response.json()["detail"]
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_login_wrong_password(self, mock_get_db, client, mock_db):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -147,9 +274,283 @@ class TestUserLogin:
         assert response.status_code == 401
         assert "Invalid credentials" in response.json()["detail"]
 
+    @patch.object(DATABASE, "connect")
+    def test_login_rate_limited_per_client_ip(self, mock_get_db, client, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        login_data = {"username": "nonexistent", "password": "wrongpass"}
+
+        with patch.object(
+            ADMISSION, "rate_limiter", InMemoryRateLimitBackend(rate=0.5, burst=2)
+        ), patch("app.TRUSTED_PROXY_HOPS", 1):
+            statuses = [
+                client.post("/login", json=login_data).status_code for _ in range(3)
+            ]
+            other_client = client.post(
+                "/login", json=login_data, headers={"X-Forwarded-For": "10.0.0.9"}
+            )
+
+        assert statuses == [401, 401, 429]
+        assert other_client.status_code == 401
+
+    @pytest.mark.parametrize("trusted_proxies", [0, 1])
+    @patch.object(DATABASE, "connect")
+    def test_spoofed_forwarded_for_does_not_reset_the_limit(
+        self, mock_get_db, client, mock_db, trusted_proxies
+    ):
+        mock_get_db.return_value = mock_db.conn
+        login_data = {"username": "nonexistent", "password": "wrongpass"}
+
+        with patch.object(
+            ADMISSION, "rate_limiter", InMemoryRateLimitBackend(rate=0.5, burst=2)
+        ), patch("app.TRUSTED_PROXY_HOPS", trusted_proxies):
+            statuses = [
+                client.post(
+                    "/login",
+                    json=login_data,
+                    # The proxy appends 10.0.0.1; the hop before it is forged
+                    headers={"X-Forwarded-For": f"203.0.113.{n}, 10.0.0.1"},
+                ).status_code
+                for n in range(3)
+            ]
+
+        assert statuses == [401, 401, 429]
+
+    @patch.object(DATABASE, "connect")
+    def test_login_records_audit_events(self, mock_get_db, client, mock_db, audit_log):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {
+            "id": 7,
+            "username": "testuser",
+            "hashed_password": get_password_hash("testpass123"),
+        }
+
+        client.post("/login", json={"username": "testuser", "password": "wrong"})
+        with patch("app.TRUSTED_PROXY_HOPS", 1):
+            client.post(
+                "/login",
+                json={"username": "testuser", "password": "testpass123"},
+                headers={"X-Forwarded-For": "203.0.113.7, 10.0.0.9"},
+            )
+
+        failure, success = audit_log._queue
+        assert failure[1:5] == ("login", "failure", None, "testclient")
+        assert failure[5] == {"username": "testuser"}
+        assert success[1:5] == ("login", "success", 7, "10.0.0.9")
+        # The events wait for the flusher, not for this request
+        mock_db.cursor.execute.assert_called_with(
+            "SELECT id, username, hashed_password FROM users WHERE username = %s",
+            ("testuser",),
+        )
+
+
+class RevokedTokensTable:
+    """In-memory revoked_tokens behind DATABASE.connect; every TokenDenylist
+    patched onto it shares the rows, as replicas share the real table"""
+
+    def __init__(self):
+        self.rows = {}  # jti -> exp
+        self.queries = []
+
+    def connect(self):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        result = []
+
+        def execute(query, params=()):
+            self.queries.append(query)
+            result.clear()
+            if query.startswith("INSERT INTO revoked_tokens"):
+                jti, exp = params
+                if jti not in self.rows:
+                    self.rows[jti] = exp
+                    result.append({"jti": jti})
+            elif query.startswith("DELETE FROM revoked_tokens"):
+                for jti, exp in list(self.rows.items()):
+                    if exp <= time.time():
+                        del self.rows[jti]
+
+        cursor.execute.side_effect = execute
+        cursor.fetchone.side_effect = lambda: result[0] if result else None
+        return conn
+
+
+@pytest.fixture
+def revoked_tokens():
+    table = RevokedTokensTable()
+    with patch.object(DATABASE, "connect", table.connect):
+        yield table
+
+
+@pytest.fixture
+def denylist(revoked_tokens):
+    denylist = TokenDenylist(DATABASE)
+    with patch("app.TOKEN_DENYLIST", denylist):
+        yield denylist
+
+
+class TestRefreshTokens:
+    claims = {"sub": "testuser", "user_id": 1}
+
+    @patch("app.verify_password")
+    def test_refresh_issues_tokens_without_password_or_user_lookup(
+        self, mock_verify_password, client, denylist, revoked_tokens
+    ):
+        refresh_token = create_refresh_token(self.claims)
+
+        response = client.post("/token/refresh", json={"refresh_token": refresh_token})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["refresh_token"] != refresh_token
+        access = jwt.decode(data["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+        assert access["type"] == "access" and access["user_id"] == 1
+        mock_verify_password.assert_not_called()
+        assert all("revoked_tokens" in query for query in revoked_tokens.queries)
+
+    def test_refresh_token_is_single_use(self, client, denylist):
+        body = {"refresh_token": create_refresh_token(self.claims)}
+
+        assert client.post("/token/refresh", json=body).status_code == 200
+        assert client.post("/token/refresh", json=body).status_code == 401
+
+    def test_revoked_token_cannot_refresh(self, client, denylist):
+        body = {"refresh_token": create_refresh_token(self.claims)}
+
+        assert client.post("/token/revoke", json=body).status_code == 200
+        assert client.post("/token/refresh", json=body).status_code == 401
+
+    def test_token_types_are_not_interchangeable(self, client, denylist):
+        access_token = create_access_token(self.claims)
+        refresh_token = create_refresh_token(self.claims)
+
+        response = client.post("/token/refresh", json={"refresh_token": access_token})
+        assert response.status_code == 401
+        response = client.get(
+            "/verify", headers={"Authorization": f"Bearer {refresh_token}"}
+        )
+        assert response.status_code == 401
+
+    def test_revocation_holds_on_every_replica(self, client, revoked_tokens):
+        body = {"refresh_token": create_refresh_token(self.claims)}
+        pod_a, pod_b = TokenDenylist(DATABASE), TokenDenylist(DATABASE)
+
+        with patch("app.TOKEN_DENYLIST", pod_a):
+            assert client.post("/token/refresh", json=body).status_code == 200
+        with patch("app.TOKEN_DENYLIST", pod_b):
+            assert client.post("/token/refresh", json=body).status_code == 401
+            assert client.post("/token/revoke", json=body).status_code == 401
+
+    def test_denylist_drops_expired_entries(self, revoked_tokens):
+        denylist = TokenDenylist(DATABASE, purge_interval=0)
+
+        assert denylist.revoke("aa" * 16, int(time.time()) - 1)
+        assert denylist.revoke("bb" * 16, int(time.time()) + 60)
+        assert not denylist.revoke("bb" * 16, int(time.time()) + 60)
+
+        assert list(denylist._expiry) == [bytes.fromhex("bb" * 16)]
+        assert list(revoked_tokens.rows) == ["bb" * 16]
+
+    def test_concurrent_revokes_of_one_token(self, revoked_tokens):
+        denylist = TokenDenylist(DATABASE)
+        both_inserting = threading.Barrier(2, timeout=1)
+        table_lock = threading.Lock()
+
+        def connect():
+            conn = revoked_tokens.connect()
+            execute = conn.cursor.return_value.execute.side_effect
+
+            def wait_then_execute(query, params=()):
+                if query.startswith("INSERT"):
+                    both_inserting.wait()
+                with table_lock:
+                    execute(query, params)
+
+            conn.cursor.return_value.execute.side_effect = wait_then_execute
+            return conn
+
+        exp = int(time.time()) + 60
+        with patch.object(DATABASE, "connect", connect):
+            with ThreadPoolExecutor(2) as pool:
+                results = list(pool.map(denylist.revoke, ["cc" * 16] * 2, [exp] * 2))
+
+        assert sorted(results) == [False, True]
+        assert len(denylist._heap) == 1
+        denylist._prune(exp + 1)
+        assert denylist._expiry == {}
+
+
+def write_rsa_key(path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+
+
+class TestSigningKeys:
+    def test_newest_key_signs_and_all_keys_are_published(self, client, tmp_path):
+        write_rsa_key(tmp_path / "2024-01.pem")
+        write_rsa_key(tmp_path / "2024-02.pem")
+        keys = SigningKeyRing(str(tmp_path))
+        keys.load()
+
+        token = keys.encode({"user_id": 1, "type": "access"})
+
+        assert jwt.get_unverified_header(token) == {
+            "alg": "RS256",
+            "kid": "2024-02",
+            "typ": "JWT",
+        }
+        with patch("app.SIGNING_KEYS", keys):
+            response = client.get("/.well-known/jwks.json")
+        assert [key["kid"] for key in response.json()["keys"]] == [
+            "2024-01",
+            "2024-02",
+        ]
+        assert all("d" not in key for key in response.json()["keys"])
+        assert "max-age" in response.headers["Cache-Control"]
+
+    def test_tokens_from_a_retired_signing_key_still_verify(self, client, tmp_path):
+        write_rsa_key(tmp_path / "2024-01.pem")
+        keys = SigningKeyRing(str(tmp_path))
+        keys.load()
+        old_token = keys.encode({"user_id": 1, "type": "access"})
+        write_rsa_key(tmp_path / "2024-02.pem")
+        keys.load()
+
+        assert keys.decode(old_token)["user_id"] == 1
+
+    def test_without_keys_tokens_are_hs256(self):
+        keys = SigningKeyRing("")
+        keys.load()
+
+        token = keys.encode({"user_id": 1})
+
+        assert jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["user_id"] == 1
+        assert keys.jwks == {"keys": []}
+
+
+class TestLoadShedding:
+    @patch.object(DATABASE, "connect")
+    def test_overload_sheds_reads_but_not_login(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        shedder = LoadShedder(lag_target=0.05, db_target=0.1, interval=0)
+        shedder.record_lag(0.5)
+
+        with patch.object(ADMISSION, "shedder", shedder):
+            assert client.get("/admin/users", headers=auth_headers).status_code == 503
+            assert client.get("/users/1").status_code == 503
+            login_data = {"username": "nonexistent", "password": "wrongpass"}
+            assert client.post("/login", json=login_data).status_code == 401
+
 
 class TestGetUser:
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_get_user_success(self, mock_get_db, client, mock_db):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
@@ -164,7 +565,7 @@ class TestGetUser:
         assert data["username"] == "testuser"
         assert data["email"] == "test@example.com"
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_get_user_not_found(self, mock_get_db, client, mock_db):
         # Setup mock - user not found
         mock_get_db.return_value = mock_db.conn
@@ -176,9 +577,182 @@ class TestGetUser:
         assert "User not found" in response.json()["detail"]
 
 
+class TestBatchUserLookup:
+    users = [
+        {"id": 1, "username": "alice", "email": "alice@example.com"},
+        {"id": 3, "username": "carol", "email": "carol@example.com"},
+    ]
+
+    @patch.object(DATABASE, "connect")
+    def test_batch_resolves_unique_ids_with_one_query(
+        self, mock_get_db, client, mock_db
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = self.users
+
+        response = client.get("/users?ids=3,1,3,2")
+
+        assert response.status_code == 200
+        assert [user["id"] for user in response.json()] == [3, 1]
+        query, params = mock_db.cursor.execute.call_args.args
+        assert "WHERE id = ANY(%s)" in query
+        assert params == ([3, 1, 2],)
+
+    @patch.object(DATABASE, "connect")
+    def test_cached_users_skip_the_database(self, mock_get_db, client, mock_db):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchall.return_value = self.users
+
+        client.post("/users/batch", json={"ids": [1, 3]})
+        response = client.post("/users/batch", json={"ids": [3, 1]})
+
+        assert [user["username"] for user in response.json()] == ["carol", "alice"]
+        assert mock_get_db.call_count == 1
+
+    def test_invalid_or_too_many_ids_are_rejected(self, client):
+        assert client.get("/users?ids=1,abc").status_code == 422
+        with patch("app.USER_BATCH_MAX_IDS", 2):
+            response = client.post("/users/batch", json={"ids": [1, 2, 3]})
+        assert response.status_code == 422
+
+
+class TestDatabaseCircuitBreaker:
+    @pytest.fixture
+    def open_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        with patch.object(DATABASE, "breaker", breaker), patch.object(
+            DATABASE, "connect", side_effect=breaker.before_call
+        ):
+            yield breaker
+
+    def test_open_circuit_returns_503(self, client, open_circuit):
+        response = client.get("/users/1")
+
+        assert response.status_code == 503
+        assert response.json() == {"detail": "Database unavailable"}
+        assert "Retry-After" in response.headers
+
+    def test_open_circuit_serves_expired_cached_users(
+        self, client, user_cache, open_circuit
+    ):
+        user_cache.ttl = 0
+        user_cache.put_many([{"id": 1, "username": "a", "email": "a@example.com"}])
+
+        single = client.get("/users/1")
+        batch = client.get("/users?ids=1")
+        partial = client.get("/users?ids=1,2")
+
+        assert single.json()["username"] == "a"
+        assert [user["id"] for user in batch.json()] == [1]
+        assert partial.status_code == 503
+
+    def test_open_circuit_makes_pod_not_ready(self, client, open_circuit):
+        response = client.get("/ready")
+
+        assert response.status_code == 503
+        assert response.json()["detail"]["circuit"] == "open"
+
+
+class TestConnectionPool:
+    @patch("psycopg2.connect", return_value=MagicMock())
+    def test_exhausted_pool_returns_503(self, _, client):
+        pool = DatabasePool(0, 1, "postgresql://test", timeout=0.05)
+        held = pool.getconn()
+        timeouts = REGISTRY.get_sample_value("db_pool_checkout_timeouts_total")
+
+        with patch.object(DATABASE, "pool", pool):
+            response = client.get("/users/1")
+
+        assert response.status_code == 503
+        assert response.json() == {"detail": "Database connection pool exhausted"}
+        assert response.headers["Retry-After"] == "1"
+        assert REGISTRY.get_sample_value(
+            "db_pool_checkout_timeouts_total"
+        ) == pytest.approx(timeouts + 1)
+        pool.putconn(held)
+        assert pool.in_use == 0
+
+    @patch("psycopg2.connect", return_value=MagicMock())
+    def test_waits_for_a_connection_to_come_back(self, _):
+        pool = DatabasePool(0, 1, "postgresql://test", timeout=2)
+        held = pool.getconn()
+        threading.Timer(0.05, pool.putconn, (held,)).start()
+
+        assert pool.getconn() is not None
+        assert pool.in_use == 1
+
+    @pytest.mark.asyncio
+    @patch("psycopg2.connect", return_value=MagicMock())
+    async def test_exhausted_pool_fails_fast_on_the_event_loop(self, _):
+        pool = DatabasePool(0, 1, "postgresql://test", timeout=2)
+        pool.getconn()
+        start = time.monotonic()
+
+        with pytest.raises(PoolExhausted):
+            pool.getconn()
+
+        assert time.monotonic() - start < 0.5
+
+
+class TestUserLookupCoalescing:
+    @pytest.mark.asyncio
+    async def test_concurrent_lookups_share_one_query(self, mock_db):
+        user_row = {"id": 1, "username": "testuser", "email": "test@example.com"}
+
+        def slow_fetchone():
+            time.sleep(0.05)
+            return user_row
+
+        mock_db.cursor.fetchone.side_effect = slow_fetchone
+        flight = SingleFlight("test_users", key_func=lambda uid: uid, timeout=5)
+
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn):
+            results = await asyncio.gather(
+                *(flight.run(fetch_user, 1) for _ in range(4))
+            )
+
+        assert mock_db.cursor.execute.call_count == 1
+        assert all(result is user_row for result in results)
+        assert flight.followers == 3
+
+
+class TestReadReplicaRouting:
+    @patch.object(DATABASE, "connect")
+    def test_user_reads_go_to_replica_until_written(self, mock_get_db, client, mock_db):
+        replica = MockDB()
+        replica.cursor.fetchone.return_value = {
+            "id": 7,
+            "username": "replicated",
+            "email": "r@example.com",
+        }
+        replica_pool = MagicMock()
+        replica_pool.getconn.return_value = replica.conn
+        router = ReadRouter(
+            ["postgresql://replica/userdb"],
+            read_your_writes_window=5,
+            max_lag=10,
+            pool_factory=lambda url: replica_pool,
+        )
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.fetchone.return_value = {
+            "id": 7,
+            "username": "primary",
+            "email": "p@example.com",
+        }
+
+        with patch.object(DATABASE, "router", router):
+            assert client.get("/users/7").json()["username"] == "replicated"
+            replica_pool.putconn.assert_called_once_with(replica.conn)
+            router.record_write(7)
+            assert client.get("/users/7").json()["username"] == "primary"
+
+
 class TestAdminEndpoints:
-    @patch("app.get_db")
-    def test_create_admin_success(self, mock_get_db, client, mock_db, auth_headers):
+    @patch.object(DATABASE, "connect")
+    def test_create_admin_success(
+        self, mock_get_db, client, mock_db, auth_headers, audit_log
+    ):
         # Setup mock - admin doesn't exist
         mock_get_db.return_value = mock_db.conn
         mock_db.cursor.fetchone.side_effect = [
@@ -192,8 +766,11 @@ class TestAdminEndpoints:
         data = response.json()
         assert data["username"] == "admin"
         assert data["password"] == "admin123"
+        (event,) = audit_log._queue
+        assert event[1:4] == ("admin.create_admin", "success", 1)
+        assert event[5] == {"admin_id": 1}
 
-    @patch("app.get_db")
+    @patch.object(DATABASE, "connect")
     def test_create_admin_already_exists(
         self, mock_get_db, client, mock_db, auth_headers
     ):
@@ -207,8 +784,8 @@ class TestAdminEndpoints:
         data = response.json()
         assert "Admin user already exists" in data["message"]
 
-    @patch("app.get_db")
-    def test_get_all_users(self, mock_get_db, client, mock_db, auth_headers):
+    @patch.object(DATABASE, "connect")
+    def test_get_all_users(self, mock_get_db, client, mock_db, auth_headers, audit_log):
         # Setup mock
         mock_get_db.return_value = mock_db.conn
         mock_users = [
@@ -224,6 +801,133 @@ class TestAdminEndpoints:
         assert len(data) == 2
         assert data[0]["username"] == "user1"
         assert data[1]["username"] == "user2"
+        (event,) = audit_log._queue
+        assert event[1:5] == ("admin.list_users", "success", 1, "testclient")
+        assert event[5] == {"count": 2}
+
+
+class TestAuditLog:
+    def test_flush_writes_one_batch(self, mock_db):
+        audit = AuditLog(DATABASE, max_queue=100, batch_size=2, flush_interval=1)
+        for user_id in (1, 2, 3):
+            assert audit.record("login", user_id=user_id, client="10.0.0.1")
+
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn), patch(
+            "psycopg2.extras.execute_values"
+        ) as execute_values:
+            assert audit.flush_once() == 2
+            assert audit.flush_once() == 1
+            assert audit.flush_once() == 0
+
+        first_batch = execute_values.call_args_list[0].args[2]
+        assert [row[3] for row in first_batch] == [1, 2]
+        assert first_batch[0][5] == "{}"
+        assert mock_db.conn.commit.call_count == 2
+
+    def test_failed_flush_requeues_the_batch(self, mock_db):
+        audit = AuditLog(DATABASE, max_queue=100, batch_size=10, flush_interval=1)
+        audit.record("login", user_id=1)
+        audit.record("login", user_id=2)
+
+        with patch.object(DATABASE, "connect", return_value=mock_db.conn), patch(
+            "psycopg2.extras.execute_values", side_effect=QueryCanceled()
+        ):
+            with pytest.raises(QueryCanceled):
+                audit.flush_once()
+        audit.record("login", user_id=3)
+
+        mock_db.conn.rollback.assert_called_once()
+        assert [event[3] for event in audit._queue] == [1, 2, 3]
+
+    @pytest.mark.parametrize(
+        "overflow, kept", [("drop_oldest", [2, 3]), ("drop_newest", [1, 2])]
+    )
+    def test_overflow_policy(self, overflow, kept):
+        audit = AuditLog(
+            DATABASE, max_queue=2, batch_size=10, flush_interval=1, overflow=overflow
+        )
+
+        accepted = [audit.record("login", user_id=user_id) for user_id in (1, 2, 3)]
+
+        assert accepted == [True, True, overflow == "drop_oldest"]
+        assert [event[3] for event in audit._queue] == kept
+
+    def test_rate_limits_each_user(self):
+        audit = AuditLog(
+            DATABASE, max_queue=100, batch_size=10, flush_interval=1, rate=1, burst=2
+        )
+
+        accepted = [audit.record("login", "failure", client="10.0.0.1") for _ in "abc"]
+        other = audit.record("login", "failure", client="10.0.0.2")
+
+        assert accepted == [True, True, False]
+        assert other
+        assert len(audit._queue) == 3
+
+    def test_unknown_overflow_policy(self):
+        with pytest.raises(ValueError):
+            AuditLog(DATABASE, 10, 10, 1, overflow="block")
+
+
+class TestRequestDeadlines:
+    def test_statement_timeout_is_the_remaining_budget(self, mock_db):
+        connections = set()
+        deadline = REQUEST_DEADLINE.set(time.monotonic() + 2)
+        tracked = REQUEST_CONNECTIONS.set(connections)
+        try:
+            DATABASE.bind_to_request(mock_db.conn)
+        finally:
+            REQUEST_DEADLINE.reset(deadline)
+            REQUEST_CONNECTIONS.reset(tracked)
+
+        assert connections == {mock_db.conn}
+        query, (milliseconds,) = mock_db.cursor.execute.call_args[0]
+        assert query == "SET LOCAL statement_timeout = %s"
+        assert 1900 < milliseconds <= 2000
+
+    @patch.object(DATABASE, "connect")
+    def test_statement_timeout_returns_504(
+        self, mock_get_db, client, mock_db, auth_headers
+    ):
+        mock_get_db.return_value = mock_db.conn
+        mock_db.cursor.execute.side_effect = QueryCanceled()
+
+        response = client.get("/admin/users", headers=auth_headers)
+
+        assert response.status_code == 504
+        assert response.json() == {"detail": "Request deadline exceeded"}
+
+    def test_deadline_returns_504_and_cancels_the_query(self, client, auth_headers):
+        conn = MagicMock()
+
+        def slow_query():
+            REQUEST_CONNECTIONS.get().add(conn)
+            time.sleep(0.3)
+            return []
+
+        with patch("app.fetch_all_users", slow_query), patch.dict(
+            ROUTE_DEADLINE_SETTINGS, {"/admin/users": 0.05}
+        ):
+            response = client.get("/admin/users", headers=auth_headers)
+
+        assert response.status_code == 504
+        conn.cancel.assert_called_once()
+
+
+class TestProfiling:
+    def test_profile_endpoint_is_opt_in(self, client, auth_headers):
+        assert client.get("/admin/profile", headers=auth_headers).status_code == 404
+
+        with patch("app.PROFILING_ENABLED", True):
+            response = client.get(
+                "/admin/profile?seconds=0.05&hz=100&idle=true", headers=auth_headers
+            )
+
+        assert response.status_code == 200
+        assert response.text.startswith("thread ")
+        assert all(
+            line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines()
+        )
 
 
 class TestPasswordUtilities: